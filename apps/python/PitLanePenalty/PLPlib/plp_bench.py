@@ -0,0 +1,273 @@
+"""
+Benchmarks for the per-frame cost of PitLanePenalty's acUpdate.
+
+Each scenario is a synthetic recording replayed headless with plp_replay. The mean and median time per frame
+(ns/frame) are reported for each scenario, and from a separate run traced with tracemalloc (which isn't timed), the
+memory acUpdate allocates per frame (the most it has allocated at once in a frame, temporary objects too, in bytes)
+and the number of memory blocks it leaves allocated per frame. Results can be saved as a baseline, and a later run
+fails (exit status 1) if any scenario is slower, or allocates more per frame, than the baseline by more than the
+tolerance, or is slower than --max-ns. A run also fails if a scenario's check finds PLP doing something it shouldn't
+(e.g. warning for a cut that doesn't count).
+
+Usage::
+
+    python PLPlib/plp_bench.py [--repeat N] [--baseline FILE [--save-baseline]] [--tolerance 0.25] [--max-ns NS]
+                               [scenario ...]
+"""
+import argparse
+import collections
+import json
+import math
+import os
+import sys
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+import PLPlib.plp_replay
+
+# 144 frames per second.
+FRAME_TIME = 1.0 / 144
+RACE_SECONDS = 3600.0
+# Where the car starts in the pit box.
+PIT_BOX = (10.0, 0.0, 5.0)
+
+# Settings used for every scenario, so results don't depend on which config file applies today.
+BENCH_SETTINGS = {
+    'ENABLE_PENALTIES': True,
+    'ENABLE_SPEEDING_PENALTIES': True,
+    'PENALTY_MODE_CUTTING': 1,
+    'PENALTY_MODE_SPEEDING': 1,
+    'TOTAL_WARNINGS': 3,
+    'AMNESTY_LAPS': 0,
+    'USE_START_LIGHTS': False,
+    'TEAM': 0,
+}
+
+_FRAME_DEFAULTS = {
+    'deltaT': FRAME_TIME,
+    'speed': 0.0,
+    'worldX': PIT_BOX[0],
+    'worldY': PIT_BOX[1],
+    'worldZ': PIT_BOX[2],
+    'tyresOut': 0,
+    'dirtFL': 0.0,
+    'dirtFR': 0.0,
+    'dirtRL': 0.0,
+    'dirtRR': 0.0,
+    'isInPitLane': 0,
+    'isInPit': 0,
+    'session': 2,
+    'completedLaps': 0,
+    'sessionTimeLeft': RACE_SECONDS * 1000,
+    'lapTime': 0,
+    'fuel': 50.0,
+    'normalizedCarPosition': 0.0,
+}
+
+
+# A frame index seconds into a race, with the given channels set.
+def _frame(index, **channels):
+    values = dict(_FRAME_DEFAULTS)
+    values['sessionTimeLeft'] = (RACE_SECONDS - index * FRAME_TIME) * 1000
+    values['lapTime'] = int(index * FRAME_TIME * 1000)
+    values.update(channels)
+    return PLPlib.plp_replay.ReplayFrame(**values)
+
+
+# Driving on track at index, on a 90 second lap.
+def _driving(index, **channels):
+    values = {
+        'speed': 160 + 60 * math.sin(index / 300.0),
+        'worldX': PIT_BOX[0] + index * 0.3,
+        'completedLaps': int(index * FRAME_TIME / 90),
+        'normalizedCarPosition': index * FRAME_TIME / 90 % 1,
+    }
+    values.update(channels)
+    return _frame(index, **values)
+
+
+def cleanLap(frames):
+    return [_driving(i) for i in range(frames)]
+
+
+# Four wheels off for 0.3s every 12 seconds.
+def repeatedCuts(frames):
+    return [_driving(i, tyresOut=4) if i % 1728 < 43 else _driving(i) for i in range(frames)]
+
+
+# Every 2 laps, drive down pit lane, stop in the pit box for 10 seconds to add fuel, and drive out again.
+def pitStopWithFuel(frames):
+    result = []
+    fuel = 20.0
+    for i in range(frames):
+        phase = i % 25920
+        if phase < 1440:
+            frame = _driving(i, isInPitLane=1, speed=60.0, fuel=fuel)
+        elif phase < 2880:
+            fuel += 0.02
+            frame = _driving(i, isInPitLane=1, isInPit=1, speed=0.0, worldX=PIT_BOX[0], fuel=fuel)
+        elif phase < 4320:
+            frame = _driving(i, isInPitLane=1, speed=60.0, fuel=fuel)
+        else:
+            frame = _driving(i, fuel=fuel)
+        result.append(frame)
+    return result
+
+
+# Driving down pit lane at 120 km/h once a lap.
+def speedingInPitLane(frames):
+    return [_driving(i, isInPitLane=1, speed=120.0) if i % 12960 < 1440 else _driving(i) for i in range(frames)]
+
+
+# Sitting on the grid for 10 seconds until the AC lights go out, then for the 12 seconds the PLP start light sequence
+# can take, then racing.
+def raceStartWithLights(frames):
+    result = []
+    for i in range(frames):
+        if i < 1440:
+            frame = _frame(i, lapTime=0)
+        elif i < 1440 + 1728:
+            frame = _frame(i, lapTime=int((i - 1440) * FRAME_TIME * 1000))
+        else:
+            frame = _driving(i - 1440 - 1728, lapTime=int((i - 1440) * FRAME_TIME * 1000),
+                             sessionTimeLeft=(RACE_SECONDS - i * FRAME_TIME) * 1000)
+        result.append(frame)
+    return result
+
+
+# Racing with the odd cut, and the race being restarted (session time left going back up) every 2 minutes.
+def sessionRestart(frames):
+    result = []
+    for i in range(frames):
+        sinceRestart = i % 17280
+        if sinceRestart % 1728 < 43:
+            frame = _driving(sinceRestart, tyresOut=4)
+        else:
+            frame = _driving(sinceRestart)
+        result.append(frame)
+    return result
+
+
+# Driving the first lap at a constant 120 km/h, with four wheels off for 2 seconds every 2000 frames. The cuts are too
+# long, and too slow for the max speed, to count, and with SPEED_ENVELOPE the envelope hasn't seen their part of the
+# lap yet.
+def slowLongCutsOnFirstLap(frames):
+    return [_driving(i, speed=120.0, tyresOut=4 if i < 12960 and i % 2000 >= 1712 else 0) for i in range(frames)]
+
+
+# The chat messages of a cut warning in a replay, as problems.
+def _noCutWarnings(result):
+    return ["frame {0}: {1}".format(event.frame, event.message) for event in result.events
+            if "Cut the track" in event.message]
+
+
+# A scenario's settings are set after readConfig, and its config (if not None) replaces the settings readConfig
+# compiles (see PLPReplay). check, if not None, returns the problems in the fastest run's ReplayResult.
+Scenario = collections.namedtuple('Scenario', 'name frames settings config check')
+
+SCENARIOS = (
+    Scenario('clean lap', cleanLap, {}, None, None),
+    Scenario('repeated cuts', repeatedCuts, {}, None, None),
+    Scenario('pit stop with fuel', pitStopWithFuel, {}, None, None),
+    Scenario('speeding in pit lane', speedingInPitLane, {}, None, None),
+    Scenario('race start with start lights', raceStartWithLights, {'USE_START_LIGHTS': True}, None, None),
+    Scenario('session restart', sessionRestart, {}, None, None),
+    Scenario('slow long cuts, new envelope', slowLongCutsOnFirstLap, {'maxSpeed': 300.0},
+             {'SPEED_ENVELOPE': True, 'MAX_SPEED_RATIO_FOR_CUT': 0.6, 'SPEED_ENVELOPE_RATIO_FOR_CUT': 0.9},
+             _noCutWarnings),
+)
+
+BenchResult = collections.namedtuple('BenchResult', 'name frames meanNs medianNs bytesPerFrame blocksPerFrame events '
+                                                  'problems')
+
+
+def _replay(frames, settings, config, name, traceMemory=False):
+    replay = PLPlib.plp_replay.PLPReplay(settings=settings, config=config)
+    try:
+        return replay.run(frames, name, traceMemory=traceMemory)
+    finally:
+        replay.close()
+
+
+# Replay a scenario repeat times, and keep the fastest run, then once more to measure the memory it allocates.
+def runScenario(scenario, frameCount, repeat):
+    frames = scenario.frames(frameCount)
+    settings = dict(BENCH_SETTINGS)
+    settings.update(scenario.settings)
+
+    best = None
+    for _ in range(repeat):
+        result = _replay(frames, settings, scenario.config, scenario.name)
+        if best is None or result.elapsed < best.elapsed:
+            best = result
+    traced = _replay(frames, settings, scenario.config, scenario.name, traceMemory=True)
+    problems = scenario.check(best) if scenario.check is not None else []
+    return BenchResult(scenario.name, best.frames, best.elapsed / best.frames * 1e9, best.p50 * 1e9,
+                       float(traced.allocatedBytes) / best.frames, float(traced.blocks) / best.frames,
+                       len(best.events), problems)
+
+
+def _regressions(results, baseline, tolerance, maxNs):
+    failures = []
+    for result in results:
+        for problem in result.problems:
+            failures.append("{0}: {1}".format(result.name, problem))
+        if maxNs and result.meanNs > maxNs:
+            failures.append("{0}: {1:.0f} ns/frame is over the {2:.0f} ns/frame limit".format(
+                result.name, result.meanNs, maxNs))
+        if result.name not in baseline:
+            continue
+        expected = baseline[result.name]
+        # Baselines saved before allocations were measured are just the ns/frame.
+        if not isinstance(expected, dict):
+            expected = {'ns': expected}
+        if result.meanNs > expected['ns'] * (1 + tolerance):
+            failures.append("{0}: {1:.0f} ns/frame is over the baseline {2:.0f} ns/frame + {3:.0%}".format(
+                result.name, result.meanNs, expected['ns'], tolerance))
+        if 'bytes' in expected and result.bytesPerFrame > expected['bytes'] * (1 + tolerance):
+            failures.append("{0}: {1:.0f} bytes/frame allocated is over the baseline {2:.0f} bytes/frame + "
+                            "{3:.0%}".format(result.name, result.bytesPerFrame, expected['bytes'], tolerance))
+    return failures
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark PitLanePenalty's acUpdate per-frame cost.")
+    parser.add_argument('scenarios', nargs='*', help="scenarios to run (default all)")
+    parser.add_argument('--frames', type=int, default=50000, help="frames per scenario")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per scenario; the fastest is kept")
+    parser.add_argument('--baseline', help="JSON file of ns/frame and bytes/frame per scenario to compare against")
+    parser.add_argument('--save-baseline', action='store_true', help="write this run's results to --baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="allowed slowdown, and increase in allocations, over the baseline")
+    parser.add_argument('--max-ns', type=float, default=0, help="fail if any scenario takes longer per frame")
+    args = parser.parse_args(argv)
+
+    scenarios = [s for s in SCENARIOS if not args.scenarios or s.name in args.scenarios]
+    results = []
+    print("{0:30} {1:>8} {2:>10} {3:>10} {4:>12} {5:>13} {6:>7}".format(
+        "scenario", "frames", "ns/frame", "median ns", "bytes/frame", "blocks/frame", "events"))
+    for scenario in scenarios:
+        result = runScenario(scenario, args.frames, args.repeat)
+        results.append(result)
+        print("{0:30} {1:8} {2:10.0f} {3:10.0f} {4:12.0f} {5:13.3f} {6:7}".format(*result[:7]))
+
+    if args.baseline and args.save_baseline:
+        with open(args.baseline, 'w') as baselineFile:
+            json.dump(dict((r.name, {'ns': r.meanNs, 'bytes': r.bytesPerFrame}) for r in results), baselineFile,
+                      indent=2, sort_keys=True)
+        return 0
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as baselineFile:
+            baseline = json.load(baselineFile)
+    failures = _regressions(results, baseline, args.tolerance, args.max_ns)
+    for failure in failures:
+        print("REGRESSION " + failure)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,99 @@
+"""
+Parser for the PLP chat messages PitLanePenalty's onChatMessage displays.
+
+onChatMessage is called for every chat line on the server, most of which aren't for PLP, so anything that doesn't
+start with one of the prefixes is rejected with a single startswith() call. The rest are parsed in one pass of a
+regular expression compiled once: the prefix, the team ("<team>: ", on team messages), the car the team message came
+from ("Car <car> ..."), and the text up to the delimiter (the text after it goes to the server log but isn't shown).
+
+Run as a script to time the parser against the parsing onChatMessage used to do, on a made-up chat corpus::
+
+    python PLPlib/plp_chat.py [--messages N] [--repeat N]
+"""
+import re
+
+
+class PLPChatParser:
+    def __init__(self, chatPrefix, teamPrefix, delimiter):
+        self.prefixes = (chatPrefix, teamPrefix)
+        # The team and the car ("Car" in any case) are optional. The car is looked ahead at, not consumed, as the
+        # text shown still starts with it.
+        self._pattern = re.compile(
+            '(?:{0}|{1})(?:(\\d+): (?=.)(?:(?=[Cc][Aa][Rr] (\\d+) )|))?([^{2}]*)'.format(
+                re.escape(chatPrefix), re.escape(teamPrefix), re.escape(delimiter)))
+
+    # (team, car, text) for a PLP chat or team chat message, or None for any other message. team and car are strings
+    # of digits, or None if the message doesn't have one.
+    def parse(self, message):
+        if not message.startswith(self.prefixes):
+            return None
+        return self._pattern.match(message).groups()
+
+
+def _legacyParse(message, chatPrefix, teamPrefix, delimiter):
+    # How onChatMessage parsed messages before PLPChatParser, for comparison.
+    if message.find(chatPrefix) == 0 or message.find(teamPrefix) == 0:
+        strippedMessage = message.replace(chatPrefix, "", 1)
+        strippedMessage = strippedMessage.replace(teamPrefix, "", 1)
+        team = car = None
+        matchObj = re.match('(\\d+): (.+)', strippedMessage, re.M | re.I)
+        if matchObj:
+            team = matchObj.group(1)
+            strippedMessage = matchObj.group(2)
+            matchObj = re.match('Car (\\d+) .*', strippedMessage, re.M | re.I)
+            if matchObj:
+                car = matchObj.group(1)
+        delimPos = strippedMessage.find(delimiter)
+        if delimPos >= 0:
+            strippedMessage = strippedMessage[:delimPos]
+        return team, car, strippedMessage
+    return None
+
+
+# A made-up server chat: mostly drivers talking and PLP log lines from every client, with the odd PLP and team message.
+def _corpus(count):
+    import random
+    rng = random.Random(1)
+    templates = (
+        (40, lambda: rng.choice(("gg", "sorry T1", "nice race all", "lag?", "blue flag pls", "good luck everyone"))),
+        (40, lambda: "PLP: Cut the track on lap {0}|Driver {1}".format(rng.randint(1, 40), rng.randint(1, 30))),
+        (10, lambda: "PLP>taken penalty|on lap {0}|Driver {1}".format(rng.randint(1, 40), rng.randint(1, 30))),
+        (10, lambda: "PLT>{0}: Car {1} has pitted. GO!|lap {2}".format(rng.randint(1, 5), rng.randint(1, 3),
+                                                                      rng.randint(1, 40))),
+    )
+    weighted = [template for weight, template in templates for _ in range(weight)]
+    return [rng.choice(weighted)() for _ in range(count)]
+
+
+def main(argv):
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Time PLPChatParser against the old onChatMessage parsing.")
+    parser.add_argument('--messages', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    messages = _corpus(args.messages)
+    chatParser = PLPChatParser("PLP>", "PLT>", "|")
+    for message in messages:
+        if chatParser.parse(message) != _legacyParse(message, "PLP>", "PLT>", "|"):
+            print("Parsed differently: {0!r}".format(message))
+            return 1
+
+    for name, parse in (("legacy", lambda message: _legacyParse(message, "PLP>", "PLT>", "|")),
+                        ("PLPChatParser", chatParser.parse)):
+        best = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            for message in messages:
+                parse(message)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        print("{0:15} {1:8.0f} ns/message".format(name, best / len(messages) * 1e9))
+    return 0
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,134 @@
+"""
+Queue for the chat messages PitLanePenalty sends, so AC's chat throttling doesn't drop them.
+
+Messages are posted with a priority, and pump() (called every frame) sends them, most important (lowest priority)
+first and in the order they were posted within a priority, at most one per token of a token bucket: the bucket
+holds up to burst tokens, and is refilled at rate tokens a second. A message posted with a key replaces a message
+with the same key that hasn't been sent yet, and cancel() withdraws one (e.g. the message that clears the chat line,
+when a new line is about to be shown anyway). When maxQueued messages are waiting, the newest of the least important
+is dropped.
+
+EVENT_PRIORITIES gives the priority of each event code of PLPlib/plp_protocol.py.
+"""
+import collections
+
+PRIORITY_PENALTY_ISSUED = 0
+PRIORITY_PENALTY_TAKEN = 1
+PRIORITY_CUT_LOG = 2
+PRIORITY_INFO = 3
+PRIORITIES = 4
+
+EVENT_PRIORITIES = {
+    'DC': PRIORITY_PENALTY_ISSUED, 'DS': PRIORITY_PENALTY_ISSUED, 'DJ': PRIORITY_PENALTY_ISSUED,
+    'TC': PRIORITY_PENALTY_ISSUED, 'TS': PRIORITY_PENALTY_ISSUED, 'TJ': PRIORITY_PENALTY_ISSUED,
+    'TK': PRIORITY_PENALTY_TAKEN, 'RT': PRIORITY_PENALTY_TAKEN, 'TN': PRIORITY_PENALTY_TAKEN,
+    'IG': PRIORITY_PENALTY_TAKEN,
+    'CT': PRIORITY_CUT_LOG, 'QC': PRIORITY_CUT_LOG,
+    'PE': PRIORITY_CUT_LOG, 'PT': PRIORITY_CUT_LOG, 'FA': PRIORITY_CUT_LOG,
+    'VR': PRIORITY_INFO, 'CL': PRIORITY_INFO, 'AD': PRIORITY_INFO,
+}
+
+# Default number of messages waiting to be sent before more are dropped.
+DEFAULT_MAX_QUEUED = 32
+
+
+class PLPChatQueue:
+    def __init__(self, send, rate, burst, maxQueued=DEFAULT_MAX_QUEUED):
+        self._send = send
+        self.rate = rate
+        self.burst = burst
+        self.maxQueued = maxQueued
+        self._tokens = float(burst)
+        self._lastRefill = None
+        # A deque for each priority of [message, time posted, key] entries; a cancelled entry's message is None.
+        self._queues = [collections.deque() for _ in range(PRIORITIES)]
+        self._keyed = {}
+        self.queued = 0
+        # Messages posted, sent, replaced by a later message with the same key, cancelled and dropped, and the total
+        # and longest time sent messages waited.
+        self.posted = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.cancelled = 0
+        self.dropped = 0
+        self.totalLatency = 0.0
+        self.maxLatency = 0.0
+
+    # Queue message to be sent with priority, at time now (in seconds). Returns False if it was dropped.
+    def post(self, message, priority, now, key=None):
+        self.posted += 1
+        if key is not None:
+            entry = self._keyed.get(key)
+            if entry is not None:
+                entry[0] = message
+                self.coalesced += 1
+                return True
+        if self.queued >= self.maxQueued and not self._dropLeastImportant(priority):
+            self.dropped += 1
+            return False
+        entry = [message, now, key]
+        self._queues[priority].append(entry)
+        self.queued += 1
+        if key is not None:
+            self._keyed[key] = entry
+        return True
+
+    # Withdraw the message queued with key, if there is one.
+    def cancel(self, key):
+        entry = self._keyed.pop(key, None)
+        if entry is not None:
+            entry[0] = None
+            self.queued -= 1
+            self.cancelled += 1
+
+    # Make room for a message with priority by dropping the newest of the least important messages, if they are less
+    # important.
+    def _dropLeastImportant(self, priority):
+        for queue in reversed(self._queues[priority + 1:]):
+            while queue:
+                entry = queue.pop()
+                if entry[0] is not None:
+                    if entry[2] is not None:
+                        del self._keyed[entry[2]]
+                    self.queued -= 1
+                    self.dropped += 1
+                    return True
+        return False
+
+    # The next message to send, as its entry, or None.
+    def _next(self):
+        for queue in self._queues:
+            while queue:
+                entry = queue.popleft()
+                if entry[0] is not None:
+                    if entry[2] is not None:
+                        del self._keyed[entry[2]]
+                    self.queued -= 1
+                    return entry
+        return None
+
+    def _sendEntry(self, entry, now):
+        self._send(entry[0])
+        self.sent += 1
+        latency = now - entry[1]
+        self.totalLatency += latency
+        if latency > self.maxLatency:
+            self.maxLatency = latency
+
+    # Send the messages the token bucket allows at time now.
+    def pump(self, now):
+        if self._lastRefill is not None:
+            self._tokens = min(self.burst, self._tokens + (now - self._lastRefill) * self.rate)
+        self._lastRefill = now
+        while self.queued and self._tokens >= 1:
+            self._sendEntry(self._next(), now)
+            self._tokens -= 1
+
+    # Send all the queued messages now, whatever the token bucket allows (e.g. when the app is shutting down).
+    def flush(self, now):
+        while self.queued:
+            self._sendEntry(self._next(), now)
+
+    # The average time sent messages waited, in seconds.
+    def averageLatency(self):
+        return self.totalLatency / self.sent if self.sent else 0.0
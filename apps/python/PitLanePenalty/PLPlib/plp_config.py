@@ -0,0 +1,172 @@
+"""
+Compiles PitLanePenalty's config files into one immutable, validated PLPSettings.
+
+The settings for a day are those in config/PLP.ini, overridden by the ones in that day's PLP-<Day>.ini, overridden by
+the server's name (a name ending in P<n>, e.g. "... P6", sets TOTAL_WARNINGS to n). A day file is looked for in every
+league folder in config/ (ACL, ROS, ...); if more than one has a file for the day, the one in the last folder in
+alphabetical order is used (the order Windows lists them in), and the others are reported as ignored.
+
+Every setting is read with its type (SETTINGS), and checked, and all the problems found are reported together in a
+PLPConfigError. The settings compiled are cached in a file, keyed by the modification times and sizes of the config
+files that could apply, so the config files are only parsed again when one of them changes (or a day file is added
+or removed).
+"""
+import collections
+import configparser
+import json
+import os
+import re
+import zlib
+
+import PLPlib.plp_io
+
+BASE_CONFIG = "PLP.ini"
+DAY_CONFIG = "PLP-{0}.ini"
+
+_REQUIRED = object()
+
+# (section, name, type, default, check) of each setting. A setting without a default (_REQUIRED) must be in the config
+# files. check, if not None, is a function that returns False for a value that isn't allowed.
+SETTINGS = (
+    ('General', 'CFG_NAME', str, _REQUIRED, None),
+    ('General', 'IMG_FOLDER', str, _REQUIRED, None),
+    ('General', 'WHEELS_OUT', int, _REQUIRED, lambda value: 0 <= value <= 4),
+    ('General', 'MIN_SPEED', int, _REQUIRED, lambda value: value >= 0),
+    ('General', 'WARNING_DURATION', int, _REQUIRED, lambda value: value >= 0),
+    ('General', 'CHAT_DURATION', int, _REQUIRED, lambda value: value >= 0),
+    ('General', 'TOTAL_WARNINGS', int, _REQUIRED, lambda value: value >= 0),
+    ('General', 'ENABLE_PENALTIES', bool, _REQUIRED, None),
+    ('General', 'LAPS_TO_TAKE_PENALTY', int, _REQUIRED, lambda value: value >= 0),
+    ('General', 'CUT_INDICATOR_SIZE', int, _REQUIRED, lambda value: value >= -1),
+    ('General', 'INVISIBLE_MODE', int, _REQUIRED, None),
+    ('General', 'PENALTY_MODE_CUTTING', int, _REQUIRED, lambda value: value in (1, 2)),
+    ('General', 'PENALTY_MODE_SPEEDING', int, _REQUIRED, lambda value: value in (1, 2)),
+    ('General', 'ENABLE_SPEEDING_PENALTIES', bool, _REQUIRED, None),
+    ('General', 'PIT_LANE_SPEED', int, _REQUIRED, lambda value: value >= 0),
+    ('General', 'SECONDS_BETWEEN_CUTS', int, _REQUIRED, lambda value: value >= 0),
+    ('General', 'USE_START_LIGHTS', bool, _REQUIRED, None),
+    ('General', 'USE_FLAG_IMAGES', bool, _REQUIRED, None),
+    ('General', 'FLAG_POS', str, _REQUIRED, lambda value: value in ("left", "right")),
+    ('General', 'JUMP_START_PENALTY_SECONDS', int, _REQUIRED, lambda value: value >= 0),
+    ('General', 'ENABLED_DAYS', str, _REQUIRED, None),
+    ('General', 'ENABLE_RACE_COUNTUP_TIMER_DAYS', str, _REQUIRED, None),
+    ('General', 'AMNESTY_LAPS', int, _REQUIRED, lambda value: value >= 0),
+    ('General', 'SHOW_CUTS_IN_SESSIONS', str, _REQUIRED, None),
+    ('General', 'ENABLED_SERVER_FILTER', str, _REQUIRED, None),
+    ('Teams', 'TEAM', int, _REQUIRED, lambda value: value >= 0),
+    ('Teams', 'TEAM_CAR', int, _REQUIRED, lambda value: value >= 0),
+    ('FineTuning', 'MAX_CUT_TIME', float, _REQUIRED, lambda value: value >= 0),
+    ('FineTuning', 'MIN_SLOW_DOWN_RATIO', float, _REQUIRED, lambda value: value >= 0),
+    ('FineTuning', 'MAX_SPEED_RATIO_FOR_CUT', float, _REQUIRED, lambda value: value >= 0),
+    ('FineTuning', 'QUAL_SLOW_DOWN_SPEED', float, _REQUIRED, lambda value: value >= 0),
+    ('FineTuning', 'SECONDS_PER_CUTTING_PENALTY', int, _REQUIRED, lambda value: value >= 0),
+    ('FineTuning', 'SECONDS_PER_SPEEDING_PENALTY', int, _REQUIRED, lambda value: value >= 0),
+    # 1.28 - Optional, so config files from older versions still work.
+    ('FineTuning', 'PACKET_GATED_UPDATE', bool, True, None),
+    ('FineTuning', 'RECORD_TELEMETRY', bool, False, None),
+    ('FineTuning', 'PROFILE_STAGES', bool, False, None),
+    ('FineTuning', 'JOURNAL_PENALTIES', bool, True, None),
+    ('FineTuning', 'SPEED_ENVELOPE', bool, False, None),
+    ('FineTuning', 'SPEED_ENVELOPE_RATIO_FOR_CUT', float, 0.9, lambda value: value >= 0),
+    ('FineTuning', 'STRUCTURED_CHAT', bool, True, None),
+    ('FineTuning', 'CHAT_MESSAGES_PER_SECOND', float, 1.0, lambda value: value >= 0),
+    ('FineTuning', 'CHAT_BURST', int, 3, lambda value: value >= 1),
+)
+
+PLPSettings = collections.namedtuple('PLPSettings', [name for section, name, kind, default, check in SETTINGS])
+
+# The settings, the config files they were read from (PLP.ini, then the day file if there is one), the day files
+# ignored because a later folder has one too, and whether the settings came from the cache.
+CompiledConfig = collections.namedtuple('CompiledConfig', 'settings sources ignored cached')
+
+# Changes when SETTINGS does, so a cache written by another version of the app isn't used.
+_SETTINGS_KEY = zlib.crc32(repr([(section, name, kind.__name__, default if default is not _REQUIRED else None)
+                                 for section, name, kind, default, check in SETTINGS]).encode('utf-8'))
+
+_SERVER_WARNINGS = re.compile(".*P([0-9]+)$")
+
+
+class PLPConfigError(Exception):
+    pass
+
+
+# The settings the server's name overrides: TOTAL_WARNINGS, if the name ends with P<n>.
+def serverOverrides(serverName):
+    match = _SERVER_WARNINGS.search(serverName.upper())
+    if match:
+        return {'TOTAL_WARNINGS': int(match.group(1))}
+    return {}
+
+
+# The day files for daySuffix ('Mon', 'Tue', ...) in the league folders of configFolder, in the order they apply.
+def dayConfigPaths(configFolder, daySuffix):
+    paths = []
+    for folder in sorted(os.listdir(configFolder)):
+        path = os.path.join(configFolder, folder, DAY_CONFIG.format(daySuffix))
+        if os.path.isfile(path):
+            paths.append(path)
+    return paths
+
+
+# Read and check the settings in the config files at sources (later files overriding earlier ones), with overrides.
+def compileConfig(sources, overrides=None):
+    config = configparser.ConfigParser()
+    config.read(sources)
+
+    values = []
+    problems = []
+    getters = {str: config.get, int: config.getint, float: config.getfloat, bool: config.getboolean}
+    for section, name, kind, default, check in SETTINGS:
+        if overrides and name in overrides:
+            values.append(overrides[name])
+            continue
+        try:
+            if default is _REQUIRED:
+                value = getters[kind](section, name)
+            else:
+                value = getters[kind](section, name, fallback=default)
+        except (configparser.Error, ValueError) as error:
+            problems.append("[{0}] {1}: {2}".format(section, name, error))
+            values.append(None)
+            continue
+        if check is not None and not check(value):
+            problems.append("[{0}] {1}: {2!r} isn't allowed".format(section, name, value))
+        values.append(value)
+    if problems:
+        raise PLPConfigError("Error in {0}:\n  {1}".format(" + ".join(sources), "\n  ".join(problems)))
+    return PLPSettings(*values)
+
+
+def _fileKey(path):
+    stat = os.stat(path)
+    return [path, stat.st_mtime, stat.st_size]
+
+
+# The compiled config for daySuffix on the server called serverName. The settings are read from the cache at
+# cachePath, if it has them for the current config files, and otherwise compiled and written to the cache (on worker,
+# if given).
+def loadConfig(configFolder, daySuffix, serverName, cachePath=None, worker=None):
+    dayPaths = dayConfigPaths(configFolder, daySuffix)
+    sources = [os.path.join(configFolder, BASE_CONFIG)] + dayPaths[-1:]
+    ignored = dayPaths[:-1]
+    overrides = serverOverrides(serverName)
+    key = [_SETTINGS_KEY, sorted(overrides.items()), [_fileKey(path) for path in sources + ignored]]
+
+    if cachePath is not None and os.path.isfile(cachePath):
+        try:
+            with open(cachePath, encoding='utf-8') as cacheFile:
+                cache = json.load(cacheFile)
+            if cache['key'] == json.loads(json.dumps(key)):
+                return CompiledConfig(PLPSettings(**cache['settings']), sources, ignored, True)
+        except (ValueError, KeyError, TypeError):
+            # A cache that can't be read is replaced.
+            pass
+
+    settings = compileConfig(sources, overrides)
+    if cachePath is not None:
+        data = json.dumps({'key': key, 'settings': settings._asdict()}, indent=1, sort_keys=True)
+        if worker is not None:
+            worker.submit(PLPlib.plp_io.writeFileAtomic, cachePath, data, key=cachePath)
+        else:
+            PLPlib.plp_io.writeFileAtomic(cachePath, data)
+    return CompiledConfig(settings, sources, ignored, False)
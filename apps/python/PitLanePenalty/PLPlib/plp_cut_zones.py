@@ -0,0 +1,161 @@
+"""
+Index of the places on a track where cuts are made, so a cut can be judged with that zone's thresholds and reported
+with the zone's name.
+
+A lap is divided into bins by AC's normalizedCarPosition. Each cut adds to the count of the bin it started in, and
+runs of bins with at least ZONE_MIN_CUTS cuts become zones, numbered around the lap ("Zone 1", "Zone 2", ...).
+Zones can also be named, and given their own MAX_CUT_TIME and MIN_SLOW_DOWN_RATIO, in the track's file, e.g.::
+
+    [Zone Turn 1]
+    START=0.012
+    END=0.034
+    MAX_CUT_TIME=0.5
+
+A zone can cross the start/finish line, from START near the end of the lap to END near the start of the next
+(e.g. START=0.98, END=0.02). Named zones take the bins they cover before the learned zones are worked out. A learned
+zone across the line is numbered last. Finding the zone at a position is an index into an array of bins.
+
+Each track (and track configuration) has its own file, with the counts in a [CutCounts] section.
+"""
+import array
+import collections
+import configparser
+import io
+import os
+
+import PLPlib.plp_io
+
+# Default number of bins a lap is divided into.
+DEFAULT_BINS = 200
+# Cuts in a bin before it is part of a learned zone.
+ZONE_MIN_CUTS = 3
+
+COUNTS_SECTION = 'CutCounts'
+ZONE_SECTION_PREFIX = 'Zone '
+
+# A zone from START to END around the lap. maxCutTime and minSlowDownRatio are None to use the app's settings.
+CutZone = collections.namedtuple('CutZone', 'name start end maxCutTime minSlowDownRatio')
+
+
+# The file the cut zones for track (in trackConfiguration) are kept in, in folder.
+def cutZonesPath(folder, track, trackConfiguration):
+    name = track + "-" + trackConfiguration if trackConfiguration else track
+    return os.path.join(folder, name + ".ini")
+
+
+class PLPCutZones:
+    def __init__(self, bins=DEFAULT_BINS, namedZones=()):
+        self.bins = bins
+        self.counts = array.array('H', [0]) * bins
+        self.namedZones = list(namedZones)
+        # Whether a cut has been added since the zones were loaded or saved.
+        self.changed = False
+        self._rebuild()
+
+    def _bin(self, position):
+        index = int(position * self.bins)
+        if index < 0:
+            return 0
+        if index >= self.bins:
+            return self.bins - 1
+        return index
+
+    # The bins zone covers, across the start/finish line if it starts after it ends.
+    def _zoneBins(self, zone):
+        start = self._bin(zone.start)
+        end = self._bin(zone.end)
+        if start <= end:
+            return range(start, end + 1)
+        return list(range(start, self.bins)) + list(range(end + 1))
+
+    # Whether the bin at binIndex is in a learned zone, once the zones it's next to are worked out.
+    def _learnedBin(self, binIndex):
+        return self._zoneOfBin[binIndex] == -1 and self.counts[binIndex] >= ZONE_MIN_CUTS
+
+    # Work out which zone each bin is in.
+    def _rebuild(self):
+        self.zones = list(self.namedZones)
+        self._zoneOfBin = array.array('h', [-1]) * self.bins
+        for index, zone in enumerate(self.namedZones):
+            for binIndex in self._zoneBins(zone):
+                self._zoneOfBin[binIndex] = index
+
+        # Go round the lap from the start/finish line, or if a learned zone crosses it, from the first bin that isn't
+        # in a learned zone, so that zone is found in one piece.
+        first = 0
+        if self._learnedBin(self.bins - 1):
+            while first < self.bins and self._learnedBin(first):
+                first += 1
+        if first == self.bins:
+            self._zoneOfBin = array.array('h', [len(self.zones)]) * self.bins
+            self.zones.append(CutZone("Zone 1", 0.0, 1.0, None, None))
+            return
+
+        binIndex = first
+        while binIndex < first + self.bins:
+            if not self._learnedBin(binIndex % self.bins):
+                binIndex += 1
+                continue
+            start = binIndex
+            while binIndex < first + self.bins and self._learnedBin(binIndex % self.bins):
+                self._zoneOfBin[binIndex % self.bins] = len(self.zones)
+                binIndex += 1
+            end = binIndex if binIndex <= self.bins else binIndex - self.bins
+            learned = len(self.zones) - len(self.namedZones) + 1
+            self.zones.append(CutZone("Zone {0}".format(learned), start % self.bins / self.bins, end / self.bins,
+                                      None, None))
+
+    # The CutZone at position (0 to 1 around the lap), or None.
+    def zoneAt(self, position):
+        index = self._zoneOfBin[self._bin(position)]
+        return self.zones[index] if index >= 0 else None
+
+    # Count a cut that started at position.
+    def addCut(self, position):
+        index = self._bin(position)
+        if self.counts[index] < 0xffff:
+            self.counts[index] += 1
+            self.changed = True
+            if self.counts[index] == ZONE_MIN_CUTS and self._zoneOfBin[index] == -1:
+                self._rebuild()
+
+    # Read the cut zones in path, or new ones if there isn't a file yet.
+    @classmethod
+    def load(cls, path, bins=DEFAULT_BINS):
+        config = configparser.ConfigParser()
+        config.optionxform = str
+        config.read(path)
+        namedZones = []
+        for section in config.sections():
+            if section.startswith(ZONE_SECTION_PREFIX):
+                namedZones.append(CutZone(section[len(ZONE_SECTION_PREFIX):],
+                                          config.getfloat(section, 'START'), config.getfloat(section, 'END'),
+                                          config.getfloat(section, 'MAX_CUT_TIME', fallback=None),
+                                          config.getfloat(section, 'MIN_SLOW_DOWN_RATIO', fallback=None)))
+        zones = cls(bins, namedZones)
+        if config.has_section(COUNTS_SECTION) and config.getint(COUNTS_SECTION, 'BINS', fallback=0) == bins:
+            counts = [int(count) for count in config.get(COUNTS_SECTION, 'COUNTS').split(",")]
+            if len(counts) == bins:
+                zones.counts = array.array('H', counts)
+                zones._rebuild()
+        return zones
+
+    # The cut counts, to save with saveCounts().
+    def countsSnapshot(self):
+        self.changed = False
+        return self.bins, self.counts.tolist()
+
+
+# Save cut counts (from countsSnapshot()) in path, keeping the named zones in it.
+def saveCounts(path, snapshot):
+    bins, counts = snapshot
+    config = configparser.ConfigParser()
+    config.optionxform = str
+    config.read(path)
+    if not config.has_section(COUNTS_SECTION):
+        config.add_section(COUNTS_SECTION)
+    config.set(COUNTS_SECTION, 'BINS', str(bins))
+    config.set(COUNTS_SECTION, 'COUNTS', ",".join(str(count) for count in counts))
+    contents = io.StringIO()
+    config.write(contents)
+    PLPlib.plp_io.writeFileAtomic(path, contents.getvalue())
@@ -0,0 +1,105 @@
+"""
+Background worker for PitLanePenalty's disk reads and writes.
+
+Jobs (functions to call) run in the order they were submitted, on one thread, so the render thread never waits for
+the disk. A job submitted with a key replaces a job with the same key that hasn't run yet, so e.g. a file rewritten
+twice in quick succession is only written once. The queue is bounded: when it is full, submit() drops the job and
+counts it rather than block the caller. The thread is only running while there are jobs to run.
+"""
+import collections
+import os
+import threading
+import traceback
+
+# Default number of jobs waiting to run before more are dropped.
+DEFAULT_MAX_JOBS = 256
+
+
+class PLPIOWorker:
+    def __init__(self, name="PLP I/O", maxJobs=DEFAULT_MAX_JOBS):
+        self.name = name
+        self.maxJobs = maxJobs
+        self._lock = threading.Lock()
+        # Keys of the jobs waiting to run, in order, and key -> (function, args).
+        self._order = collections.deque()
+        self._jobs = {}
+        self._thread = None
+        self._closing = False
+        # Jobs submitted, replaced by a later job with the same key, dropped because the queue was full, run, and
+        # failed (with the traceback of the last failure).
+        self.submitted = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.completed = 0
+        self.failed = 0
+        self.lastError = None
+
+    # Run function(*args) on the worker thread. Returns False if the job was dropped.
+    def submit(self, function, *args, key=None):
+        with self._lock:
+            if self._closing:
+                raise RuntimeError("{0} is closed".format(self.name))
+            self.submitted += 1
+            if key is not None and key in self._jobs:
+                self._jobs[key] = (function, args)
+                self.coalesced += 1
+                return True
+            if len(self._order) >= self.maxJobs:
+                self.dropped += 1
+                return False
+            if key is None:
+                key = object()
+            self._jobs[key] = (function, args)
+            self._order.append(key)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name)
+                self._thread.daemon = True
+                self._thread.start()
+        return True
+
+    # Jobs waiting to run.
+    def pending(self):
+        with self._lock:
+            return len(self._order)
+
+    # Stop taking jobs, and wait at most timeout seconds (or for ever if None) for the jobs already submitted to run.
+    # Returns False if they hadn't all run by then.
+    def close(self, timeout=None):
+        with self._lock:
+            self._closing = True
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+            return not thread.is_alive()
+        return True
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._order:
+                    # Done for now; the next submit() starts a new thread.
+                    self._thread = None
+                    return
+                function, args = self._jobs.pop(self._order.popleft())
+            try:
+                function(*args)
+                self.completed += 1
+            except Exception:
+                self.failed += 1
+                self.lastError = traceback.format_exc()
+
+
+# Replace the file at path with data (bytes, or text written as UTF-8), so that it is either all old or all new even
+# if the game crashes while it is being written.
+def writeFileAtomic(path, data):
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    folder = os.path.dirname(path)
+    if folder and not os.path.isdir(folder):
+        os.makedirs(folder)
+    temporaryPath = path + '.tmp'
+    with open(temporaryPath, 'wb') as temporary:
+        temporary.write(data)
+        temporary.flush()
+        os.fsync(temporary.fileno())
+    os.replace(temporaryPath, path)
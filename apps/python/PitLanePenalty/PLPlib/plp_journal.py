@@ -0,0 +1,188 @@
+"""
+Crash-safe journal of PitLanePenalty's penalty state, so warnings and penalties survive the app being reloaded or the
+driver reconnecting to the server in the middle of a session.
+
+Each change to the PLPPenaltyState appends a small fixed-size record: the key of the server, track, car and session
+type it belongs to, when it was written, when that session ends (by the wall clock, from the session time left), the
+lap, and the serialized state. The session's end tells one session from the next session of the same type on the
+server, e.g. a race after a race, so state is only resumed in the session it was journaled in. Records are written
+and fsynced in batches by a background PLPIOWorker, so the render thread never waits for the disk. Each record ends
+with a crc32 of the rest of it, so a record torn by a crash is ignored when the journal is read back.
+
+File layout: a JOURNAL_HEADER (magic, version, record size), then records.
+"""
+import collections
+import math
+import os
+import struct
+import time
+import zlib
+
+import PLPlib.plp_io
+import PLPlib.plp_penalty_state
+
+JOURNAL_MAGIC = b'PLPJ'
+JOURNAL_VERSION = 2
+JOURNAL_HEADER = struct.Struct('<4sHH')
+# Key, wall clock time, session end time, lap and serialized state (padded with zero bytes), then the crc32 of those.
+RECORD_BODY = struct.Struct('<IddH48s')
+RECORD_CRC = struct.Struct('<I')
+RECORD_SIZE = RECORD_BODY.size + RECORD_CRC.size
+
+# When opened with more records than this, the journal is rewritten with only the latest record for each key.
+COMPACT_RECORDS = 4096
+
+# How far apart the end times of a session worked out at different times can be (the session time left and the wall
+# clock don't keep exactly in step, e.g. while the game is paused).
+SESSION_END_TOLERANCE = 60
+
+# sessionEnd is 0 for a session without a time limit.
+JournalRecord = collections.namedtuple('JournalRecord', 'key wallTime sessionEnd lap state')
+
+
+# When a session with sessionTimeLeft milliseconds left (AC's sessionTimeLeft) ends, by the wall clock, or 0 for a
+# session without a time limit.
+def sessionEndTime(sessionTimeLeft):
+    if math.isinf(sessionTimeLeft):
+        return 0.0
+    return time.time() + sessionTimeLeft / 1000
+
+
+# The key the penalty state of one car in one session on a server and track is journaled under.
+def journalKey(serverName, trackName, trackConfiguration, carName, session):
+    name = "|".join((serverName, trackName, trackConfiguration, carName, str(session)))
+    return zlib.crc32(name.encode('utf-8')) & 0xffffffff
+
+
+def packRecord(record):
+    body = RECORD_BODY.pack(record.key, record.wallTime, record.sessionEnd, record.lap, record.state.encode('ascii'))
+    return body + RECORD_CRC.pack(zlib.crc32(body) & 0xffffffff)
+
+
+# Read a journal into a list of JournalRecords, oldest first. Torn or corrupt records are skipped.
+def readJournal(path):
+    records = []
+    with open(path, 'rb') as journal:
+        header = journal.read(JOURNAL_HEADER.size)
+        magic, version, recordSize = JOURNAL_HEADER.unpack(header)
+        if magic != JOURNAL_MAGIC or version != JOURNAL_VERSION or recordSize != RECORD_SIZE:
+            raise ValueError("{0} is not a version {1} PLP journal".format(path, JOURNAL_VERSION))
+
+        while True:
+            data = journal.read(RECORD_SIZE)
+            if len(data) < RECORD_SIZE:
+                break
+            body = data[:RECORD_BODY.size]
+            if RECORD_CRC.unpack_from(data, RECORD_BODY.size)[0] != zlib.crc32(body) & 0xffffffff:
+                continue
+            key, wallTime, sessionEnd, lap, state = RECORD_BODY.unpack(body)
+            records.append(JournalRecord(key, wallTime, sessionEnd, lap, state.rstrip(b'\0').decode('ascii')))
+    return records
+
+
+class PLPPenaltyJournal:
+    """The latest journaled state for each key, read when opened, and a background thread appending new records.
+
+    The records are written by worker (a PLPIOWorker shared with other writers), or by the journal's own worker.
+    """
+
+    def __init__(self, path, worker=None):
+        self.path = path
+        # key -> latest JournalRecord.
+        self.latest = {}
+        self.recordsRead = 0
+        # The records to rewrite the journal with before appending to it, or None.
+        compactRecords = None
+        if os.path.isfile(path):
+            try:
+                records = readJournal(path)
+            except (ValueError, struct.error):
+                # Not a journal this version can read, so start a new one.
+                records = []
+                compactRecords = []
+            self.recordsRead = len(records)
+            for record in records:
+                self.latest[record.key] = record
+            if self.recordsRead > COMPACT_RECORDS:
+                compactRecords = list(self.latest.values())
+        self.appended = 0
+        self.syncs = 0
+
+        # Records waiting to be written, and the journal they're appended to (both used by the worker).
+        self._records = collections.deque()
+        self._journal = None
+        self._ownWorker = worker is None
+        self._worker = PLPlib.plp_io.PLPIOWorker("PLP journal") if worker is None else worker
+        if compactRecords is not None:
+            self._worker.submit(self._compact, compactRecords)
+
+    # The state journaled for key in the session ending at sessionEnd (see sessionEndTime()), if it was written less
+    # than maxAge seconds ago and on lap or before (a later lap means it is from an earlier session). Returns a
+    # PLPPenaltyState, or None.
+    def resume(self, key, lap, maxAge, sessionEnd):
+        record = self.latest.get(key)
+        if record is None or time.time() - record.wallTime > maxAge or record.lap > lap:
+            return None
+        if abs(record.sessionEnd - sessionEnd) > SESSION_END_TOLERANCE:
+            # Another session of the same type.
+            return None
+        try:
+            return PLPlib.plp_penalty_state.PLPPenaltyState.deserialize(record.state)
+        except ValueError:
+            # Written by a version of PLP with a different state.
+            return None
+
+    # Journal state (a PLPPenaltyState) for key, on lap of the session ending at sessionEnd.
+    def append(self, key, lap, state, sessionEnd):
+        record = JournalRecord(key, time.time(), sessionEnd, lap, state.serialize())
+        self.latest[key] = record
+        self.appended += 1
+        self._records.append(record)
+        # One write job waiting to run writes all the records appended by then.
+        self._worker.submit(self._writeRecords, key=self)
+
+    # Close the journal once everything is written. With its own worker, wait for that to happen.
+    def close(self):
+        self._worker.submit(self._closeJournal)
+        if self._ownWorker:
+            self._worker.close()
+
+    # Write everything appended since the last sync, then sync once.
+    def _writeRecords(self):
+        records = []
+        while self._records:
+            records.append(self._records.popleft())
+        if not records:
+            return
+        if self._journal is None:
+            self._journal = _openJournal(self.path)
+        self._journal.write(b''.join(packRecord(record) for record in records))
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self.syncs += 1
+
+    def _closeJournal(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    # Replace the journal with one holding just records.
+    def _compact(self, records):
+        records = sorted(records, key=lambda record: record.wallTime)
+        PLPlib.plp_io.writeFileAtomic(self.path, JOURNAL_HEADER.pack(JOURNAL_MAGIC, JOURNAL_VERSION, RECORD_SIZE) +
+                                      b''.join(packRecord(record) for record in records))
+
+
+def _openJournal(path):
+    folder = os.path.dirname(path)
+    if folder and not os.path.isdir(folder):
+        os.makedirs(folder)
+    journal = open(path, 'ab')
+    size = journal.tell()
+    if size < JOURNAL_HEADER.size:
+        journal.truncate(0)
+        journal.write(JOURNAL_HEADER.pack(JOURNAL_MAGIC, JOURNAL_VERSION, RECORD_SIZE))
+    elif (size - JOURNAL_HEADER.size) % RECORD_SIZE:
+        # Drop a record torn by a crash, so the records appended after it line up.
+        journal.truncate(size - (size - JOURNAL_HEADER.size) % RECORD_SIZE)
+    return journal
@@ -0,0 +1,155 @@
+"""
+The state of PitLanePenalty's warnings and penalties for the current driver.
+
+PLPPenaltyState keeps the warning count, the pit lane (drive through) penalty and its progress, and the laps they
+relate to, in one object with a method for each transition. snapshot() and restore() copy the state to and from a
+tuple, and serialize() and deserialize() to and from a line of text, so it can be saved and restored (e.g. if the app
+is reloaded in the middle of a race).
+"""
+
+# The state's fields, in snapshot and serialized order.
+PENALTY_STATE_FIELDS = (
+    'numWarnings',
+    'pitLanePenalty',
+    'speedingPenalty',
+    'takingPenalty',
+    'penaltyVoid',
+    'penaltyMessageSent',
+    'penaltyLapsLeft',
+    'speedingOnLap',
+    'isInPitLaneLap',
+    'invalidQualLapWarning',
+)
+_BOOL_FIELDS = frozenset(('pitLanePenalty', 'speedingPenalty', 'takingPenalty', 'penaltyVoid', 'penaltyMessageSent',
+                          'invalidQualLapWarning'))
+_BOOL_FLAGS = tuple(field in _BOOL_FIELDS for field in PENALTY_STATE_FIELDS)
+
+SERIALIZED_VERSION = 1
+
+
+class PLPPenaltyState:
+    # changes counts the transitions made (other than ones that change nothing, like clearing a penalty that isn't
+    # void), so a caller can cheaply tell whether the state may have changed.
+    __slots__ = PENALTY_STATE_FIELDS + ('changes',)
+
+    def __init__(self):
+        self.changes = 0
+        self.resetWarnings()
+        self.resetSession()
+
+    # Clear all warnings and penalties.
+    def resetWarnings(self):
+        self.changes += 1
+        self.numWarnings = 0
+        self.pitLanePenalty = False
+        self.speedingPenalty = False
+        self.takingPenalty = False
+        self.penaltyVoid = False
+        self.penaltyMessageSent = False
+        self.penaltyLapsLeft = 0
+        self.invalidQualLapWarning = False
+
+    # Forget the laps of the last session.
+    def resetSession(self):
+        self.changes += 1
+        self.speedingOnLap = 0
+        self.isInPitLaneLap = 0
+
+    # Returns the new number of warnings.
+    def addWarning(self):
+        self.changes += 1
+        self.numWarnings += 1
+        return self.numWarnings
+
+    def clearWarnings(self):
+        self.changes += 1
+        self.numWarnings = 0
+
+    def enterPitLane(self, lap):
+        self.changes += 1
+        self.isInPitLaneLap = lap
+
+    def givePitLanePenalty(self, laps):
+        self.changes += 1
+        self.pitLanePenalty = True
+        self.penaltyLapsLeft = laps
+
+    def giveSpeedingPenalty(self, lap):
+        self.changes += 1
+        self.speedingPenalty = True
+        self.speedingOnLap = lap
+
+    # Count down one of the laps the pit lane penalty has to be taken in. Returns False if there were none left, i.e.
+    # the penalty has been ignored.
+    def countDownPenaltyLap(self):
+        self.changes += 1
+        self.penaltyLapsLeft -= 1
+        if self.penaltyLapsLeft < 0:
+            self.penaltyLapsLeft = 0
+            return False
+        return True
+
+    # The car is driving through pit lane to take the penalty. Returns True the first time, when it should be announced.
+    def startTakingPenalty(self):
+        if self.takingPenalty and self.penaltyMessageSent:
+            return False
+        self.changes += 1
+        self.takingPenalty = True
+        if self.penaltyMessageSent:
+            return False
+        self.penaltyMessageSent = True
+        return True
+
+    # The car stopped in pit lane, so the drive through doesn't count. Returns True the first time, when it should be
+    # announced.
+    def voidPenalty(self):
+        if self.penaltyVoid and not self.takingPenalty:
+            return False
+        self.changes += 1
+        self.takingPenalty = False
+        if self.penaltyVoid:
+            return False
+        self.penaltyVoid = True
+        return True
+
+    # Out of pit lane without taking the penalty, so the next drive through counts again.
+    def clearVoidPenalty(self):
+        if not self.penaltyVoid and not self.penaltyMessageSent:
+            return
+        self.changes += 1
+        self.penaltyVoid = False
+        self.penaltyMessageSent = False
+
+    def invalidateQualLap(self):
+        self.changes += 1
+        self.invalidQualLapWarning = True
+
+    def clearInvalidQualLap(self):
+        self.changes += 1
+        self.invalidQualLapWarning = False
+
+    def snapshot(self):
+        return tuple(getattr(self, field) for field in PENALTY_STATE_FIELDS)
+
+    def restore(self, snapshot):
+        self.changes += 1
+        for field, value in zip(PENALTY_STATE_FIELDS, snapshot):
+            setattr(self, field, value)
+
+    # The state as a line of text: the version, then each field as an integer, separated by commas.
+    def serialize(self):
+        return ",".join([str(SERIALIZED_VERSION)] + [str(int(value)) for value in self.snapshot()])
+
+    @classmethod
+    def deserialize(cls, text):
+        values = text.strip().split(",")
+        if int(values[0]) != SERIALIZED_VERSION or len(values) != len(PENALTY_STATE_FIELDS) + 1:
+            raise ValueError("not a version {0} penalty state: {1!r}".format(SERIALIZED_VERSION, text))
+        state = cls()
+        state.restore([bool(int(value)) if isBool else int(value)
+                       for isBool, value in zip(_BOOL_FLAGS, values[1:])])
+        return state
+
+    def __repr__(self):
+        return "PLPPenaltyState({0})".format(", ".join(
+            "{0}={1!r}".format(field, getattr(self, field)) for field in PENALTY_STATE_FIELDS))
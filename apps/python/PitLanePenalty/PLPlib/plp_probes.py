@@ -0,0 +1,56 @@
+"""
+Timing probes for the stages of a function that runs every frame, like acUpdate.
+
+Call start() at the top of the frame and mark(stage) at the end of each stage. The time since the previous
+start()/mark() is added to that stage's histogram, which has power-of-two microsecond buckets. Callers keep the probes
+in a variable that is None when profiling is off, so a disabled probe costs one "is not None" check per stage.
+"""
+import time
+
+# Bucket n holds times of [2^(n-1), 2^n) microseconds; bucket 0 is under 1us, the last bucket is everything longer.
+HISTOGRAM_BUCKETS = 16
+
+
+class PLPStageProbes:
+    def __init__(self, stages):
+        self.stages = tuple(stages)
+        self.reset()
+
+    def reset(self):
+        self._histograms = [[0] * HISTOGRAM_BUCKETS for _ in self.stages]
+        self._counts = [0] * len(self.stages)
+        self._totals = [0.0] * len(self.stages)
+        self._maximums = [0.0] * len(self.stages)
+        self._last = time.perf_counter()
+
+    def start(self):
+        self._last = time.perf_counter()
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        elapsed = now - self._last
+        self._last = now
+
+        self._counts[stage] += 1
+        self._totals[stage] += elapsed
+        if elapsed > self._maximums[stage]:
+            self._maximums[stage] = elapsed
+        bucket = int(elapsed * 1000000).bit_length()
+        self._histograms[stage][bucket if bucket < HISTOGRAM_BUCKETS else HISTOGRAM_BUCKETS - 1] += 1
+
+    # One line per stage that has been timed: count, mean, maximum and the non-empty histogram buckets.
+    def report(self):
+        lines = []
+        for stage, name in enumerate(self.stages):
+            count = self._counts[stage]
+            if not count:
+                continue
+            buckets = []
+            for bucket, bucketCount in enumerate(self._histograms[stage]):
+                if bucketCount:
+                    buckets.append("<{0}us:{1}".format(1 << bucket, bucketCount)
+                                   if bucket < HISTOGRAM_BUCKETS - 1 else
+                                   ">={0}us:{1}".format(1 << (bucket - 1), bucketCount))
+            lines.append("{0}: {1} calls, mean {2:.1f}us, max {3:.1f}us, {4}".format(
+                name, count, self._totals[stage] / count * 1000000, self._maximums[stage] * 1000000, " ".join(buckets)))
+        return lines
@@ -0,0 +1,207 @@
+"""
+Encoding and decoding of the chat messages PitLanePenalty sends, for the app and for tools reading AC server logs.
+
+PLP's chat messages are human-readable lines: a prefix (PLP> for chat shown in the app, PLT><team>: for team chat,
+PLP: for the log only), the text, further details after the delimiter, and (except in team chat) the driver's name,
+e.g.::
+
+    PLP>taken penalty|on lap 5|Driver Name
+
+encode() adds a record to the end of a line, after the delimiter, so the line still reads (and is shown by older
+versions of the app) as before::
+
+    PLP>taken penalty|on lap 5|Driver Name|#1,TN,5,1234,2,0*3fa2
+
+The record is the format version, then the EVENTS code, lap, seconds (the seconds left in the session, AC's
+sessionTimeLeft, which is the same for every driver in the session and goes back up when a new session starts; -1 in
+a session without a time limit), session (AC's session type) and value (the seconds of a time penalty, the litres
+added by a pit stop, otherwise 0), and a checksum (CRC-32 of the line up to the '*', low 16 bits, in hex).
+
+PLPDecoder decodes lines with a record, and lines from versions of the app without one, whose event (and lap, car and
+value, where the text has them) it recognises from the text. Either way, decoding a line is a startswith() check
+for lines that aren't PLP's, and a few string operations or a regular expression match for lines that are.
+"""
+import collections
+import re
+import zlib
+
+PROTOCOL_VERSION = 1
+
+CHAT_PREFIX = "PLP>"
+TEAM_CHAT_PREFIX = "PLT>"
+LOG_PREFIX = "PLP: "
+DELIMITER = "|"
+RECORD_MARK = DELIMITER + "#"
+CHECKSUM_MARK = "*"
+
+# Event codes, and what they are.
+EVENTS = collections.OrderedDict((
+    ('VR', "version and config"),
+    ('CT', "cut the track"),
+    ('QC', "cut the track on a qualifying lap"),
+    ('DC', "drive through penalty for cutting"),
+    ('DS', "drive through penalty for speeding"),
+    ('DJ', "drive through penalty for a jump start"),
+    ('TC', "time penalty for cutting"),
+    ('TS', "time penalty for speeding"),
+    ('TJ', "time penalty for a jump start"),
+    ('TK', "taking penalty"),
+    ('RT', "re-take penalty"),
+    ('TN', "taken penalty"),
+    ('IG', "ignored penalty"),
+    ('PE', "entered pit lane"),
+    ('PT', "pitted"),
+    ('FA', "added fuel"),
+    ('CL', "chat cleared"),
+    ('AD', "app dismissed"),
+))
+
+# The event code of a drive through (or time) penalty for reason.
+_PENALTY_EVENTS = {
+    (True, "CUTTING"): 'DC', (True, "SPEEDING"): 'DS', (True, "JUMP START"): 'DJ',
+    (False, "CUTTING"): 'TC', (False, "SPEEDING"): 'TS', (False, "JUMP START"): 'TJ',
+}
+
+# A decoded line. channel is 'chat', 'team' or 'log'. team is the team of team chat, otherwise None. event is an
+# EVENTS code, or None for a line without a record that isn't recognised. lap, seconds, car, session and value are
+# ints, or None when the line doesn't say (seconds in a session without a time limit; car, the team's car number,
+# is only in some team chat). details are the fields between the text and the author
+# (or record). version is the record's format version, 0 for a line without one.
+PLPMessage = collections.namedtuple('PLPMessage', 'channel team event lap seconds car session value text details '
+                                                  'author version')
+
+# Events recognised in the text of lines without a record: (event, pattern), tried in order. The pattern's lap, car
+# and value groups, where it has them, are read too.
+_LEGACY_EVENTS = tuple((event, re.compile(pattern)) for event, pattern in (
+    ('VR', "running version "),
+    ('QC', "Cut the track on qual lap"),
+    ('CT', "Cut the track on lap (?P<lap>\\d+)"),
+    ('DC', "DRIVE THROUGH PENALTY FOR CUTTING"),
+    ('DS', "DRIVE THROUGH PENALTY FOR SPEEDING"),
+    ('DJ', "DRIVE THROUGH PENALTY FOR JUMP START"),
+    ('TC', "GIVEN A (?P<value>\\d+) SECOND TIME PENALTY FOR CUTTING"),
+    ('TS', "GIVEN A (?P<value>\\d+) SECOND TIME PENALTY FOR SPEEDING"),
+    ('TJ', "GIVEN A (?P<value>\\d+) SECOND TIME PENALTY FOR JUMP START"),
+    ('TK', "taking penalty$"),
+    ('RT', "re-take penalty$"),
+    ('TN', "taken penalty$"),
+    ('IG', "ignored penalty$"),
+    ('PE', "Car (?P<car>\\d+) has entered pit lane"),
+    ('PT', "Car (?P<car>\\d+) has pitted"),
+    ('PT', "Pitted on lap (?P<lap>\\d+)"),
+    ('FA', "Added (?P<value>\\d+) litres"),
+    ('CL', "$"),
+    ('AD', "app dismissed$"),
+))
+# The lap in the details of a line without a record ("on lap 5", or "lap 5" in team chat).
+_LEGACY_LAP = re.compile("(?:on )?lap (\\d+)$")
+# The team's car number in team chat ("Car 2 has pitted").
+_TEAM_CAR = re.compile("Car (\\d+) ")
+
+
+# The event code of a penalty given for reason, as a drive through or a time penalty.
+def penaltyEvent(driveThrough, reason):
+    return _PENALTY_EVENTS[(driveThrough, reason)]
+
+
+def _checksum(line):
+    return "{0:04x}".format(zlib.crc32(line.encode('utf-8')) & 0xffff)
+
+
+# line with a record of event (an EVENTS code), lap, seconds, session and value added to the end.
+def encode(line, event, lap, seconds, session, value=0):
+    line = "{0}{1}{2},{3},{4:d},{5:d},{6:d},{7:d}{8}".format(line, RECORD_MARK, PROTOCOL_VERSION, event, lap,
+                                                            int(seconds), session, int(round(value)), CHECKSUM_MARK)
+    return line + _checksum(line)
+
+
+class PLPDecoder:
+    def __init__(self):
+        self.prefixes = (CHAT_PREFIX, TEAM_CHAT_PREFIX, LOG_PREFIX)
+        # Lines decoded from their record, decoded from their text, and with a record that couldn't be read (bad
+        # checksum, fields or version), which are decoded from their text instead (and also counted as legacy).
+        self.decoded = 0
+        self.legacy = 0
+        self.corrupt = 0
+
+    # The PLPMessage in a line of chat, or None if it isn't one of PLP's.
+    def decode(self, line):
+        if not line.startswith(self.prefixes):
+            return None
+        record = None
+        recordStart = line.rfind(RECORD_MARK)
+        if recordStart >= 0:
+            record = self._readRecord(line, recordStart)
+            if record is None:
+                self.corrupt += 1
+            line = line[:recordStart]
+
+        team = None
+        if line.startswith(CHAT_PREFIX):
+            channel = 'chat'
+            body = line[len(CHAT_PREFIX):]
+        elif line.startswith(LOG_PREFIX):
+            channel = 'log'
+            body = line[len(LOG_PREFIX):]
+        else:
+            channel = 'team'
+            body = line[len(TEAM_CHAT_PREFIX):]
+            teamEnd = body.find(": ")
+            if teamEnd > 0 and body[:teamEnd].isdigit():
+                team = int(body[:teamEnd])
+                body = body[teamEnd + 2:]
+
+        fields = body.split(DELIMITER)
+        text = fields[0]
+        # Team chat doesn't end with the author's name.
+        if channel == 'team' or len(fields) == 1:
+            author = None
+            details = tuple(fields[1:])
+        else:
+            author = fields[-1]
+            details = tuple(fields[1:-1])
+
+        if record is not None:
+            self.decoded += 1
+            event, lap, seconds, session, value = record
+            car = None
+            if channel == 'team':
+                match = _TEAM_CAR.match(text)
+                if match:
+                    car = int(match.group(1))
+            return PLPMessage(channel, team, event, lap, seconds if seconds >= 0 else None, car, session, value, text,
+                              details, author, PROTOCOL_VERSION)
+        self.legacy += 1
+        return self._decodeText(channel, team, text, details, author)
+
+    # (event, lap, seconds, session, value) from the record at recordStart in line, or None if it can't be read.
+    @staticmethod
+    def _readRecord(line, recordStart):
+        checksumStart = line.rfind(CHECKSUM_MARK, recordStart)
+        if checksumStart < 0 or line[checksumStart + 1:] != _checksum(line[:checksumStart + 1]):
+            return None
+        fields = line[recordStart + len(RECORD_MARK):checksumStart].split(",")
+        if len(fields) != 6 or fields[0] != str(PROTOCOL_VERSION) or fields[1] not in EVENTS:
+            return None
+        try:
+            return (fields[1],) + tuple(map(int, fields[2:]))
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _decodeText(channel, team, text, details, author):
+        event = lap = car = value = None
+        for legacyEvent, pattern in _LEGACY_EVENTS:
+            match = pattern.match(text)
+            if match:
+                event = legacyEvent
+                groups = match.groupdict()
+                lap = int(groups['lap']) if groups.get('lap') else None
+                car = int(groups['car']) if groups.get('car') else None
+                value = int(groups['value']) if groups.get('value') else None
+                break
+        if lap is None and details:
+            match = _LEGACY_LAP.match(details[0])
+            if match:
+                lap = int(match.group(1))
+        return PLPMessage(channel, team, event, lap, None, car, None, value, text, details, author, 0)
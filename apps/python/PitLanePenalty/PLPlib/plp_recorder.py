@@ -0,0 +1,185 @@
+"""
+Compact binary recorder for the per-frame inputs PitLanePenalty's acUpdate uses.
+
+Records are fixed-size and packed into a preallocated buffer. A full buffer, or one flushed on a lap boundary, is
+handed to a background PLPIOWorker which compresses it and appends it to the recording, so the render thread never
+waits for the disk.
+
+File layout: a RECORDING_HEADER (magic, version, record size), an INFO_HEADER (size) followed by the RecordingInfo
+as UTF-8 JSON, then blocks of records. Each block is a BLOCK_HEADER (compressed size, record count) followed by the
+zlib-compressed records. Version 1 recordings (without normalizedCarPosition) and version 2 recordings (without the
+RecordingInfo) can still be read.
+"""
+import collections
+import json
+import os
+import struct
+import zlib
+
+import PLPlib.plp_io
+
+# The recorded channels, in record order.
+RECORD_CHANNELS = (
+    'deltaT',
+    'speed',
+    'worldX',
+    'worldY',
+    'worldZ',
+    'tyresOut',
+    'dirtFL',
+    'dirtFR',
+    'dirtRL',
+    'dirtRR',
+    'isInPitLane',
+    'isInPit',
+    'session',
+    'completedLaps',
+    'sessionTimeLeft',
+    'lapTime',
+    'fuel',
+    'normalizedCarPosition',
+)
+RecordedFrame = collections.namedtuple('RecordedFrame', RECORD_CHANNELS)
+
+# What a recording was made with, so it can be replayed the same way: the car, track and server names, the compiled
+# settings (a dict of PLPlib/plp_config.py's PLPSettings) and the max speed of the car on the track when the recording
+# started.
+RecordingInfo = collections.namedtuple('RecordingInfo', 'car track trackConfiguration server settings maxSpeed')
+
+RECORD = struct.Struct('<5fb4fBBbHfiff')
+RECORDING_MAGIC = b'PLPT'
+RECORDING_VERSION = 3
+# Version 1 records, without normalizedCarPosition (read as 0).
+RECORD_V1 = struct.Struct('<5fb4fBBbHfif')
+RECORDING_HEADER = struct.Struct('<4sHH')
+INFO_HEADER = struct.Struct('<I')
+BLOCK_HEADER = struct.Struct('<II')
+RECORDING_EXTENSION = '.plpt'
+
+# Default number of records buffered before they are handed to the writer thread (about 30s at 144 frames/s).
+DEFAULT_CAPACITY = 4096
+
+
+class PLPRecorder:
+    """Records frames into a ring of fixed-size records, flushed to path in large blocks by a background thread.
+
+    The blocks are written by worker (a PLPIOWorker shared with other writers), or by the recorder's own worker. info
+    (a RecordingInfo) is written at the start of the recording.
+    """
+
+    def __init__(self, path, info, capacity=DEFAULT_CAPACITY, worker=None):
+        self.path = path
+        self.info = info
+        self._capacity = capacity
+        self._buffer = bytearray(capacity * RECORD.size)
+        self._used = 0
+        # Time from frames that weren't recorded, added to the next record's deltaT.
+        self._pendingDeltaT = 0.0
+        self.records = 0
+        self.blocks = 0
+        self.bytesWritten = 0
+
+        # Blocks waiting to be written, and the recording they're appended to (both used by the worker).
+        self._blocks = collections.deque()
+        self._recording = None
+        self._ownWorker = worker is None
+        self._worker = PLPlib.plp_io.PLPIOWorker("PLP recorder") if worker is None else worker
+
+    # Account for a frame that isn't recorded, so replayed time still adds up.
+    def addTime(self, deltaT):
+        self._pendingDeltaT += deltaT
+
+    def record(self, deltaT, speed, position, frame, lapTime):
+        dfl, dfr, drl, drr = frame.tyreDirtyLevel
+        RECORD.pack_into(self._buffer, self._used * RECORD.size,
+                         deltaT + self._pendingDeltaT, speed, position[0], position[1], position[2],
+                         frame.numberOfTyresOut, dfl, dfr, drl, drr, frame.isInPitLane, frame.isInPit, frame.session,
+                         frame.completedLaps, frame.sessionTimeLeft, int(lapTime), frame.fuel,
+                         frame.normalizedCarPosition)
+        self._pendingDeltaT = 0.0
+        self._used += 1
+        self.records += 1
+        if self._used == self._capacity:
+            self.flush()
+
+    # Hand the buffered records to the worker.
+    def flush(self):
+        if self._used:
+            self._blocks.append((self._used, bytes(self._buffer[:self._used * RECORD.size])))
+            self._used = 0
+            # One write job waiting to run writes all the blocks handed over by then.
+            self._worker.submit(self._writeBlocks, key=self)
+
+    # Flush, and close the recording once everything is written. With its own worker, wait for that to happen.
+    def close(self):
+        self.flush()
+        self._worker.submit(self._closeRecording)
+        if self._ownWorker:
+            self._worker.close()
+
+    def _writeBlocks(self):
+        while self._blocks:
+            count, records = self._blocks.popleft()
+            if self._recording is None:
+                self._recording = _openRecording(self.path, self.info)
+            data = zlib.compress(records)
+            self._recording.write(BLOCK_HEADER.pack(len(data), count))
+            self._recording.write(data)
+            self._recording.flush()
+            self.blocks += 1
+            self.bytesWritten += BLOCK_HEADER.size + len(data)
+
+    def _closeRecording(self):
+        if self._recording is not None:
+            self._recording.close()
+            self._recording = None
+
+
+def _openRecording(path, info):
+    folder = os.path.dirname(path)
+    if folder and not os.path.isdir(folder):
+        os.makedirs(folder)
+    recording = open(path, 'ab')
+    if recording.tell() == 0:
+        data = json.dumps(info._asdict(), sort_keys=True).encode('utf-8')
+        recording.write(RECORDING_HEADER.pack(RECORDING_MAGIC, RECORDING_VERSION, RECORD.size))
+        recording.write(INFO_HEADER.pack(len(data)))
+        recording.write(data)
+    return recording
+
+
+# Read the headers of a recording, up to its first block. Returns the record format, the values of the channels
+# missing from it, and the RecordingInfo (None in recordings made before it was added).
+def _readHeaders(recording, path):
+    magic, version, recordSize = RECORDING_HEADER.unpack(recording.read(RECORDING_HEADER.size))
+    if magic == RECORDING_MAGIC and version == RECORDING_VERSION and recordSize == RECORD.size:
+        size, = INFO_HEADER.unpack(recording.read(INFO_HEADER.size))
+        info = RecordingInfo(**json.loads(recording.read(size).decode('utf-8')))
+        return RECORD, (), info
+    if magic == RECORDING_MAGIC and version == 2 and recordSize == RECORD.size:
+        return RECORD, (), None
+    if magic == RECORDING_MAGIC and version == 1 and recordSize == RECORD_V1.size:
+        return RECORD_V1, (0.0,), None
+    raise ValueError("{0} is not a version 1 to {1} PLP recording".format(path, RECORDING_VERSION))
+
+
+# The RecordingInfo of a recording, or None if it was made before it was added.
+def readRecordingInfo(path):
+    with open(path, 'rb') as recording:
+        return _readHeaders(recording, path)[2]
+
+
+# Read a recording into a list of RecordedFrames.
+def readRecording(path):
+    frames = []
+    with open(path, 'rb') as recording:
+        record, missing, info = _readHeaders(recording, path)
+        while True:
+            blockHeader = recording.read(BLOCK_HEADER.size)
+            if len(blockHeader) < BLOCK_HEADER.size:
+                break
+            size, count = BLOCK_HEADER.unpack(blockHeader)
+            records = zlib.decompress(recording.read(size))
+            for index in range(count):
+                frames.append(RecordedFrame(*record.unpack_from(records, index * record.size) + missing))
+    return frames
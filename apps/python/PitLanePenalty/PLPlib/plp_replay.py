@@ -0,0 +1,375 @@
+"""
+Headless replay of recorded telemetry through PitLanePenalty.acUpdate.
+
+The ac and acsys modules are replaced with stubs, the shared memory pages are written with a PLPPacketWriter on an
+in-process backend, and acUpdate is called once per recorded frame as fast as possible. The chat messages PLP sends
+(warnings, penalties, pit stops) are collected along with per-frame timings.
+
+Recordings are either made in-game by PLPRecorder (.plpt), or CSV files with a header row naming the
+REPLAY_CHANNELS columns (normalizedCarPosition may be left out, and is then 0). A recording made in-game is replayed
+with the car, track, server name, settings and max speed it was made with (see recordingOptions()).
+
+Usage::
+
+    python PLPlib/plp_replay.py race1.plpt race2.csv ...
+"""
+import collections
+import csv
+import importlib
+import os
+import sys
+import time
+import tracemalloc
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The folder AC runs apps from, which PitLanePenalty's "apps/python/PitLanePenalty/..." paths are relative to.
+AC_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(APP_DIR)))
+
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+import PLPlib.plp_config
+import PLPlib.plp_recorder
+import PLPlib.plp_sim_info
+
+# The per-frame inputs PitLanePenalty reads, in recording order.
+REPLAY_CHANNELS = PLPlib.plp_recorder.RECORD_CHANNELS
+ReplayFrame = PLPlib.plp_recorder.RecordedFrame
+
+_INT_CHANNELS = frozenset(('tyresOut', 'isInPitLane', 'isInPit', 'session', 'completedLaps', 'lapTime'))
+# Channels added after the first recording format, and their values in recordings without them.
+_OPTIONAL_CHANNELS = {'normalizedCarPosition': 0.0}
+
+# Settings every replay starts with: replays shouldn't resume from, or add to, the game's penalty journal, or record
+# the replayed frames.
+REPLAY_SETTINGS = {'JOURNAL_PENALTIES': False, 'RECORD_TELEMETRY': False}
+
+# A chat message sent by PLP during a replay, at gameTime seconds into the replay.
+ReplayEvent = collections.namedtuple('ReplayEvent', 'frame gameTime message')
+
+
+class ACStub:
+    """Stands in for AC's ac module. Controls are plain ids, and chat messages and logs are collected."""
+
+    def __init__(self, driverName="Replay Driver", serverName="", carName="car", trackName="track",
+                 trackConfiguration=""):
+        self.driverName = driverName
+        self.serverName = serverName
+        self.carName = carName
+        self.trackName = trackName
+        self.trackConfiguration = trackConfiguration
+        self.carState = {}
+        self.texts = {}
+        self.positions = {}
+        self.chatMessages = []
+        self.logLines = []
+        self._nextControl = 1
+
+    def _newControl(self, *args):
+        control = self._nextControl
+        self._nextControl += 1
+        return control
+
+    newApp = addLabel = addButton = _newControl
+
+    def getCarState(self, car, info):
+        return self.carState[info]
+
+    def getDriverName(self, car):
+        return self.driverName
+
+    def getServerName(self):
+        return self.serverName
+
+    def getCarName(self, car):
+        return self.carName
+
+    def getTrackName(self, car):
+        return self.trackName
+
+    def getTrackConfiguration(self, car):
+        return self.trackConfiguration
+
+    def setText(self, control, text):
+        self.texts[control] = text
+
+    def getText(self, control):
+        return self.texts.get(control, "")
+
+    def setPosition(self, control, x, y):
+        self.positions[control] = (x, y)
+
+    def getPosition(self, control):
+        return self.positions.get(control, (0, 0))
+
+    def sendChatMessage(self, message):
+        self.chatMessages.append(message)
+
+    def log(self, message):
+        self.logLines.append(message)
+
+    console = log
+
+    # Everything else (setSize, setVisible, glQuad, add...Listener, ...) has no effect.
+    def __getattr__(self, name):
+        return _noOp
+
+
+def _noOp(*args):
+    return 1
+
+
+class ACSysStub:
+    """Stands in for AC's acsys module."""
+
+    class CS:
+        SpeedKMH = 'SpeedKMH'
+        WorldPosition = 'WorldPosition'
+        LapTime = 'LapTime'
+
+
+# Read a CSV recording into a list of ReplayFrames.
+def readCsvRecording(path):
+    frames = []
+    with open(path, newline='') as recording:
+        for row in csv.DictReader(recording):
+            for channel, default in _OPTIONAL_CHANNELS.items():
+                row.setdefault(channel, default)
+            frames.append(ReplayFrame(*[int(float(row[c])) if c in _INT_CHANNELS else float(row[c])
+                                        for c in REPLAY_CHANNELS]))
+    return frames
+
+
+# Read a CSV recording, or a binary one made by PLPRecorder.
+def readRecording(path):
+    if path.endswith(PLPlib.plp_recorder.RECORDING_EXTENSION):
+        return PLPlib.plp_recorder.readRecording(path)
+    return readCsvRecording(path)
+
+
+# The PLPReplay arguments that replay the recording at path with the car, track, server name, settings and max speed
+# it was made with, as far as the recording has them.
+def recordingOptions(path):
+    if not path.endswith(PLPlib.plp_recorder.RECORDING_EXTENSION):
+        return {}
+    info = PLPlib.plp_recorder.readRecordingInfo(path)
+    if info is None:
+        return {}
+    return {
+        'config': info.settings,
+        'settings': {'maxSpeed': info.maxSpeed},
+        'carName': info.car,
+        'trackName': info.track,
+        'trackConfiguration': info.trackConfiguration,
+        'serverName': info.server,
+    }
+
+
+def _percentile(sortedValues, fraction):
+    if not sortedValues:
+        return 0
+    return sortedValues[min(len(sortedValues) - 1, int(len(sortedValues) * fraction))]
+
+
+# The blocks in a tracemalloc snapshot, leaving out those allocated by the replay (its lists of timings and events, and
+# the stubs' lists of chat messages and logs).
+def _allocatedBlocks(snapshot):
+    snapshot = snapshot.filter_traces((tracemalloc.Filter(False, __file__),
+                                       tracemalloc.Filter(False, tracemalloc.__file__)))
+    return sum(statistic.count for statistic in snapshot.statistics('filename'))
+
+
+# The most memory (in bytes) allocated at once while function(*args) ran, over what was allocated before it. Needs
+# tracemalloc to be tracing.
+def _peakAllocation(function, *args):
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    function(*args)
+    return tracemalloc.get_traced_memory()[1] - before
+
+
+class ReplayResult:
+    """Timings and the chat messages issued for one replayed recording."""
+
+    def __init__(self, name, frameTimes, events, blocks=None, allocatedBytes=None):
+        self.name = name
+        self.frames = len(frameTimes)
+        self.elapsed = sum(frameTimes)
+        self.events = events
+        frameTimes = sorted(frameTimes)
+        self.p50 = _percentile(frameTimes, 0.50)
+        self.p95 = _percentile(frameTimes, 0.95)
+        self.p99 = _percentile(frameTimes, 0.99)
+        self.max = frameTimes[-1] if frameTimes else 0
+        # The memory blocks acUpdate allocated and left allocated, and the total over the frames of the most memory
+        # it allocated at once in a frame (temporary objects too), in bytes, if the replay traced them.
+        self.blocks = blocks
+        self.allocatedBytes = allocatedBytes
+
+    @property
+    def framesPerSecond(self):
+        return self.frames / self.elapsed if self.elapsed else 0
+
+    def report(self):
+        lines = [
+            "{0}: {1} frames, {2:.0f} frames/s, latency p50 {3:.1f}us p95 {4:.1f}us p99 {5:.1f}us max {6:.1f}us".format(
+                self.name, self.frames, self.framesPerSecond, self.p50 * 1e6, self.p95 * 1e6, self.p99 * 1e6,
+                self.max * 1e6)]
+        for event in self.events:
+            lines.append("  {0:9.3f}s frame {1}: {2}".format(event.gameTime, event.frame, event.message))
+        return "\n".join(lines)
+
+
+class PLPReplay:
+    """Loads a fresh copy of PitLanePenalty against stub ac/acsys modules and replays frames through acUpdate.
+
+    settings are module globals (e.g. {'USE_START_LIGHTS': False}) set as soon as readConfig has run, before acMain
+    creates the controls, to replay with a known configuration rather than the one for today. config is a dict of
+    compiled settings (e.g. a recording's) that readConfig uses instead of the ones in the config files, so the
+    settings readConfig works out from them are the same too.
+    """
+
+    def __init__(self, settings=None, config=None, **acOptions):
+        self.ac = ACStub(**acOptions)
+        self.backend = PLPlib.plp_sim_info.PLPAnonymousMappingBackend()
+        self.writer = PLPlib.plp_sim_info.PLPPacketWriter(self.backend)
+        self.settings = dict(REPLAY_SETTINGS)
+        self.settings.update(settings or {})
+        self.config = config
+        self.app = None
+
+    def _loadApp(self):
+        sys.modules['ac'] = self.ac
+        sys.modules['acsys'] = ACSysStub
+        # time.clock was removed in Python 3.8; AC's Python still has it.
+        if not hasattr(time, 'clock'):
+            time.clock = time.perf_counter
+
+        # PitLanePenalty acquires the shared reader when it is imported, so create it on our backend first.
+        PLPlib.plp_sim_info.acquire(self.backend)
+        sys.modules.pop('PitLanePenalty', None)
+        self.app = importlib.import_module('PitLanePenalty')
+        if not hasattr(self.app, 'Resolution'):
+            # The screen resolution comes from Windows.
+            self.app.Resolution = 1920
+            self.app.ResolutionHeight = 1080
+
+    def _writeFrame(self, frame):
+        physics = self.writer.physics
+        graphics = self.writer.graphics
+        physics.speedKmh = frame.speed
+        physics.fuel = frame.fuel
+        physics.numberOfTyresOut = frame.tyresOut
+        physics.tyreDirtyLevel[0] = frame.dirtFL
+        physics.tyreDirtyLevel[1] = frame.dirtFR
+        physics.tyreDirtyLevel[2] = frame.dirtRL
+        physics.tyreDirtyLevel[3] = frame.dirtRR
+        graphics.isInPitLane = frame.isInPitLane
+        graphics.isInPit = frame.isInPit
+        graphics.session = frame.session
+        graphics.completedLaps = frame.completedLaps
+        graphics.sessionTimeLeft = frame.sessionTimeLeft
+        graphics.normalizedCarPosition = frame.normalizedCarPosition
+        self.writer.publish()
+
+        carState = self.ac.carState
+        carState['SpeedKMH'] = frame.speed
+        carState['WorldPosition'] = (frame.worldX, frame.worldY, frame.worldZ)
+        carState['LapTime'] = frame.lapTime
+
+    # Wrap loadConfig so that readConfig uses self.config's settings (those PLPSettings still has) instead of the config
+    # files'.
+    def _loadConfigWithConfig(self, loadConfig):
+        def loadConfigWithConfig(*args, **kwargs):
+            config = loadConfig(*args, **kwargs)
+            settings = dict((name, value) for name, value in self.config.items()
+                            if name in PLPlib.plp_config.PLPSettings._fields)
+            return config._replace(settings=config.settings._replace(**settings))
+        return loadConfigWithConfig
+
+    # Wrap the app's readConfig so that our settings override the config file's.
+    def _readConfigWithSettings(self, readConfig):
+        def readConfigWithSettings():
+            result = readConfig()
+            for setting, value in self.settings.items():
+                setattr(self.app, setting, value)
+            return result
+        return readConfigWithSettings
+
+    # Replay frames through a fresh copy of the app, and return a ReplayResult. With traceMemory, the memory blocks
+    # allocated by acUpdate (not by loading the app, or by the replay itself) and still allocated at the end are
+    # counted with tracemalloc, and so is the most memory each acUpdate call allocated at once, which makes the frames
+    # much slower.
+    def run(self, frames, name="replay", traceMemory=False):
+        previousDirectory = os.getcwd()
+        os.chdir(AC_ROOT)
+        loadConfig = PLPlib.plp_config.loadConfig
+        if self.config is not None:
+            PLPlib.plp_config.loadConfig = self._loadConfigWithConfig(loadConfig)
+        try:
+            if frames:
+                self._writeFrame(frames[0])
+            self._loadApp()
+            app = self.app
+            app.readConfig = self._readConfigWithSettings(app.readConfig)
+            # Replays shouldn't write the game's config cache.
+            app.CONFIG_CACHE_PATH = None
+            app.acMain("replay")
+
+            chatMessages = self.ac.chatMessages
+            events = []
+            frameTimes = []
+            acUpdate = app.acUpdate
+            clock = time.perf_counter
+            allocatedBytes = 0
+            if traceMemory:
+                tracemalloc.start()
+                # What measuring a call allocates itself.
+                overhead = min(_peakAllocation(_noOp, 0) for _ in range(10))
+            for index, frame in enumerate(frames):
+                self._writeFrame(frame)
+                sent = len(chatMessages)
+                start = clock()
+                if traceMemory:
+                    allocatedBytes += max(0, _peakAllocation(acUpdate, frame.deltaT) - overhead)
+                else:
+                    acUpdate(frame.deltaT)
+                frameTimes.append(clock() - start)
+                for message in chatMessages[sent:]:
+                    events.append(ReplayEvent(index, app.gameTime, message))
+            blocks = None
+            if traceMemory:
+                blocks = _allocatedBlocks(tracemalloc.take_snapshot())
+            return ReplayResult(name, frameTimes, events, blocks, allocatedBytes if traceMemory else None)
+        finally:
+            if traceMemory:
+                tracemalloc.stop()
+            PLPlib.plp_config.loadConfig = loadConfig
+            os.chdir(previousDirectory)
+            if self.app is not None:
+                # Release the app's reader as well as ours. acShutdown isn't called, so the replay doesn't save the
+                # max speed.
+                PLPlib.plp_sim_info.release()
+                PLPlib.plp_sim_info.release()
+
+    def close(self):
+        self.writer.close()
+        self.backend.close_all()
+
+
+def main(argv):
+    if not argv:
+        print(__doc__)
+        return 2
+
+    for path in argv:
+        replay = PLPReplay(**recordingOptions(path))
+        try:
+            print(replay.run(readRecording(path), os.path.basename(path)).report())
+        finally:
+            replay.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
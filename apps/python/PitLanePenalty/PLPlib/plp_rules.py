@@ -0,0 +1,54 @@
+"""
+Event-driven dispatch for the rules PitLanePenalty's acUpdate runs each frame.
+
+Each frame, the app works out which events (bit flags such as "entered pit lane" or "lap changed") apply to it, and
+dispatch() calls, in the order they were registered, only the rules subscribed to at least one of those events. On the
+common frame where the car is just driving, most rules are skipped without being called. Only a handful of event
+combinations happen in practice, so the rules to call for each combination are worked out once and cached.
+"""
+
+
+class PLPRuleEngine:
+    def __init__(self, stageOffset=0):
+        self.names = ()
+        self._rules = []
+        # events -> tuple of (rule, index) to call on frames with those events.
+        self._plans = {}
+        # Optional PLPStageProbes; rule n is timed as stage stageOffset + n.
+        self.probes = None
+        self.stageOffset = stageOffset
+        # Frames dispatched, and rule calls made.
+        self.dispatches = 0
+        self.calls = 0
+
+    # Add rule (a function with no arguments) to the end of the rules, to run on frames with any of the events in mask.
+    # A rule that returns True stops the rest of the rules running on that frame.
+    def register(self, name, mask, rule):
+        self._rules.append((mask, rule))
+        self.names += (name,)
+        self._plans = {}
+
+    def _plan(self, events):
+        plan = tuple((rule, index) for index, (mask, rule) in enumerate(self._rules) if mask & events)
+        self._plans[events] = plan
+        return plan
+
+    # Run the rules subscribed to events. Returns False if a rule stopped the frame.
+    def dispatch(self, events):
+        plan = self._plans.get(events)
+        if plan is None:
+            plan = self._plan(events)
+        self.dispatches += 1
+        probes = self.probes
+        for rule, index in plan:
+            self.calls += 1
+            stop = rule()
+            if probes is not None:
+                probes.mark(self.stageOffset + index)
+            if stop:
+                return False
+        return True
+
+    # Rule calls not made, because none of the rule's events happened or an earlier rule stopped the frame.
+    def skipped(self):
+        return self.dispatches * len(self._rules) - self.calls
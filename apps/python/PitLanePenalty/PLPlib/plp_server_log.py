@@ -0,0 +1,233 @@
+"""
+Tables of the cuts, penalties and pit stops in AC server logs, from the chat messages PitLanePenalty sends.
+
+The logs are read a line at a time (gzipped logs too) through a pipeline of generators, so memory use doesn't grow
+with the size of the logs: lines -> the PLP messages in them (decoded with plp_protocol's PLPDecoder, wherever in the
+line they start, so any server log format will do) -> a PLPLogTally of counts per driver, per driver and lap of each
+session, and per session. Several logs can be read at once by separate processes (--jobs), and their tallies added
+together.
+
+A new session starts when the session type in the messages' records changes, or when the seconds left in the session
+go back up by more than SESSION_RESTART_SECONDS (a session of the same type following, or a restart). Messages
+without a record (from versions of the app before 1.28) are counted in the session they are in the middle of. Team
+chat messages don't say which driver sent them, so are counted for "Team <team> car <car>" (or "Team <team>" if they
+don't name the car).
+
+Usage::
+
+    python PLPlib/plp_server_log.py [--jobs N] [--csv FOLDER] log [log.gz ...]
+"""
+import argparse
+import collections
+import csv
+import gzip
+import os
+import re
+import sys
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+import PLPlib.plp_protocol
+
+# The counts kept for each driver, lap and session.
+COLUMNS = ('cuts', 'qual cuts', 'drive throughs', 'time penalties', 'penalty seconds', 'taken', 're-takes', 'ignored',
+           'pit stops', 'fuel')
+
+# The column each event is counted in, and whether the count goes up by the message's value (e.g. litres of fuel)
+# rather than by one.
+_EVENT_COLUMNS = {
+    'CT': (('cuts', False),),
+    'QC': (('qual cuts', False),),
+    'DC': (('drive throughs', False),),
+    'DS': (('drive throughs', False),),
+    'DJ': (('drive throughs', False),),
+    'TC': (('time penalties', False), ('penalty seconds', True)),
+    'TS': (('time penalties', False), ('penalty seconds', True)),
+    'TJ': (('time penalties', False), ('penalty seconds', True)),
+    'TN': (('taken', False),),
+    'RT': (('re-takes', False),),
+    'IG': (('ignored', False),),
+    'PT': (('pit stops', False),),
+    'FA': (('fuel', True),),
+}
+
+SESSION_NAMES = {0: "practice", 1: "qualifying", 2: "race", 3: "hotlap", 4: "time attack", 5: "drift", 6: "drag"}
+
+# How far the seconds left in the session can go back up without a new session starting. Messages queued by the app
+# are sent a little after their record was made, so aren't always in order in the log.
+SESSION_RESTART_SECONDS = 60
+
+_PREFIX = re.compile("|".join(re.escape(prefix) for prefix in (
+    PLPlib.plp_protocol.CHAT_PREFIX, PLPlib.plp_protocol.TEAM_CHAT_PREFIX, PLPlib.plp_protocol.LOG_PREFIX)))
+
+
+class PLPLogTally:
+    def __init__(self):
+        # driver -> Counter, (log, session number, driver, lap) -> Counter and (log, session number, session type) ->
+        # Counter, of COLUMNS.
+        self.drivers = {}
+        self.laps = {}
+        self.sessions = {}
+        self.lines = 0
+        self.messages = 0
+        # Messages decoded from their record, from their text, and with a record that couldn't be read.
+        self.decoded = 0
+        self.legacy = 0
+        self.corrupt = 0
+
+    # Count message (a PLPMessage), sent by driver in session (log, session number, session type).
+    def add(self, message, driver, session):
+        columns = _EVENT_COLUMNS.get(message.event)
+        if columns is None:
+            return
+        for counts in (self.drivers.setdefault(driver, collections.Counter()),
+                       self.laps.setdefault((session[0], session[1], driver, message.lap), collections.Counter()),
+                       self.sessions.setdefault(session, collections.Counter())):
+            for column, byValue in columns:
+                counts[column] += (message.value or 0) if byValue else 1
+
+    # Add the counts in other (another PLPLogTally) to these.
+    def merge(self, other):
+        for mine, theirs in ((self.drivers, other.drivers), (self.laps, other.laps), (self.sessions, other.sessions)):
+            for key, counts in theirs.items():
+                mine.setdefault(key, collections.Counter()).update(counts)
+        self.lines += other.lines
+        self.messages += other.messages
+        self.decoded += other.decoded
+        self.legacy += other.legacy
+        self.corrupt += other.corrupt
+
+    # The tables, as (name, header, rows).
+    def tables(self):
+        def row(key, counts):
+            return key + tuple(counts.get(column, 0) for column in COLUMNS)
+
+        return (
+            ("drivers", ('driver',) + COLUMNS,
+             [row((driver,), self.drivers[driver]) for driver in sorted(self.drivers)]),
+            ("laps", ('log', 'session', 'driver', 'lap') + COLUMNS,
+             [row((log, number, driver, "" if lap is None else lap), self.laps[(log, number, driver, lap)])
+              for log, number, driver, lap in sorted(self.laps, key=lambda key: key[:3] + (key[3] or 0,))]),
+            ("sessions", ('log', 'session', 'type') + COLUMNS,
+             [row((log, number, SESSION_NAMES.get(sessionType, "?")), self.sessions[(log, number, sessionType)])
+              for log, number, sessionType in sorted(self.sessions, key=lambda key: (key[0], key[1]))]),
+        )
+
+
+# The lines of the log at path (gzipped if its name ends with .gz), without their line endings.
+def readLines(path):
+    if path.endswith('.gz'):
+        logFile = gzip.open(path, 'rt', encoding='utf-8', errors='replace')
+    else:
+        logFile = open(path, encoding='utf-8', errors='replace')
+    with logFile:
+        for line in logFile:
+            yield line.rstrip('\r\n')
+
+
+# The PLP messages in lines, as PLPMessages, decoded with decoder. tally counts the lines read.
+def plpMessages(lines, decoder, tally):
+    for line in lines:
+        tally.lines += 1
+        match = _PREFIX.search(line)
+        if match is not None:
+            message = decoder.decode(line[match.start():])
+            if message is not None:
+                yield message
+
+
+# The driver who sent message.
+def messageDriver(message):
+    if message.author is not None:
+        return message.author
+    if message.channel == 'team':
+        if message.car is None:
+            return "Team {0}".format(message.team)
+        return "Team {0} car {1}".format(message.team, message.car)
+    return "?"
+
+
+# Tally the PLP messages in the log at path.
+def tallyLog(path):
+    tally = PLPLogTally()
+    decoder = PLPlib.plp_protocol.PLPDecoder()
+    log = os.path.basename(path)
+    number = 1
+    sessionType = None
+    # The fewest seconds left in the session seen so far.
+    sessionSeconds = None
+    for message in plpMessages(readLines(path), decoder, tally):
+        tally.messages += 1
+        if message.session is not None:
+            if message.session != sessionType or (message.seconds is not None and sessionSeconds is not None and
+                                                  message.seconds > sessionSeconds + SESSION_RESTART_SECONDS):
+                if sessionType is not None:
+                    number += 1
+                sessionType = message.session
+                sessionSeconds = None
+            if message.seconds is not None and (sessionSeconds is None or message.seconds < sessionSeconds):
+                sessionSeconds = message.seconds
+        tally.add(message, messageDriver(message), (log, number, sessionType))
+    tally.decoded = decoder.decoded
+    tally.legacy = decoder.legacy
+    tally.corrupt = decoder.corrupt
+    return tally
+
+
+# Tally the logs at paths, using jobs processes.
+def tallyLogs(paths, jobs=1):
+    tally = PLPLogTally()
+    if jobs > 1 and len(paths) > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(min(jobs, len(paths)))
+        try:
+            for logTally in pool.imap_unordered(tallyLog, paths):
+                tally.merge(logTally)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for path in paths:
+            tally.merge(tallyLog(path))
+    return tally
+
+
+def _printTable(name, header, rows):
+    widths = [len(str(field)) for field in header]
+    for row in rows:
+        widths = [max(width, len(str(field))) for width, field in zip(widths, row)]
+    print(name)
+    for row in [header] + rows:
+        print("  ".join(str(field).rjust(width) if isinstance(field, int) else str(field).ljust(width)
+                        for width, field in zip(widths, row)).rstrip())
+    print()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Count the cuts, penalties and pit stops in AC server logs.")
+    parser.add_argument('logs', nargs='+', help="server logs (.gz for gzipped logs)")
+    parser.add_argument('--jobs', type=int, default=1, help="logs to read at once, in separate processes")
+    parser.add_argument('--csv', metavar='FOLDER', help="write the tables to drivers.csv, laps.csv and sessions.csv "
+                                                        "in FOLDER instead of printing them")
+    args = parser.parse_args(argv)
+
+    tally = tallyLogs(args.logs, args.jobs)
+    for name, header, rows in tally.tables():
+        if args.csv:
+            if not os.path.isdir(args.csv):
+                os.makedirs(args.csv)
+            with open(os.path.join(args.csv, name + ".csv"), 'w', newline='') as csvFile:
+                writer = csv.writer(csvFile)
+                writer.writerow(header)
+                writer.writerows(rows)
+        else:
+            _printTable(name, header, rows)
+    print("{0} lines, {1} PLP messages ({2} with a record, {3} without, {4} with a corrupt record)".format(
+        tally.lines, tally.messages, tally.decoded, tally.legacy - tally.corrupt, tally.corrupt))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
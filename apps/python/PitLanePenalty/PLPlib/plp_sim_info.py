@@ -16,9 +16,11 @@ some_app.py::
     import sys
     sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'DLLs'))
 
-    from sim_info import info
+    from sim_info import acquire, release
 
+    info = acquire()
     print(info.graphics.tyreCompound, info.physics.rpms, info.static.playerNick)
+    release()
 
 
 Do whatever you want with this code!
@@ -27,6 +29,9 @@ WBR, Rombik :)
 import mmap
 import functools
 import ctypes
+import os
+import struct
+import time
 from ctypes import c_int32, c_float, c_wchar, c_byte
 
 AC_STATUS = c_int32
@@ -169,43 +174,331 @@ class SPageFileStatic(ctypes.Structure):
     ]
 
 
-class PLPSimInfo:
+# struct format codes for the ctypes types a PLPFieldProjection can read.
+_STRUCT_CODES = {
+    c_int32: 'i',
+    c_float: 'f',
+    c_byte: 'b',
+}
+
+
+class PLPFieldProjection:
+    """A compact view of some of the fields of a shared memory page, read with a single struct.unpack_from().
+
+    The fields must be given in the order they appear in the page. read() returns their values as one flat tuple
+    in that order, with array fields (e.g. tyreDirtyLevel) expanded to one value per element.
+    """
+
+    def __init__(self, structure, fields):
+        self.structure = structure
+        self.fields = tuple(fields)
+
+        # Build a struct format that skips the bytes between the requested fields.
+        fmt = '='
+        position = 0
+        for field in self.fields:
+            type_spec = dict(structure._fields_)[field]
+            descriptor = getattr(structure, field)
+            if descriptor.offset < position:
+                raise ValueError("{0}.{1} is out of order or overlaps the previous field".format(
+                    structure.__name__, field))
+
+            count = 1
+            element_type = type_spec
+            if issubclass(type_spec, ctypes.Array):
+                count = type_spec._length_
+                element_type = type_spec._type_
+            if element_type not in _STRUCT_CODES:
+                raise ValueError("Can't project {0}.{1} of type {2}".format(
+                    structure.__name__, field, type_spec.__name__))
+
+            if descriptor.offset > position:
+                fmt += '{0}x'.format(descriptor.offset - position)
+            fmt += '{0}{1}'.format(count, _STRUCT_CODES[element_type]) if count > 1 else _STRUCT_CODES[element_type]
+            position = descriptor.offset + descriptor.size
+
+        self._struct = struct.Struct(fmt)
+        self.format = fmt
+        # Number of bytes from the start of the page that are read.
+        self.size = self._struct.size
+
+    def read(self, buffer):
+        return self._struct.unpack_from(buffer)
+
+
+class PLPFrame:
+    """The physics and graphics fields used by PLP, read from one shared memory packet."""
+    __slots__ = (
+        'physicsPacketId',
+        'fuel',
+        'tyreDirtyLevel',
+        'numberOfTyresOut',
+        'graphicsPacketId',
+        'session',
+        'completedLaps',
+        'sessionTimeLeft',
+        'isInPit',
+        'numberOfLaps',
+        'normalizedCarPosition',
+        'isInPitLane',
+    )
+
+
+class PLPNamedMappingBackend:
+    """The named shared memory pages published by AC. Windows only."""
+
+    def open(self, name, size):
+        return mmap.mmap(0, size, name)
+
+    def close(self, mapping):
+        mapping.close()
+
+
+class PLPFileMappingBackend:
+    """Shared memory pages backed by files in a directory, so PLP can be run without AC (e.g. on Linux).
+
+    A PLPPacketWriter on the same directory, in this or another process, plays the part of AC.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def open(self, name, size):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        path = os.path.join(self.directory, name)
+        with open(path, 'a+b') as page_file:
+            if os.path.getsize(path) < size:
+                page_file.truncate(size)
+            return mmap.mmap(page_file.fileno(), size)
+
+    def close(self, mapping):
+        mapping.close()
+
+
+class PLPAnonymousMappingBackend:
+    """Shared memory pages in anonymous memory, shared by every reader and writer in this process.
+
+    The pages live until the backend itself is closed.
+    """
+
     def __init__(self):
-        self._acpmf_physics = mmap.mmap(0, ctypes.sizeof(SPageFilePhysics), "acpmf_physics")
-        self._acpmf_graphics = mmap.mmap(0, ctypes.sizeof(SPageFileGraphic), "acpmf_graphics")
-        self._acpmf_static = mmap.mmap(0, ctypes.sizeof(SPageFileStatic), "acpmf_static")
+        self._mappings = {}
+
+    def open(self, name, size):
+        if name not in self._mappings:
+            self._mappings[name] = mmap.mmap(-1, size)
+        return self._mappings[name]
+
+    def close(self, mapping):
+        pass
+
+    def close_all(self):
+        for mapping in self._mappings.values():
+            mapping.close()
+        self._mappings = {}
+
+
+# The backend used when none is given. Setting PLP_SHARED_MEMORY_DIR reads the pages from files in that directory
+# instead of from AC.
+def default_backend():
+    directory = os.environ.get('PLP_SHARED_MEMORY_DIR')
+    if directory:
+        return PLPFileMappingBackend(directory)
+    return PLPNamedMappingBackend()
+
+
+class PLPSimInfo:
+    # The fields read by snapshot(). packetId must come first, for consistent reads.
+    PHYSICS_PROJECTION = PLPFieldProjection(SPageFilePhysics, (
+        'packetId',
+        'fuel',
+        'tyreDirtyLevel',
+        'numberOfTyresOut',
+    ))
+    GRAPHICS_PROJECTION = PLPFieldProjection(SPageFileGraphic, (
+        'packetId',
+        'session',
+        'completedLaps',
+        'sessionTimeLeft',
+        'isInPit',
+        'numberOfLaps',
+        'normalizedCarPosition',
+        'isInPitLane',
+    ))
+    _PACKET_ID = struct.Struct('=i')
+
+    def __init__(self, backend=None):
+        self._backend = backend if backend is not None else default_backend()
+        self._acpmf_physics = self._backend.open("acpmf_physics", ctypes.sizeof(SPageFilePhysics))
+        self._acpmf_graphics = self._backend.open("acpmf_graphics", ctypes.sizeof(SPageFileGraphic))
         self.physics = SPageFilePhysics.from_buffer(self._acpmf_physics)
         self.graphics = SPageFileGraphic.from_buffer(self._acpmf_graphics)
-        self.static = SPageFileStatic.from_buffer(self._acpmf_static)
+        # acpmf_static is only mapped when the static page is first used.
+        self._acpmf_static = None
+        self._static = None
+
+        # AC writes the pages while we read them. With consistent reads on, a page read is retried (up to
+        # max_read_attempts times) if its packetId changed while it was being read, like a seqlock reader.
+        self.consistent_reads = True
+        self.max_read_attempts = 3
+        # Page reads made, retries because AC wrote a page during the read, and reads that were still torn
+        # after max_read_attempts.
+        self.page_reads = 0
+        self.read_retries = 0
+        self.torn_reads = 0
+
+    # Read the projected fields from a mapped page.
+    def _read_page(self, mapping, projection):
+        self.page_reads += 1
+        if not self.consistent_reads:
+            return projection.read(mapping)
+
+        for attempt in range(self.max_read_attempts):
+            if attempt:
+                self.read_retries += 1
+            values = projection.read(mapping)
+            if values[0] == self._PACKET_ID.unpack_from(mapping)[0]:
+                return values
+        self.torn_reads += 1
+        return values
+
+    # Read the physics and graphics fields PLP uses, and return them as a PLPFrame.
+    # Each page is decoded with one struct.unpack_from(), so all of its fields come from the same packet, and we
+    # avoid going through the ctypes descriptors on the live mapping for every access.
+    def snapshot(self):
+        frame = PLPFrame()
+        (frame.physicsPacketId, frame.fuel, dfl, dfr, drl, drr,
+         frame.numberOfTyresOut) = self._read_page(self._acpmf_physics, self.PHYSICS_PROJECTION)
+        frame.tyreDirtyLevel = (dfl, dfr, drl, drr)
+        (frame.graphicsPacketId, frame.session, frame.completedLaps, frame.sessionTimeLeft, frame.isInPit,
+         frame.numberOfLaps, frame.normalizedCarPosition,
+         frame.isInPitLane) = self._read_page(self._acpmf_graphics, self.GRAPHICS_PROJECTION)
+        return frame
+
+    @property
+    def static(self):
+        if self._static is None:
+            self._acpmf_static = self._backend.open("acpmf_static", ctypes.sizeof(SPageFileStatic))
+            self._static = SPageFileStatic.from_buffer(self._acpmf_static)
+        return self._static
 
     def close(self):
-        self._acpmf_physics.close()
-        self._acpmf_graphics.close()
-        self._acpmf_static.close()
+        # The structures must be released before their mappings can be closed.
+        self.physics = None
+        self.graphics = None
+        self._static = None
+        for mapping in self._acpmf_physics, self._acpmf_graphics, self._acpmf_static:
+            if mapping is not None:
+                self._backend.close(mapping)
+        self._acpmf_physics = None
+        self._acpmf_graphics = None
+        self._acpmf_static = None
 
     def __del__(self):
-        self.close()
+        if getattr(self, '_acpmf_physics', None) is not None:
+            self.close()
+
+
+class PLPPacketWriter:
+    """Writes packets into the shared memory pages of a backend, the way AC does, for headless runs and load tests.
+
+    Set fields on physics, graphics and static, then publish() to bump the packet ids.
+    """
+
+    def __init__(self, backend):
+        self._backend = backend
+        self._acpmf_physics = backend.open("acpmf_physics", ctypes.sizeof(SPageFilePhysics))
+        self._acpmf_graphics = backend.open("acpmf_graphics", ctypes.sizeof(SPageFileGraphic))
+        self._acpmf_static = backend.open("acpmf_static", ctypes.sizeof(SPageFileStatic))
+        self.physics = SPageFilePhysics.from_buffer(self._acpmf_physics)
+        self.graphics = SPageFileGraphic.from_buffer(self._acpmf_graphics)
+        self.static = SPageFileStatic.from_buffer(self._acpmf_static)
+        self.packets_published = 0
+
+    # AC bumps packetId after writing the rest of the page.
+    def publish(self, physics=True, graphics=True):
+        if physics:
+            self.physics.packetId += 1
+        if graphics:
+            self.graphics.packetId += 1
+        self.packets_published += 1
+
+    # Publish count packets at rate packets per second, calling update(writer, index) to fill in each one first.
+    # A rate of 0 publishes as fast as possible.
+    def stream(self, count, rate, update=None):
+        interval = 1.0 / rate if rate else 0
+        next_time = time.perf_counter()
+        for index in range(count):
+            if update is not None:
+                update(self, index)
+            self.publish()
+            if interval:
+                next_time += interval
+                delay = next_time - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+    def close(self):
+        self.physics = None
+        self.graphics = None
+        self.static = None
+        for mapping in self._acpmf_physics, self._acpmf_graphics, self._acpmf_static:
+            self._backend.close(mapping)
+
+
+# One PLPSimInfo is shared by everything in the process that reads the shared memory (apps, tools), so the pages
+# are only mapped once. It is created by the first acquire(), using backend if given, and closed when every
+# acquire() has been released.
+_shared_info = None
+_shared_refs = 0
+
+
+def acquire(backend=None):
+    global _shared_info, _shared_refs
+
+    if _shared_info is None:
+        _shared_info = PLPSimInfo(backend)
+    _shared_refs += 1
+    return _shared_info
+
+
+def release():
+    global _shared_info, _shared_refs
 
-info = PLPSimInfo()
+    if _shared_refs == 0:
+        return
+    _shared_refs -= 1
+    if _shared_refs == 0:
+        _shared_info.close()
+        _shared_info = None
 
 
 def demo():
     import time
 
+    info = acquire()
     for _ in range(400):
         print(info.static.track, info.graphics.tyreCompound, info.graphics.currentTime,
               info.physics.rpms, info.graphics.currentTime, info.static.maxRpm, list(info.physics.tyreWear))
         time.sleep(0.1)
+    release()
 
 
 def do_test():
-    for struct in info.static, info.graphics, info.physics:
-        print(struct.__class__.__name__)
-        for field, type_spec in struct._fields_:
-            value = getattr(struct, field)
+    info = acquire()
+    for page in info.static, info.graphics, info.physics:
+        print(page.__class__.__name__)
+        for field, type_spec in page._fields_:
+            value = getattr(page, field)
             if not isinstance(value, (str, float, int)):
                 value = list(value)
             print(" {} -> {} {}".format(field, type(value), value))
+    frame = info.snapshot()
+    print("PLPFrame")
+    for field in frame.__slots__:
+        print(" {} -> {}".format(field, getattr(frame, field)))
+    release()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,88 @@
+"""
+The speed a car reaches at each point of a lap of a track, used to judge whether a cut was made at speed.
+
+A lap is divided into bins by AC's normalizedCarPosition (0 at the start line, up to 1 at the end of the lap), and
+the envelope keeps the highest speed seen in each bin, in an array of floats. Learning a speed and looking up the
+expected speed are both an index into the array, and the memory used is fixed by the number of bins.
+
+Each car/track/config's envelope is saved in its own file: an ENVELOPE_HEADER (magic, version, bins, length of the
+names), the car, track and config names (UTF-8, tab separated), then the bins' speeds.
+"""
+import array
+import os
+import struct
+import zlib
+
+ENVELOPE_MAGIC = b'PLPE'
+ENVELOPE_VERSION = 1
+ENVELOPE_HEADER = struct.Struct('<4sHHH')
+ENVELOPE_EXTENSION = '.plpe'
+
+# Default number of bins a lap is divided into.
+DEFAULT_BINS = 1000
+
+
+def _names(car, track, trackConfiguration):
+    return "\t".join((car, track, trackConfiguration)).encode('utf-8')
+
+
+# The file the envelope for car on track (in trackConfiguration) is saved in, in folder.
+def envelopePath(folder, car, track, trackConfiguration):
+    key = zlib.crc32(_names(car, track, trackConfiguration)) & 0xffffffff
+    return os.path.join(folder, "{0:08x}{1}".format(key, ENVELOPE_EXTENSION))
+
+
+class PLPSpeedEnvelope:
+    def __init__(self, bins=DEFAULT_BINS):
+        self.bins = bins
+        self.speeds = array.array('f', [0.0]) * bins
+        # Whether a speed has been learned since the envelope was loaded or saved.
+        self.changed = False
+
+    def _bin(self, position):
+        index = int(position * self.bins)
+        if index < 0:
+            return 0
+        if index >= self.bins:
+            return self.bins - 1
+        return index
+
+    # Remember speed at position (0 to 1 around the lap) if it is the highest seen there.
+    def learn(self, position, speed):
+        index = self._bin(position)
+        if speed > self.speeds[index]:
+            self.speeds[index] = speed
+            self.changed = True
+
+    # The highest speed seen at position, or default if none has been seen there yet.
+    def expected(self, position, default):
+        speed = self.speeds[self._bin(position)]
+        return speed if speed > 0 else default
+
+    # The envelope in its file format, for car on track (in trackConfiguration).
+    def toBytes(self, car, track, trackConfiguration):
+        names = _names(car, track, trackConfiguration)
+        self.changed = False
+        return (ENVELOPE_HEADER.pack(ENVELOPE_MAGIC, ENVELOPE_VERSION, self.bins, len(names)) + names +
+                self.speeds.tobytes())
+
+    # Read the envelope saved for car on track (in trackConfiguration), or a new one if there isn't one (or the file
+    # is for another car/track, or has another number of bins).
+    @classmethod
+    def load(cls, path, car, track, trackConfiguration, bins=DEFAULT_BINS):
+        envelope = cls(bins)
+        if not os.path.isfile(path):
+            return envelope
+        with open(path, 'rb') as envelopeFile:
+            data = envelopeFile.read()
+        if len(data) < ENVELOPE_HEADER.size:
+            return envelope
+        magic, version, savedBins, namesLength = ENVELOPE_HEADER.unpack_from(data)
+        start = ENVELOPE_HEADER.size + namesLength
+        if (magic != ENVELOPE_MAGIC or version != ENVELOPE_VERSION or savedBins != bins or
+                data[ENVELOPE_HEADER.size:start] != _names(car, track, trackConfiguration) or
+                len(data) != start + bins * envelope.speeds.itemsize):
+            return envelope
+        envelope.speeds = array.array('f')
+        envelope.speeds.frombytes(data[start:])
+        return envelope
@@ -0,0 +1,142 @@
+"""
+Store of the highest speed seen for each car/track/track configuration, used to judge whether a cut was made at speed.
+
+The store is an append-only log of records, one per line, each with its own car, track and configuration fields (tab
+separated), so unlike speed.ini's keys (the three names run together) every key is unambiguous. Opening the store
+reads the log into a dict, after which a lookup is a dict lookup and saving a new speed appends one record (written
+in the background by a PLPIOWorker). A log that has grown to more than twice its live records is compacted when
+opened.
+
+The first time a store is opened, the speeds in an existing speed.ini are migrated into it as legacy records, keyed
+by the names run together (lower case, as configparser saved them). A legacy speed is found when the car/track/config
+is looked up, and is replaced by a normal record the next time the speed for that car/track/config is saved.
+"""
+import collections
+import configparser
+import os
+
+import PLPlib.plp_io
+
+STORE_HEADER = b'# PLP max speeds 1\n'
+SPEED_RECORD = 'S'
+LEGACY_RECORD = 'L'
+
+# Don't compact a log with fewer records than this, whatever the proportion of stale records.
+COMPACT_MIN_RECORDS = 64
+
+
+def _speedLine(kind, names, speed):
+    return "\t".join((kind,) + names + ("{:.1f}".format(speed),)).encode('utf-8') + b'\n'
+
+
+# Read the records in a store's log. Returns (speeds, legacySpeeds, records), with speeds keyed by (car, track,
+# config) and legacySpeeds by legacy key. A line torn by a crash, or that can't be parsed, is skipped.
+def readStore(path):
+    speeds = {}
+    legacySpeeds = {}
+    records = 0
+    with open(path, 'rb') as store:
+        if store.readline() != STORE_HEADER:
+            raise ValueError("{0} is not a PLP max speed store".format(path))
+        for line in store:
+            if not line.endswith(b'\n'):
+                break
+            fields = line[:-1].decode('utf-8', 'replace').split("\t")
+            try:
+                if fields[0] == SPEED_RECORD and len(fields) == 5:
+                    speeds[tuple(fields[1:4])] = float(fields[4])
+                elif fields[0] == LEGACY_RECORD and len(fields) == 3:
+                    legacySpeeds[fields[1]] = float(fields[2])
+                else:
+                    continue
+            except ValueError:
+                continue
+            records += 1
+    return speeds, legacySpeeds, records
+
+
+# The speeds in the [MaxSpeed] section of a speed.ini, keyed by the names run together.
+def readLegacySpeeds(path):
+    config = configparser.ConfigParser()
+    config.read(path)
+    if not config.has_section('MaxSpeed'):
+        return {}
+    speeds = {}
+    for key, value in config.items('MaxSpeed'):
+        try:
+            speeds[key] = float(value)
+        except ValueError:
+            pass
+    return speeds
+
+
+class PLPSpeedStore:
+    def __init__(self, path, legacyPath=None, worker=None):
+        self.path = path
+        self._worker = PLPlib.plp_io.PLPIOWorker("PLP speed store") if worker is None else worker
+        # Lines waiting to be appended (used by the worker).
+        self._pending = collections.deque()
+        self.migrated = 0
+        if os.path.isfile(path):
+            try:
+                self.speeds, self.legacySpeeds, records = readStore(path)
+                compact = records > COMPACT_MIN_RECORDS and records > 2 * (len(self.speeds) + len(self.legacySpeeds))
+            except ValueError:
+                # Not a store this version can read, so start a new one.
+                self.speeds, self.legacySpeeds, compact = {}, {}, True
+            if compact:
+                self._worker.submit(PLPlib.plp_io.writeFileAtomic, path, self._contents())
+        else:
+            self.speeds = {}
+            self.legacySpeeds = readLegacySpeeds(legacyPath) if legacyPath and os.path.isfile(legacyPath) else {}
+            self.migrated = len(self.legacySpeeds)
+            if self.legacySpeeds:
+                self._worker.submit(PLPlib.plp_io.writeFileAtomic, path, self._contents())
+
+    # The speed saved for car on track (in trackConfiguration), or default.
+    def get(self, car, track, trackConfiguration, default=0):
+        speed = self.speeds.get((car, track, trackConfiguration))
+        if speed is None:
+            speed = self.legacySpeeds.get((car + track + trackConfiguration).lower(), default)
+        return speed
+
+    # Save speed for car on track (in trackConfiguration), if it isn't already.
+    def put(self, car, track, trackConfiguration, speed):
+        names = (car, track, trackConfiguration)
+        speed = round(speed, 1)
+        if self.speeds.get(names) == speed:
+            return
+        self.speeds[names] = speed
+        self._pending.append(_speedLine(SPEED_RECORD, names, speed))
+        self._worker.submit(self._appendPending, key=self)
+
+    def _contents(self):
+        lines = [STORE_HEADER]
+        for names, speed in sorted(self.speeds.items()):
+            lines.append(_speedLine(SPEED_RECORD, names, speed))
+        # Legacy speeds that have been saved again under their own names are no longer needed.
+        saved = set("".join(names).lower() for names in self.speeds)
+        for key, speed in sorted(self.legacySpeeds.items()):
+            if key not in saved:
+                lines.append(_speedLine(LEGACY_RECORD, (key,), speed))
+        return b''.join(lines)
+
+    def _appendPending(self):
+        lines = []
+        while self._pending:
+            lines.append(self._pending.popleft())
+        if not lines:
+            return
+        with open(self.path, 'a+b') as store:
+            size = store.tell()
+            if size:
+                store.seek(max(0, size - 4096))
+                tail = store.read()
+                if not tail.endswith(b'\n'):
+                    # Drop a line torn by a crash, so it doesn't run into the first new one.
+                    size -= len(tail) - tail.rfind(b'\n') - 1
+                    store.truncate(size)
+            if size < len(STORE_HEADER):
+                store.truncate(0)
+                lines.insert(0, STORE_HEADER)
+            store.write(b''.join(lines))
@@ -0,0 +1,50 @@
+"""
+Timeline for PitLanePenalty's start light sequence.
+
+When the AC lights go out, start() works out when each of the PLP lights comes on, when they all go off (after being
+held for a random time) and when they are hidden. Each frame, poll() only has to compare the time with the next event.
+"""
+
+# Actions: 1 to START_LIGHT_COUNT turn that light on (counting from the left).
+START_LIGHT_COUNT = 5
+ALL_LIGHTS_OFF = 0
+HIDE_LIGHTS = -1
+
+# The sequence: seconds after the start time, whether the lights' hold time is added, and the action.
+START_LIGHT_TIMELINE = (
+    (0, False, 1),
+    (1, False, 2),
+    (2, False, 3),
+    (3, False, 4),
+    (4, False, 5),
+    (5, True, ALL_LIGHTS_OFF),
+    (6, True, HIDE_LIGHTS),
+)
+
+
+class PLPStartLightSequencer:
+    """Steps through a precomputed list of (time, action) events."""
+
+    def __init__(self, timeline=START_LIGHT_TIMELINE):
+        self.timeline = timeline
+        self.reset()
+
+    # Forget the current sequence.
+    def reset(self):
+        self.events = []
+        self._next = 0
+
+    # Work out the events of a sequence that starts at startTime, with the lights held on for holdSecs before going out.
+    def start(self, startTime, holdSecs):
+        self.events = [(startTime + seconds + (holdSecs if held else 0), action)
+                       for seconds, held, action in self.timeline]
+        self._next = 0
+
+    # The action of the next event if now is past its time (it is then done), or None.
+    def poll(self, now):
+        if self._next < len(self.events):
+            eventTime, action = self.events[self._next]
+            if now > eventTime:
+                self._next += 1
+                return action
+        return None
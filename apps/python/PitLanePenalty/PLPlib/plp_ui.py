@@ -0,0 +1,72 @@
+"""
+Retained-mode wrapper around AC's control functions (ac.setText, ac.setVisible, ...).
+
+Every call into the ac module is a native call on the render thread, and an app that sets the same text or
+visibility every frame pays for it every frame. PLPWidgetCache remembers the last value applied to each control, and
+only calls through to ac when the value changes.
+"""
+
+_UNSET = object()
+
+
+class PLPWidgetCache:
+    def __init__(self, ac):
+        self._ac = ac
+        # (attribute, control) -> last value applied.
+        self._state = {}
+        # Calls passed through to ac, and calls skipped because nothing changed.
+        self.applied = 0
+        self.suppressed = 0
+
+    # Returns True, and remembers the value, if it differs from the last one applied.
+    def _changed(self, attribute, control, value):
+        key = (attribute, control)
+        if self._state.get(key, _UNSET) == value:
+            self.suppressed += 1
+            return False
+        self._state[key] = value
+        self.applied += 1
+        return True
+
+    # Forget what was applied to control (or to every control), e.g. because AC may have changed it behind our back.
+    # The next call for it goes through to ac.
+    def invalidate(self, control=None):
+        if control is None:
+            self._state = {}
+        else:
+            for key in [key for key in self._state if key[1] == control]:
+                del self._state[key]
+
+    def setText(self, control, text):
+        if self._changed('text', control, text):
+            self._ac.setText(control, text)
+
+    def getText(self, control):
+        text = self._state.get(('text', control), _UNSET)
+        if text is _UNSET:
+            return self._ac.getText(control)
+        return text
+
+    def setFontColor(self, control, r, g, b, a):
+        if self._changed('fontColor', control, (r, g, b, a)):
+            self._ac.setFontColor(control, r, g, b, a)
+
+    def setVisible(self, control, visible):
+        if self._changed('visible', control, visible):
+            self._ac.setVisible(control, visible)
+
+    def setPosition(self, control, x, y):
+        if self._changed('position', control, (x, y)):
+            self._ac.setPosition(control, x, y)
+
+    def setBackgroundTexture(self, control, path):
+        if self._changed('backgroundTexture', control, path):
+            self._ac.setBackgroundTexture(control, path)
+
+    def setBackgroundOpacity(self, control, opacity):
+        if self._changed('backgroundOpacity', control, opacity):
+            self._ac.setBackgroundOpacity(control, opacity)
+
+    def drawBorder(self, control, border):
+        if self._changed('border', control, border):
+            self._ac.drawBorder(control, border)
@@ -147,6 +147,46 @@
 #
 # V1.26/1.27
 # - Added reading TOTAL_WARNINGS from server name
+#
+# V1.28
+# - Only evaluate the cut/pit/start light rules when AC has published a new shared memory packet (PACKET_GATED_UPDATE).
+# - Read the shared memory once per frame with PLPSimInfo.snapshot(), retrying if AC was writing the packet at the time.
+# - Share one shared memory reader (PLPlib.plp_sim_info.acquire()) instead of mapping the pages twice, and close it on shutdown.
+# - Added RECORD_TELEMETRY, to record what PLP sees each frame to the telemetry folder, for replaying with PLPlib/plp_replay.py.
+# - Added PROFILE_STAGES, to time each stage of acUpdate. Timings are written to py_log.txt on shutdown, or when you send the
+#   chat message "PLP profile".
+# - Only call ac.setText, ac.setVisible, etc. when the text, visibility, etc. actually changes.
+# - Work out the image paths once when the config is read, and step the start lights from a table instead of an if/elif chain.
+# - Work out when each start light comes on when the AC lights go out (PLPlib/plp_start_lights.py), rather than every frame.
+# - acUpdate's checks are now separate rules, each run only on frames with an event it cares about (e.g. tyres off track,
+#   pit lane entered, lap or session changed), using PLPlib/plp_rules.py.
+# - Keep the warnings and penalty state in one object (PLPlib/plp_penalty_state.py), changed only through its methods.
+# - Added JOURNAL_PENALTIES, to journal warnings and penalties to penalties.plpj (PLPlib/plp_journal.py), so they carry
+#   on if the app is reloaded or you reconnect in the middle of a session.
+# - Write max speeds, telemetry and the penalty journal on one background thread (PLPlib/plp_io.py), and replace files in
+#   one go, so a crash can't leave them half written.
+# - Max speeds are kept in speeds.plps (PLPlib/plp_speed_store.py), a log with one record per car/track/config, and only
+#   the changed speed is written on shutdown. Speeds in speed.ini are migrated to it the first time.
+# - Added SPEED_ENVELOPE, to judge a fast cut against the highest speed seen at that point of the lap (learned for each
+#   car/track and saved in the envelopes folder, PLPlib/plp_speed_envelope.py) rather than the car's max speed, with
+#   its own SPEED_ENVELOPE_RATIO_FOR_CUT. Off by default.
+# - Telemetry recordings now include the car's position around the lap (version 2). Version 1 recordings still replay.
+# - Telemetry recordings now start with the car, track, server, settings and max speed they were made with (version 3),
+#   which PLPlib/plp_replay.py replays them with.
+# - Learn where cuts are made on each track (cutzones folder, PLPlib/plp_cut_zones.py), and say which zone a cut was in
+#   in the chat log. Zones can be named, and given their own MAX_CUT_TIME and MIN_SLOW_DOWN_RATIO, in the track's file.
+# - Parse chat messages in one pass with a regular expression compiled once (PLPlib/plp_chat.py), rejecting messages
+#   that aren't for PLP straight away.
+# - Added STRUCTURED_CHAT, to add a record (event, lap, session time left, session, checksum) to the end of each chat
+#   message, for tools reading the server log (PLPlib/plp_protocol.py). The messages read the same as before.
+# - Added CHAT_MESSAGES_PER_SECOND and CHAT_BURST. Chat messages are queued and sent at most that fast, penalties first,
+#   so AC's chat throttling doesn't drop them (PLPlib/plp_chat_queue.py). A clear of the chat line that is still queued
+#   when a new line is sent is dropped.
+# - Added PLPlib/plp_server_log.py, to count the cuts, penalties and pit stops of each driver, lap and session in AC
+#   server logs.
+# - Settings are compiled from PLP.ini, today's PLP-<Day>.ini and the server name into one checked set of settings
+#   (PLPlib/plp_config.py), cached in config.plpc until a config file changes. Settings missing from a day file now
+#   come from PLP.ini. If several league folders have a file for today, the last in alphabetical order is used.
 
 import time
 import ac
@@ -156,23 +196,10 @@ import sys
 import configparser
 import traceback
 import platform
-import re
 import datetime
 import math
 
-VERSION = "1.27"
-
-
-class StartLightStep:
-	off = 0
-	shown = 1
-	light1on = 2
-	light2on = 3
-	light3on = 4
-	light4on = 5
-	light5on = 6
-	allLightsOff = 7
-	lightsHidden = 8
+VERSION = "1.28"
 
 
 TripleMode = False
@@ -186,9 +213,24 @@ try:
 
 	import ctypes
 
+	import PLPlib.plp_chat
+	import PLPlib.plp_chat_queue
+	import PLPlib.plp_config
+	import PLPlib.plp_cut_zones
+	import PLPlib.plp_io
+	import PLPlib.plp_journal
+	import PLPlib.plp_penalty_state
+	import PLPlib.plp_probes
+	import PLPlib.plp_protocol
+	import PLPlib.plp_recorder
+	import PLPlib.plp_rules
 	import PLPlib.plp_sim_info
+	import PLPlib.plp_speed_envelope
+	import PLPlib.plp_speed_store
+	import PLPlib.plp_start_lights
+	import PLPlib.plp_ui
 
-	sim_info = PLPlib.plp_sim_info.PLPSimInfo()
+	sim_info = PLPlib.plp_sim_info.acquire()
 
 	# Check My Documents location
 	from ctypes import wintypes
@@ -218,6 +260,7 @@ except:
 	ac.log(traceback.format_exc())
 
 # Config
+CFG_NAME = ""
 WHEELS_OUT = 3
 MIN_SPEED = 50
 WARNING_DURATION = 10
@@ -239,13 +282,24 @@ ENABLE_SPEEDING_PENALTIES = True
 SECONDS_BETWEEN_CUTS = 10
 USE_START_LIGHTS = True
 USE_FLAG_IMAGES = True
+IMG_FOLDER = ""
 FLAG_POS = "left"
 JUMP_START_PENALTY_SECONDS = 0
 ENABLED_DAYS = ""
+ENABLE_RACE_COUNTUP_TIMER_DAYS = ""
 AMNESTY_LAPS = 1
 SHOW_CUTS_IN_SESSIONS = "0,1,2,3"
 ENABLED_SERVER_FILTER = ""
 CUT_INDICATOR_SIZE = 50
+PACKET_GATED_UPDATE = True
+RECORD_TELEMETRY = False
+PROFILE_STAGES = False
+JOURNAL_PENALTIES = True
+SPEED_ENVELOPE = False
+SPEED_ENVELOPE_RATIO_FOR_CUT = 0.9
+STRUCTURED_CHAT = True
+CHAT_MESSAGES_PER_SECOND = 1.0
+CHAT_BURST = 3
 
 TEAM = 0
 TEAM_CAR = 1
@@ -261,7 +315,9 @@ SESSION_DRAG = 6
 PLP_CHAT = "PLP>"
 PLP_TEAM_CHAT = "PLT>"
 PLP_LOG = "PLP: "
+PROFILE_CHAT_COMMAND = "PLP profile"
 CHAT_DELIM = '|'
+chatParser = PLPlib.plp_chat.PLPChatParser(PLP_CHAT, PLP_TEAM_CHAT, CHAT_DELIM)
 WINDOW_WIDTH = 290
 MARGIN = 5
 FIRST_LINE_Y = 35
@@ -275,14 +331,9 @@ CURRENTLY_CUTTING_YES = 1
 CURRENTLY_CUTTING_SAFE = 2
 
 appWindow = 0
-numWarnings = 0
+# Warnings and penalties (numWarnings, pitLanePenalty, penaltyLapsLeft, ...).
+penalty = PLPlib.plp_penalty_state.PLPPenaltyState()
 cutDetected = False
-pitLanePenalty = False
-speedingPenalty = False
-takingPenalty = False
-invalidQualLapWarning = False
-penaltyVoid = False
-penaltyMessageSent = False
 versionChatSent = False
 statusLabel = 0
 warningLabel = 0
@@ -298,7 +349,6 @@ slowestOffTrackSpeed = 0
 lastSession = -1
 session = 0
 configFailed = False
-penaltyLapsLeft = 0
 lastLap = 0
 blinkStatus = False
 statusBlinkShowing = True
@@ -320,10 +370,8 @@ lastdfl = 0
 lastdfr = 0
 lastdrl = 0
 lastdrr = 0
-speedingOnLap = 0
 isInPitLaneOnLap = 0
 lastIsInPitLane = False
-isInPitLaneLap = False
 lastIsInPitLaneLap = 0
 speedingInPits = False
 pitStartFuel = 0
@@ -337,11 +385,10 @@ raceCountupTimerEnabled = False
 sessionEnabled = True
 
 raceSessionDuration = 0
-startLight1 = 0
-startLight2 = 0
-startLight3 = 0
-startLight4 = 0
-startLight5 = 0
+START_LIGHT_COUNT = PLPlib.plp_start_lights.START_LIGHT_COUNT
+# The start light buttons, left to right, and the texture currently on each.
+startLights = []
+startLightBar = []
 flagImageBW = 0
 flagImageB = 0
 windowX = 0
@@ -361,19 +408,152 @@ LIGHT_HEIGHT = 154
 LIGHT_MARGIN = 20
 FLAG_WIDTH = 120
 FLAG_HEIGHT = 133
+# Image paths in IMG_FOLDER, set by resolveTextures once the config has been read. Start light textures are keyed by
+# colour (startLightColour, or "Off").
+LIGHT_COLOURS = ("Off", "Red", "Yellow")
+lightTextures = {}
+blackWhiteFlagTexture = ""
+blackFlagTexture = ""
 startLightsTempShown = False
 startLightsShown = False
-startLightStep = StartLightStep.off
 
 startLightStartTime = DEFAULT_START_LIGHTS_START_TIME
 
+# Works out when each start light comes on once the AC lights go out.
+startLightSequencer = PLPlib.plp_start_lights.PLPStartLightSequencer()
+
+# Shared memory packet ids of the last processed frame, and frame counters for PACKET_GATED_UPDATE.
+lastPhysicsPacketId = -1
+lastGraphicsPacketId = -1
+processedFrames = 0
+skippedFrames = 0
+# The time since the last processed frame, from the frames skipped since then.
+skippedDeltaT = 0
+
+# All file writes (the max speed store, the telemetry recording and the penalty journal) are done in the background by
+# ioWorker. acShutdown waits at most IO_SHUTDOWN_TIMEOUT seconds for them to finish.
+IO_SHUTDOWN_TIMEOUT = 2
+ioWorker = PLPlib.plp_io.PLPIOWorker()
+
+# The config files readConfig reads the settings from, and the cache of the settings compiled from them.
+CONFIG_FOLDER = "apps/python/PitLanePenalty/config"
+CONFIG_CACHE_PATH = "apps/python/PitLanePenalty/config.plpc"
+# The settings compiled by readConfig (a PLPlib.plp_config.PLPSettings), before anything disables them for the day.
+configSettings = None
+
+# The max speed for each car/track, read by readConfig. Speeds in speed.ini (used before 1.28) are migrated into it.
+SPEED_STORE_PATH = "apps/python/PitLanePenalty/speeds.plps"
+SPEED_CONFIG_PATH = "apps/python/PitLanePenalty/speed.ini"
+speedStore = None
+
+# With SPEED_ENVELOPE set, the speed a cut is judged a fast cut at is worked out from the highest speed seen at that
+# point of the lap (in ENVELOPE_FOLDER, read by readConfig), rather than from maxSpeed.
+ENVELOPE_FOLDER = "apps/python/PitLanePenalty/envelopes"
+speedEnvelope = None
+
+# Where cuts are made on this track (in CUT_ZONES_FOLDER), loaded in the background after acMain. A zone can have its
+# own MAX_CUT_TIME and MIN_SLOW_DOWN_RATIO, which apply to cuts started in it (cutMaxTime and cutMinSlowDownRatio).
+CUT_ZONES_FOLDER = "apps/python/PitLanePenalty/cutzones"
+cutZones = None
+cutZone = None
+cutStartPosition = 0
+cutMaxTime = 0
+cutMinSlowDownRatio = 0
+
+# Records the inputs to each processed frame when RECORD_TELEMETRY is set.
+TELEMETRY_FOLDER = "apps/python/PitLanePenalty/telemetry/"
+recorder = None
+
+# Penalty state changes are journaled here when JOURNAL_PENALTIES is set, and resumed from on the first session after
+# the app is loaded, if the session's state was journaled less than JOURNAL_RESUME_SECONDS ago in the same session
+# (not an earlier one of the same type).
+JOURNAL_PATH = "apps/python/PitLanePenalty/penalties.plpj"
+JOURNAL_RESUME_SECONDS = 1800
+journal = None
+# The journal key of the current session, the penalty state changes journaled, and whether the journal has been
+# resumed from yet.
+journalKey = None
+journaledChanges = 0
+journalResumed = False
+
+# Chat messages are queued here and sent at most CHAT_MESSAGES_PER_SECOND (in bursts of up to CHAT_BURST), unless
+# CHAT_MESSAGES_PER_SECOND is 0. The message that clears the chat line is queued with CLEAR_CHAT_KEY.
+chatQueue = None
+CLEAR_CHAT_KEY = 'clear'
+
+# The stages of acUpdate timed when PROFILE_STAGES is set. Each rule (see below) is timed as a stage too.
+ACUPDATE_STAGES = (
+	"skipped frame",
+	"read shared memory",
+)
+STAGE_SKIPPED, STAGE_READ = range(len(ACUPDATE_STAGES))
+stageProbes = None
+
+# Events that make acUpdate's rules run. frameEvents works out which of them happen on each processed frame.
+EVENT_EVERY_FRAME = 1
+EVENT_IN_RACE = 2
+EVENT_SESSION_CHANGED = 4
+EVENT_SESSION_RESTARTED = 8
+EVENT_IN_PIT_LANE = 16
+EVENT_PIT_LANE_CHANGED = 32
+EVENT_IN_PIT = 64
+EVENT_LAP_CHANGED = 128
+EVENT_TYRES_OUT = 256
+EVENT_TYRES_OUT_CHANGED = 512
+EVENT_SLOW = 1024
+
+# The rules acUpdate runs, registered after resetWindowOpacity.
+rules = PLPlib.plp_rules.PLPRuleEngine(len(ACUPDATE_STAGES))
+
+# The frame being processed by the rules, and what's worked out from it.
+frame = None
+frameDeltaT = 0
+lap = 1
+speed = 0
+carTyresOut = 0
+# The pit lane flag and number of tyres out on the last processed frame, for the EVENT_*_CHANGED events.
+lastFrameIsInPitLane = False
+lastCarTyresOut = 0
+
+# How often the window's opacity and border are re-applied in INVISIBLE_MODE, in case AC has changed them (seconds).
+OPACITY_RESET_INTERVAL = 1
+nextOpacityResetTime = 0
+
+# All text, colour, visibility, position and texture changes go through here, so unchanged values aren't re-applied.
+ui = PLPlib.plp_ui.PLPWidgetCache(ac)
+
 
 def acMain(acVersion):
 	global appWindow, warningLabel, chatLabel, timerLabel, statusLabel, configFailed, appWindowActivated, showWindowTitle
-	global startLight1, startLight2, startLight3, startLight4, startLight5, Resolution, ResolutionHeight, lightsX, lightsY
-	global flagImageBW, flagImageB, flagX, flagY, appEnabled, TripleMode
+	global startLightBar, Resolution, ResolutionHeight, lightsX, lightsY
+	global flagImageBW, flagImageB, flagX, flagY, appEnabled, TripleMode, recorder, stageProbes, journal, chatQueue
 
 	configFailed = not readConfig()
+	resolveTextures()
+
+	if RECORD_TELEMETRY and not configFailed:
+		# Record what the frames are replayed with, too: the car, track, server, settings and max speed so far.
+		recordingInfo = PLPlib.plp_recorder.RecordingInfo(ac.getCarName(0), ac.getTrackName(0), ac.getTrackConfiguration(0),
+														  ac.getServerName(), configSettings._asdict(), maxSpeed)
+		recorder = PLPlib.plp_recorder.PLPRecorder(
+			TELEMETRY_FOLDER + datetime.datetime.now().strftime("%Y%m%d-%H%M%S") + PLPlib.plp_recorder.RECORDING_EXTENSION,
+			recordingInfo, worker=ioWorker)
+
+	if JOURNAL_PENALTIES and not configFailed:
+		try:
+			journal = PLPlib.plp_journal.PLPPenaltyJournal(JOURNAL_PATH, worker=ioWorker)
+		except:
+			ac.log(traceback.format_exc())
+
+	if not configFailed:
+		ioWorker.submit(loadCutZones, cutZonesPath())
+
+	if CHAT_MESSAGES_PER_SECOND > 0:
+		chatQueue = PLPlib.plp_chat_queue.PLPChatQueue(ac.sendChatMessage, CHAT_MESSAGES_PER_SECOND, CHAT_BURST)
+
+	if PROFILE_STAGES:
+		stageProbes = PLPlib.plp_probes.PLPStageProbes(ACUPDATE_STAGES + rules.names)
+		rules.probes = stageProbes
 
 	appEnabled = isEnabled(ENABLED_DAYS, ENABLED_SERVER_FILTER)
 
@@ -382,16 +562,16 @@ def acMain(acVersion):
 	ac.setIconPosition(appWindow, -1155, -1155)
 
 	warningLabel = ac.addLabel(appWindow, "")
-	ac.setPosition(warningLabel, MARGIN, FIRST_LINE_Y)
+	ui.setPosition(warningLabel, MARGIN, FIRST_LINE_Y)
 
 	statusLabel = ac.addLabel(appWindow, "")
-	ac.setPosition(statusLabel, WINDOW_WIDTH - 100, FIRST_LINE_Y)
+	ui.setPosition(statusLabel, WINDOW_WIDTH - 100, FIRST_LINE_Y)
 
 	chatLabel = ac.addLabel(appWindow, "")
-	ac.setPosition(chatLabel, MARGIN, FIRST_LINE_Y + LINE_HEIGHT)
+	ui.setPosition(chatLabel, MARGIN, FIRST_LINE_Y + LINE_HEIGHT)
 
 	timerLabel = ac.addLabel(appWindow, "")
-	ac.setPosition(timerLabel, MARGIN, 0)
+	ui.setPosition(timerLabel, MARGIN, 0)
 	ac.setFontSize(timerLabel, 72)
 
 	if USE_FLAG_IMAGES:
@@ -409,20 +589,20 @@ def acMain(acVersion):
 			flagX = LIGHT_MARGIN
 
 		flagImageBW = ac.addButton(appWindow, "")
-		ac.setPosition(flagImageBW, 0, 0)
+		ui.setPosition(flagImageBW, 0, 0)
 		ac.setSize(flagImageBW, FLAG_WIDTH, FLAG_HEIGHT)
-		ac.drawBorder(flagImageBW, 0)
-		ac.setVisible(flagImageBW, 0)
-		ac.setBackgroundOpacity(flagImageBW, 0)
-		ac.setBackgroundTexture(flagImageBW, "apps/python/PitLanePenalty" + IMG_FOLDER + "/BlackWhiteFlag.png")
+		ui.drawBorder(flagImageBW, 0)
+		ui.setVisible(flagImageBW, 0)
+		ui.setBackgroundOpacity(flagImageBW, 0)
+		ui.setBackgroundTexture(flagImageBW, blackWhiteFlagTexture)
 
 		flagImageB = ac.addButton(appWindow, "")
-		ac.setPosition(flagImageB, 0, 0)
+		ui.setPosition(flagImageB, 0, 0)
 		ac.setSize(flagImageB, FLAG_WIDTH, FLAG_HEIGHT)
-		ac.drawBorder(flagImageB, 0)
-		ac.setVisible(flagImageB, 0)
-		ac.setBackgroundOpacity(flagImageB, 0)
-		ac.setBackgroundTexture(flagImageB, "apps/python/PitLanePenalty" + IMG_FOLDER + "/BlackFlag.png")
+		ui.drawBorder(flagImageB, 0)
+		ui.setVisible(flagImageB, 0)
+		ui.setBackgroundOpacity(flagImageB, 0)
+		ui.setBackgroundTexture(flagImageB, blackFlagTexture)
 
 	if USE_START_LIGHTS:
 		# Create start lights
@@ -436,45 +616,16 @@ def acMain(acVersion):
 
 		ac.log("PLP: lightsX,lightsY = {0},{1}".format(lightsX, lightsY))
 
-		startLight1 = ac.addButton(appWindow, "")
-		ac.setPosition(startLight1, 0, 0)
-		ac.setSize(startLight1, LIGHT_WIDTH, LIGHT_HEIGHT)
-		ac.drawBorder(startLight1, 0)
-		ac.setVisible(startLight1, 0)
-		ac.setBackgroundOpacity(startLight1, 0)
-		ac.setBackgroundTexture(startLight1, "apps/python/PitLanePenalty" + IMG_FOLDER + "/LightOff.png")
-
-		startLight2 = ac.addButton(appWindow, "")
-		ac.setPosition(startLight2, LIGHT_WIDTH, 0)
-		ac.setSize(startLight2, LIGHT_WIDTH, LIGHT_HEIGHT)
-		ac.drawBorder(startLight2, 0)
-		ac.setVisible(startLight2, 0)
-		ac.setBackgroundOpacity(startLight2, 0)
-		ac.setBackgroundTexture(startLight2, "apps/python/PitLanePenalty" + IMG_FOLDER + "/LightOff.png")
-
-		startLight3 = ac.addButton(appWindow, "")
-		ac.setPosition(startLight3, LIGHT_WIDTH * 2, 0)
-		ac.setSize(startLight3, LIGHT_WIDTH, LIGHT_HEIGHT)
-		ac.drawBorder(startLight3, 0)
-		ac.setVisible(startLight3, 0)
-		ac.setBackgroundOpacity(startLight3, 0)
-		ac.setBackgroundTexture(startLight3, "apps/python/PitLanePenalty" + IMG_FOLDER + "/LightOff.png")
-
-		startLight4 = ac.addButton(appWindow, "")
-		ac.setPosition(startLight4, LIGHT_WIDTH * 3, 0)
-		ac.setSize(startLight4, LIGHT_WIDTH, LIGHT_HEIGHT)
-		ac.drawBorder(startLight4, 0)
-		ac.setVisible(startLight4, 0)
-		ac.setBackgroundOpacity(startLight4, 0)
-		ac.setBackgroundTexture(startLight4, "apps/python/PitLanePenalty" + IMG_FOLDER + "/LightOff.png")
-
-		startLight5 = ac.addButton(appWindow, "")
-		ac.setPosition(startLight5, LIGHT_WIDTH * 4, 0)
-		ac.setSize(startLight5, LIGHT_WIDTH, LIGHT_HEIGHT)
-		ac.drawBorder(startLight5, 0)
-		ac.setVisible(startLight5, 0)
-		ac.setBackgroundOpacity(startLight5, 0)
-		ac.setBackgroundTexture(startLight5, "apps/python/PitLanePenalty" + IMG_FOLDER + "/LightOff.png")
+		for index in range(START_LIGHT_COUNT):
+			startLight = ac.addButton(appWindow, "")
+			ui.setPosition(startLight, LIGHT_WIDTH * index, 0)
+			ac.setSize(startLight, LIGHT_WIDTH, LIGHT_HEIGHT)
+			ui.drawBorder(startLight, 0)
+			ui.setVisible(startLight, 0)
+			ui.setBackgroundOpacity(startLight, 0)
+			ui.setBackgroundTexture(startLight, lightTextures["Off"])
+			startLights.append(startLight)
+		startLightBar = [lightTextures["Off"]] * START_LIGHT_COUNT
 
 	appWindowActivated = time.clock()
 
@@ -492,35 +643,23 @@ def acMain(acVersion):
 
 
 def showApp():
-	global startLightsTempShown, startLightsShown, appEnabled
+	global startLightsTempShown, appEnabled
 
 	if appEnabled:
 		ac.setTitle(appWindow, "Pit Lane Penalty " + VERSION + " " + CFG_NAME)
 	else:
 		ac.setTitle(appWindow, "Pit Lane Penalty " + VERSION + " " + CFG_NAME + " - DISABLED")
 
-	ac.setBackgroundOpacity(appWindow, 0.5)
-	ac.drawBorder(appWindow, 1)
+	ui.setBackgroundOpacity(appWindow, 0.5)
+	ui.drawBorder(appWindow, 1)
 	# Temporarily show the start lights, to test if people can see them.
 	# Don't show them temporarily in a race session though, so they don't confuse the start light sequence.
 	if USE_START_LIGHTS and sim_info.graphics.session != SESSION_RACE:
 		positionStartLights()
 
-		ac.setBackgroundTexture(startLight1, "apps/python/PitLanePenalty" + IMG_FOLDER + "/LightRed.png")
-		ac.setBackgroundTexture(startLight2, "apps/python/PitLanePenalty" + IMG_FOLDER + "/LightRed.png")
-		ac.setBackgroundTexture(startLight3, "apps/python/PitLanePenalty" + IMG_FOLDER + "/LightRed.png")
-		ac.setBackgroundTexture(startLight4, "apps/python/PitLanePenalty" + IMG_FOLDER + "/LightRed.png")
-		ac.setBackgroundTexture(startLight5, "apps/python/PitLanePenalty" + IMG_FOLDER + "/LightRed.png")
-
-		# Show the lights.
-		ac.setVisible(startLight1, 1)
-		ac.setVisible(startLight2, 1)
-		ac.setVisible(startLight3, 1)
-		ac.setVisible(startLight4, 1)
-		ac.setVisible(startLight5, 1)
-
+		setStartLightBar([lightTextures["Red"]] * START_LIGHT_COUNT)
+		showStartLights()
 		startLightsTempShown = True
-		startLightsShown = True
 
 
 # Position the start lights, relative to the app window
@@ -529,22 +668,51 @@ def positionStartLights():
 
 	windowX, windowY = ac.getPosition(appWindow)
 	ac.log("PLP: windowX,windowY = {0},{1}".format(windowX, windowY))
-	ac.setPosition(startLight1, lightsX - windowX, lightsY - windowY)
 	ac.log("PLP: startLight1 at {0},{1}".format(lightsX - windowX, lightsY - windowY))
-	ac.setPosition(startLight2, lightsX - windowX + LIGHT_WIDTH, lightsY - windowY)
-	ac.setPosition(startLight3, lightsX - windowX + LIGHT_WIDTH * 2, lightsY - windowY)
-	ac.setPosition(startLight4, lightsX - windowX + LIGHT_WIDTH * 3, lightsY - windowY)
-	ac.setPosition(startLight5, lightsX - windowX + LIGHT_WIDTH * 4, lightsY - windowY)
+	for index, startLight in enumerate(startLights):
+		ui.setPosition(startLight, lightsX - windowX + LIGHT_WIDTH * index, lightsY - windowY)
+
+
+# Put the textures in bar on the start lights, left to right, changing only the lights whose texture differs.
+def setStartLightBar(bar):
+	global startLightBar
+
+	for index, texture in enumerate(bar):
+		if texture != startLightBar[index]:
+			ui.setBackgroundTexture(startLights[index], texture)
+	startLightBar = bar
+
+
+# Carry out an action from the start light sequence.
+def runStartLightAction(action):
+	global startLightsOff
+
+	if action == PLPlib.plp_start_lights.HIDE_LIGHTS:
+		# Hide the lights after they've been off for a second.
+		hideStartLights()
+	elif action == PLPlib.plp_start_lights.ALL_LIGHTS_OFF:
+		# Turn all lights off after holding them on for random lightHoldSecs seconds.
+		setStartLightBar([lightTextures["Off"]] * START_LIGHT_COUNT)
+		startLightsOff = True
+	else:
+		bar = list(startLightBar)
+		bar[action - 1] = lightTextures[startLightColour]
+		setStartLightBar(bar)
+
+
+def showStartLights():
+	global startLightsShown
+
+	for startLight in startLights:
+		ui.setVisible(startLight, 1)
+	startLightsShown = True
 
 
 def hideStartLights():
 	global startLightsTempShown, startLightsShown
 
-	ac.setVisible(startLight1, 0)
-	ac.setVisible(startLight2, 0)
-	ac.setVisible(startLight3, 0)
-	ac.setVisible(startLight4, 0)
-	ac.setVisible(startLight5, 0)
+	for startLight in startLights:
+		ui.setVisible(startLight, 0)
 	startLightsTempShown = False
 	startLightsShown = False
 
@@ -558,8 +726,8 @@ def onFormRender(deltaT):
 			# Now hide the window
 			showWindowTitle = False
 			ac.setTitle(appWindow, "")
-			ac.setBackgroundOpacity(appWindow, 0)
-			ac.drawBorder(appWindow, 0)
+			ui.setBackgroundOpacity(appWindow, 0)
+			ui.drawBorder(appWindow, 0)
 
 	if startLightsTempShown:
 		if time.clock() - appWindowActivated > 5:
@@ -571,10 +739,11 @@ def onFormRender(deltaT):
 	# Draw a red marker if you're in pit lane, and you are speeding.
 	# If the car is currently cutting, and would get a penalty, draw a red marker.
 	# If the car is currently cutting, but is safe from getting a penalty, draw a green marker.
-	if currentlyCutting != CURRENTLY_CUTTING_NOT or ENABLE_SPEEDING_PENALTIES and sim_info.graphics.isInPitLane:
-		if sim_info.graphics.isInPitLane and speedingInPits:
+	isInPitLane = sim_info.graphics.isInPitLane
+	if currentlyCutting != CURRENTLY_CUTTING_NOT or ENABLE_SPEEDING_PENALTIES and isInPitLane:
+		if isInPitLane and speedingInPits:
 			ac.glColor4f(1, 0, 0, 1)
-		elif sim_info.graphics.isInPitLane and not speedingInPits:
+		elif isInPitLane and not speedingInPits:
 			ac.glColor4f(0, 1, 0, 1)
 		elif currentlyCutting == CURRENTLY_CUTTING_YES:
 			ac.glColor4f(1, 0, 0, 1)
@@ -590,22 +759,15 @@ def onFormRender(deltaT):
 		# ac.glQuad(MARGIN, MARGIN, 30, 30)
 
 def acUpdate(deltaT):
-	global numWarnings, cutDetected, eraseWarningTime, gameTime, lastCutTime, pitLanePenalty, takingPenalty, penaltyVoid, lastSession, penaltyMessageSent
-	global eraseChatTime, session, startCutSpeed, versionChatSent, penaltyLapsLeft, lastLap, statusBlinkShowing, nextStatusBlinkTime, slowestOffTrackSpeed
-	global warningText, statusBlinkStopTime, nextWarningBlinkTime, warningBlinkShowing, maxSpeed, lastSessionTimeLeft, invalidQualLapWarning, warningBlinkStopTime, warningLabel
-	global currentlyCutting, lastdfl, lastdfr, lastdrl, lastdrr
-	global speedingPenalty, speedingOnLap, isInPitLaneLap, lastIsInPitLane, speedingInPits, lastIssuedCutTime
-	global lastIsInPitLaneLap, pitStartFuel, wasInPit
+	global gameTime, versionChatSent, maxSpeed, session
 	global PitX, PitY, PitZ  # added global variables intiliased as 0,0,0. X,Y,Z co-ords of pit box
 	global AppInitialised  # added global variable intiliased as False
-	global raceSessionDuration, startLight1, startLight2, startLight3, startLight4, startLight5, appWindow, windowX, windowY, startLightsOff, startLightStartTime, lightHoldSecs
-	global startLightColour, jumpStartDetected, startLightsInited, startLightsShown, startLightStep
-	global raceTimerVisible, raceTimerRemoved, timerLabel
-	global AMNESTY_LAPS, sessionEnabled
+	global lastPhysicsPacketId, lastGraphicsPacketId, processedFrames, skippedFrames, skippedDeltaT
+	global frame, frameDeltaT, lap, speed, carTyresOut
 
 	if configFailed:
-		ac.setFontColor(warningLabel, 1, 0, 0, 1)
-		ac.setText(warningLabel, "Error reading config (see py_log.txt)")
+		ui.setFontColor(warningLabel, 1, 0, 0, 1)
+		ui.setText(warningLabel, "Error reading config (see py_log.txt)")
 		return
 
 	# Record the car's initial pit position
@@ -627,145 +789,76 @@ def acUpdate(deltaT):
 																					   LAPS_TO_TAKE_PENALTY,
 																					   PENALTY_MODE_CUTTING, PENALTY_MODE_SPEEDING, PIT_LANE_SPEED,
 																					   AMNESTY_LAPS,
-																					   SHOW_CUTS_IN_SESSIONS, CFG_NAME))
+																					   SHOW_CUTS_IN_SESSIONS, CFG_NAME), 'VR')
 		versionChatSent = True
 
+	if stageProbes is not None:
+		stageProbes.start()
+
+	# 1.28 - Nothing the rules look at has changed if AC hasn't published a new physics or graphics packet since the last
+	# processed frame (e.g. at high frame rates, or while paused), so only keep the timers running.
+	if PACKET_GATED_UPDATE:
+		physicsPacketId = sim_info.physics.packetId
+		graphicsPacketId = sim_info.graphics.packetId
+		if physicsPacketId == lastPhysicsPacketId and graphicsPacketId == lastGraphicsPacketId:
+			skippedFrames += 1
+			skippedDeltaT += deltaT
+			if recorder is not None:
+				recorder.addTime(deltaT)
+			updateBlinking()
+			updateEraseTimers()
+			resetWindowOpacity()
+			sendQueuedChat()
+			if stageProbes is not None:
+				stageProbes.mark(STAGE_SKIPPED)
+			return
+		lastPhysicsPacketId = physicsPacketId
+		lastGraphicsPacketId = graphicsPacketId
+	processedFrames += 1
+
 	# Get car info
-	lap = sim_info.graphics.completedLaps + 1
+	frame = sim_info.snapshot()
+	# The rules that count time (e.g. the start lights) count the skipped frames' time too.
+	frameDeltaT = skippedDeltaT + deltaT
+	skippedDeltaT = 0
+	lap = frame.completedLaps + 1
 	speed = ac.getCarState(0, acsys.CS.SpeedKMH)
-	car_tyres_out = sim_info.physics.numberOfTyresOut
-	if sim_info.graphics.isInPitLane and lastIsInPitLane == False:  # and sim_info.graphics.normalizedCarPosition > 0.5:
+	session = frame.session
+	if recorder is not None:
+		recorder.record(deltaT, speed, ac.getCarState(0, acsys.CS.WorldPosition), frame, ac.getCarState(0, acsys.CS.LapTime))
+	carTyresOut = countTyresOut()
 
-		# Send a team message when the car's pit limiter first comes on on this lap.
-		if TEAM > 0 and lap != isInPitLaneLap:
-			sendTeamChatMessage("Car {0} has entered pit lane".format(TEAM_CAR))
+	if speed > maxSpeed:
+		maxSpeed = speed
+	# The envelope learns on-track speeds, not the speed of a cut (or of the frame a cut ends on, which is judged
+	# against the envelope), and only after the rules have judged this frame.
+	learnSpeed = speedEnvelope is not None and carTyresOut == 0 and not cutDetected and not frame.isInPitLane
 
-		# Keep track of what lap pit lane was entered, but only in the second half of the lap - i.e. when entering pits.
-		# This makes sure the isInPitLaneLap is not reset if the pit limiter goes off and on again when driving down pit lane'
-		# after the start line.
-		isInPitLaneLap = lap
+	events = frameEvents()
 
-	lastIsInPitLane = sim_info.graphics.isInPitLane
-	session = sim_info.graphics.session
+	if stageProbes is not None:
+		stageProbes.mark(STAGE_READ)
 
-	#
-	# START LIGHTS
-	#
-	if USE_START_LIGHTS:
-		if session == SESSION_RACE:
-			raceSessionDuration += deltaT
-
-			if int(ac.getCarState(0, acsys.CS.LapTime)) > 0 and startLightStartTime == DEFAULT_START_LIGHTS_START_TIME:
-				# AC lights are out as soon as the lap time starts counting up. Start the PLP lights 1 second later.
-				startLightStartTime = raceSessionDuration + 1
-				startLightStep = StartLightStep.shown
-
-			if raceSessionDuration > startLightStartTime + 6 + lightHoldSecs:
-				# Hide the lights after they've been off for a second.
-				if startLightStep == StartLightStep.allLightsOff:
-					hideStartLights()
-					startLightStep = StartLightStep.lightsHidden
-			elif raceSessionDuration > startLightStartTime + 5 + lightHoldSecs:
-				# Turn all lights off after holding them on for random lightHoldSecs seconds.
-				if startLightStep == StartLightStep.light5on:
-					ac.setBackgroundTexture(startLight1, "apps/python/PitLanePenalty" + IMG_FOLDER + "/LightOff.png")
-					ac.setBackgroundTexture(startLight2, "apps/python/PitLanePenalty" + IMG_FOLDER + "/LightOff.png")
-					ac.setBackgroundTexture(startLight3, "apps/python/PitLanePenalty" + IMG_FOLDER + "/LightOff.png")
-					ac.setBackgroundTexture(startLight4, "apps/python/PitLanePenalty" + IMG_FOLDER + "/LightOff.png")
-					ac.setBackgroundTexture(startLight5, "apps/python/PitLanePenalty" + IMG_FOLDER + "/LightOff.png")
-					startLightsOff = True
-					startLightStep = StartLightStep.allLightsOff
-			elif raceSessionDuration > startLightStartTime + 4:
-				if startLightStep == StartLightStep.light4on:
-					ac.setBackgroundTexture(startLight5, "apps/python/PitLanePenalty" + IMG_FOLDER + "/Light" + startLightColour + ".png")
-					startLightStep = StartLightStep.light5on
-			elif raceSessionDuration > startLightStartTime + 3:
-				if startLightStep == StartLightStep.light3on:
-					ac.setBackgroundTexture(startLight4, "apps/python/PitLanePenalty" + IMG_FOLDER + "/Light" + startLightColour + ".png")
-					startLightStep = StartLightStep.light4on
-			elif raceSessionDuration > startLightStartTime + 2:
-				if startLightStep == StartLightStep.light2on:
-					ac.setBackgroundTexture(startLight3, "apps/python/PitLanePenalty" + IMG_FOLDER + "/Light" + startLightColour + ".png")
-					startLightStep = StartLightStep.light3on
-			elif raceSessionDuration > startLightStartTime + 1:
-				if startLightStep == StartLightStep.light1on:
-					ac.setBackgroundTexture(startLight2, "apps/python/PitLanePenalty" + IMG_FOLDER + "/Light" + startLightColour + ".png")
-					startLightStep = StartLightStep.light2on
-			elif raceSessionDuration > startLightStartTime:
-				if startLightStep == StartLightStep.shown:
-					ac.setBackgroundTexture(startLight1, "apps/python/PitLanePenalty" + IMG_FOLDER + "/Light" + startLightColour + ".png")
-					startLightStep = StartLightStep.light1on
-			elif raceSessionDuration > 0 and not startLightsInited:
-				if startLightStep == StartLightStep.off:
-					# Show the lights, relative to the app window
-					positionStartLights()
-
-					# The final red will be held for somewhere between 1 and 4 seconds.
-					lightHoldSecs = rand(3.0) + 1
-					ac.setBackgroundTexture(startLight1, "apps/python/PitLanePenalty" + IMG_FOLDER + "/LightOff.png")
-					ac.setBackgroundTexture(startLight2, "apps/python/PitLanePenalty" + IMG_FOLDER + "/LightOff.png")
-					ac.setBackgroundTexture(startLight3, "apps/python/PitLanePenalty" + IMG_FOLDER + "/LightOff.png")
-					ac.setBackgroundTexture(startLight4, "apps/python/PitLanePenalty" + IMG_FOLDER + "/LightOff.png")
-					ac.setBackgroundTexture(startLight5, "apps/python/PitLanePenalty" + IMG_FOLDER + "/LightOff.png")
-
-					# Show the lights.
-					ac.setVisible(startLight1, 1)
-					ac.setVisible(startLight2, 1)
-					ac.setVisible(startLight3, 1)
-					ac.setVisible(startLight4, 1)
-					ac.setVisible(startLight5, 1)
-
-					startLightsInited = True
-					startLightsShown = True
-					startLightStep = StartLightStep.shown
-
-			# You can't jump start until the AC lights go out (and the lap time starts counting up)
-			# 1.12 - only issue warning on lap 1
-			if int(ac.getCarState(0,
-								  acsys.CS.LapTime)) > 0 and not startLightsOff and speed > 0.5 and not jumpStartDetected and lap == 1:
-				# Jump Start - display yellow start lights.
-				jumpStartDetected = True
-				startLightColour = "Yellow"
-				ac.setFontColor(warningLabel, 1, 1, 0, 1)
-				ac.setText(warningLabel, "JUMP START")
-				eraseWarningTime = gameTime + WARNING_DURATION
-				issuePenalty("JUMP START", lap, JUMP_START_PENALTY_SECONDS)
-
-	#
-	# RACE TIMER
-	#
-	# LapTime becomes non-zero when AC lights go out.
-	if raceCountupTimerEnabled:
-		if session == SESSION_RACE and not raceTimerRemoved and int(ac.getCarState(0, acsys.CS.LapTime)) > 0:
-			# Show the timer
-			raceTimerVisible = True
+	# 1.28 - Run the rules (see the list after resetWindowOpacity) whose events happened on this frame.
+	rules.dispatch(events)
 
-			if speed > 3:
-				# Once the car starts moving, remove and hide the race timer.
-				raceTimerVisible = False
-				raceTimerRemoved = True
-				ac.setText(timerLabel, "")
+	if learnSpeed:
+		speedEnvelope.learn(frame.normalizedCarPosition, speed)
 
-		# Display the race timer value (the lap time)
-		if raceTimerVisible:
-			ac.setText(timerLabel, str(int(ac.getCarState(0, acsys.CS.LapTime) / 1000)))
+	# Journal the penalties and send queued chat whether or not a rule stopped the frame (e.g. in a session mode with
+	# no cuts, after a pit lane or jump start penalty).
+	journalPenaltyState()
+	sendQueuedChat()
 
-	# Check for speeding in pit lane and issue a drive through penalty.
-	if ENABLE_SPEEDING_PENALTIES:
-		speedingInPits = sim_info.graphics.isInPitLane and speed > PIT_LANE_SPEED
-		if speedingInPits:
-			ac.console("speedingInPits is true")
-		if session == SESSION_RACE and not speedingPenalty:
-			# Check lap, in case driver speeds in pits a second time while already on a penalty
-			# ac.console("lap = " + str(lap) + ", speedingOnLap = " + str(speedingOnLap))
-			if not pitLanePenalty or lap != speedingOnLap:
-				if speedingInPits:
-					issuePenalty("SPEEDING", lap, SECONDS_PER_SPEEDING_PENALTY)
-					speedingPenalty = True
-					speedingOnLap = lap
+
+# The number of tyres off track, from AC's count and from the tyres' dirt levels.
+def countTyresOut():
+	global lastdfl, lastdfr, lastdrl, lastdrr
+
+	tyresOut = frame.numberOfTyresOut
 
 	# Also check the tyres dirt level to see if any of them are off-track.
-	dfl, dfr, drl, drr = sim_info.physics.tyreDirtyLevel
+	dfl, dfr, drl, drr = frame.tyreDirtyLevel
 	dirty_tyres_out = 0
 	# Check if tyre is dirty and getting dirtier.
 	if dfl > 0 and dfl >= lastdfl:
@@ -776,41 +869,183 @@ def acUpdate(deltaT):
 		dirty_tyres_out = dirty_tyres_out + 1
 	if drr > 0 and drr >= lastdrr:
 		dirty_tyres_out = dirty_tyres_out + 1
-	if dirty_tyres_out > car_tyres_out:
-		car_tyres_out = dirty_tyres_out
+	if dirty_tyres_out > tyresOut:
+		tyresOut = dirty_tyres_out
 
 	lastdfl = dfl
 	lastdfr = dfr
 	lastdrl = drl
 	lastdrr = drr
-	# ac.setText(chatLabel,"T{:.0f} {:.3f} {:.3f} {:.3f} {:.3f}, C{:.0f} D{:.0f}".format(sim_info.physics.numberOfTyresOut, dfl, dfr, drl, drr, car_tyres_out, dirty_tyres_out))
+	# ac.setText(chatLabel,"T{:.0f} {:.3f} {:.3f} {:.3f} {:.3f}, C{:.0f} D{:.0f}".format(sim_info.physics.numberOfTyresOut, dfl, dfr, drl, drr, tyresOut, dirty_tyres_out))
 	# ac.setText(chatLabel, "{0}".format(sim_info.graphics.isInPitLane))
 
 	# 1.17 - Tyres cannot be out in pit lane
-	if sim_info.graphics.isInPitLane:
-		car_tyres_out = 0
+	if frame.isInPitLane:
+		tyresOut = 0
 
-	sessionTimeLeft = sim_info.graphics.sessionTimeLeft
+	return tyresOut
+
+
+# Work out which of the rules' events happen on this frame.
+def frameEvents():
+	global lastSessionTimeLeft, lastFrameIsInPitLane, lastCarTyresOut
+
+	events = EVENT_EVERY_FRAME
+	if session == SESSION_RACE:
+		events |= EVENT_IN_RACE
+	if session != lastSession:
+		events |= EVENT_SESSION_CHANGED
+
+	sessionTimeLeft = frame.sessionTimeLeft
 	if not math.isinf(sessionTimeLeft):
 		# As of AC 1.6+, the sessionTimeLeft can go up and down a little bit, by about 0.004 to 0.008 seconds.
 		# So give some allowance for timing "jitter", by adding 500 ms.
 		if session == SESSION_RACE and sessionTimeLeft > lastSessionTimeLeft + 500:
-			# Race has been restarted. Reset everything.
-			resetWarnings()
-			sessionEnabled = resetSession(session)
-			raceStart()
+			events |= EVENT_SESSION_RESTARTED
 		lastSessionTimeLeft = sessionTimeLeft
 
-	if speed > maxSpeed:
-		maxSpeed = speed
+	if frame.isInPitLane:
+		events |= EVENT_IN_PIT_LANE
+	if frame.isInPitLane != lastFrameIsInPitLane:
+		events |= EVENT_PIT_LANE_CHANGED
+		lastFrameIsInPitLane = frame.isInPitLane
+	if frame.isInPit:
+		events |= EVENT_IN_PIT
+	if lap != lastLap:
+		events |= EVENT_LAP_CHANGED
+	if carTyresOut > 0:
+		events |= EVENT_TYRES_OUT
+	if carTyresOut != lastCarTyresOut:
+		events |= EVENT_TYRES_OUT_CHANGED
+		lastCarTyresOut = carTyresOut
+	if speed <= QUAL_SLOW_DOWN_SPEED:
+		events |= EVENT_SLOW
+	return events
 
-	if not (session == SESSION_HOTLAP or session == SESSION_PRAC or session == SESSION_QUAL or session == SESSION_RACE):
-		ac.setText(warningLabel, "No cuts in this mode")
+
+def checkPitLaneEntry():
+	global lastIsInPitLane
+
+	if frame.isInPitLane and lastIsInPitLane == False:  # and frame.normalizedCarPosition > 0.5:
+
+		# Send a team message when the car's pit limiter first comes on on this lap.
+		if TEAM > 0 and lap != penalty.isInPitLaneLap:
+			sendTeamChatMessage("Car {0} has entered pit lane".format(TEAM_CAR), 'PE')
+
+		# Keep track of what lap pit lane was entered, but only in the second half of the lap - i.e. when entering pits.
+		# This makes sure the isInPitLaneLap is not reset if the pit limiter goes off and on again when driving down pit lane'
+		# after the start line.
+		penalty.enterPitLane(lap)
+
+	lastIsInPitLane = frame.isInPitLane
+
+
+def updateStartLights():
+	global raceSessionDuration, startLightStartTime, lightHoldSecs, startLightsInited
+
+	if not USE_START_LIGHTS:
 		return
 
+	raceSessionDuration += frameDeltaT
+
+	if startLightStartTime == DEFAULT_START_LIGHTS_START_TIME:
+		if int(ac.getCarState(0, acsys.CS.LapTime)) > 0:
+			# AC lights are out as soon as the lap time starts counting up. Start the PLP lights 1 second later.
+			startLightStartTime = raceSessionDuration + 1
+			startLightSequencer.start(startLightStartTime, lightHoldSecs)
+		elif raceSessionDuration > 0 and not startLightsInited:
+			# Show the lights, relative to the app window
+			positionStartLights()
+
+			# The final red will be held for somewhere between 1 and 4 seconds.
+			lightHoldSecs = rand(3.0) + 1
+			setStartLightBar([lightTextures["Off"]] * START_LIGHT_COUNT)
+			showStartLights()
+
+			startLightsInited = True
+	else:
+		action = startLightSequencer.poll(raceSessionDuration)
+		while action is not None:
+			runStartLightAction(action)
+			action = startLightSequencer.poll(raceSessionDuration)
+
+
+def checkJumpStart():
+	global jumpStartDetected, startLightColour, eraseWarningTime
+
+	# You can't jump start until the AC lights go out (and the lap time starts counting up)
+	# 1.12 - only issue warning on lap 1
+	if USE_START_LIGHTS and int(ac.getCarState(0, acsys.CS.LapTime)) > 0 and not startLightsOff and speed > 0.5 \
+			and not jumpStartDetected and lap == 1:
+		# Jump Start - display yellow start lights.
+		jumpStartDetected = True
+		startLightColour = "Yellow"
+		ui.setFontColor(warningLabel, 1, 1, 0, 1)
+		ui.setText(warningLabel, "JUMP START")
+		eraseWarningTime = gameTime + WARNING_DURATION
+		issuePenalty("JUMP START", lap, JUMP_START_PENALTY_SECONDS)
+
+
+def updateRaceTimer():
+	global raceTimerVisible, raceTimerRemoved
+
+	# LapTime becomes non-zero when AC lights go out.
+	if raceCountupTimerEnabled:
+		if session == SESSION_RACE and not raceTimerRemoved and int(ac.getCarState(0, acsys.CS.LapTime)) > 0:
+			# Show the timer
+			raceTimerVisible = True
+
+			if speed > 3:
+				# Once the car starts moving, remove and hide the race timer.
+				raceTimerVisible = False
+				raceTimerRemoved = True
+				ui.setText(timerLabel, "")
+
+		# Display the race timer value (the lap time)
+		if raceTimerVisible:
+			ui.setText(timerLabel, str(int(ac.getCarState(0, acsys.CS.LapTime) / 1000)))
+
+
+# Check for speeding in pit lane and issue a drive through penalty.
+def checkSpeeding():
+	global speedingInPits
+
+	if ENABLE_SPEEDING_PENALTIES:
+		speedingInPits = frame.isInPitLane and speed > PIT_LANE_SPEED
+		if speedingInPits:
+			ac.console("speedingInPits is true")
+		if session == SESSION_RACE and not penalty.speedingPenalty:
+			# Check lap, in case driver speeds in pits a second time while already on a penalty
+			# ac.console("lap = " + str(lap) + ", speedingOnLap = " + str(speedingOnLap))
+			if not penalty.pitLanePenalty or lap != penalty.speedingOnLap:
+				if speedingInPits:
+					issuePenalty("SPEEDING", lap, SECONDS_PER_SPEEDING_PENALTY)
+					penalty.giveSpeedingPenalty(lap)
+
+
+def restartRace():
+	global sessionEnabled
+
+	# Race has been restarted. Reset everything.
+	resetWarnings()
+	sessionEnabled = resetSession(session)
+	raceStart()
+
+
+# Stops the rest of the rules if cuts aren't detected in this session.
+def checkSessionMode():
+	if not (session == SESSION_HOTLAP or session == SESSION_PRAC or session == SESSION_QUAL or session == SESSION_RACE):
+		ui.setText(warningLabel, "No cuts in this mode")
+		return True
+	return False
+
+
+def checkPitStop():
+	global PitX, PitY, PitZ, wasInPit, lastIsInPitLaneLap, pitStartFuel
+
 	# 1.7, 1.8 Allow for sim_info.graphics.isInPit not always being true if you're not quite in pits.
 
-	if PitX == 0 and sim_info.graphics.isInPit:  # set pit position correctly if not set before
+	if PitX == 0 and frame.isInPit:  # set pit position correctly if not set before
 		PitX, PitY, PitZ = ac.getCarState(0, acsys.CS.WorldPosition)
 		ac.console("PLP: Pit position initialized later at X:" + str(PitX) + " Y:" + str(PitY) + " Z:" + str(PitZ))
 
@@ -820,8 +1055,8 @@ def acUpdate(deltaT):
 		PosX, PosY, PosZ = ac.getCarState(0, acsys.CS.WorldPosition)  # current co-ord position
 		delta = ((PosX - PitX) ** 2 + (PosY - PitY) ** 2 + (
 			PosZ - PitZ) ** 2) ** 0.5  # straight line dist between pitbox and car
-		if sim_info.graphics.isInPitLane and (
-						delta < 4.0 or sim_info.graphics.isInPit):  # if InPit or within 8m of pitbox, quite relaxed limit guarantees app trigger on menu appear
+		if frame.isInPitLane and (
+						delta < 4.0 or frame.isInPit):  # if InPit or within 8m of pitbox, quite relaxed limit guarantees app trigger on menu appear
 			inPits = True
 
 	# if sim_info.graphics.isInPitLane:
@@ -831,151 +1066,159 @@ def acUpdate(deltaT):
 
 	if not inPits and wasInPit:
 		# Pit stop has ended
-		fuelDiff = sim_info.physics.fuel - pitStartFuel
+		fuelDiff = frame.fuel - pitStartFuel
 		ac.console(
-			str(deltaT) + " sim_info.physics.fuel = " + str(sim_info.physics.fuel) + ", fuelDiff = " + str(fuelDiff))
+			str(frameDeltaT) + " frame.fuel = " + str(frame.fuel) + ", fuelDiff = " + str(fuelDiff))
 		if fuelDiff > 0.0:
-			sendChatLog("Added {:.0f} litres".format(fuelDiff))
+			sendChatLog("Added {:.0f} litres".format(fuelDiff), 'FA', value=fuelDiff)
 		wasInPit = False
 
-	if inPits and isInPitLaneLap != lastIsInPitLaneLap:
+	if inPits and penalty.isInPitLaneLap != lastIsInPitLaneLap:
 		# Pit stop has started
 		if TEAM > 0:
-			sendTeamChatMessage(("Car {0} has pitted. GO!" + CHAT_DELIM + "lap {1}").format(TEAM_CAR, isInPitLaneLap))
+			sendTeamChatMessage(("Car {0} has pitted. GO!" + CHAT_DELIM + "lap {1}").format(TEAM_CAR, penalty.isInPitLaneLap),
+								'PT', eventLap=penalty.isInPitLaneLap)
 		else:
-			sendChatLog("Pitted on lap {0}".format(isInPitLaneLap))
-		lastIsInPitLaneLap = isInPitLaneLap
-		pitStartFuel = sim_info.physics.fuel
-		ac.console(str(deltaT) + " pitStartFuel = " + str(pitStartFuel))
+			sendChatLog("Pitted on lap {0}".format(penalty.isInPitLaneLap), 'PT', eventLap=penalty.isInPitLaneLap)
+		lastIsInPitLaneLap = penalty.isInPitLaneLap
+		pitStartFuel = frame.fuel
+		ac.console(str(frameDeltaT) + " pitStartFuel = " + str(pitStartFuel))
 		wasInPit = True
 
+
+def checkNewLap():
+	global lastLap, warningBlinkStopTime
+
 	if lap != lastLap:
 		# Starting a new lap
+		if recorder is not None:
+			# Write the last lap's telemetry (in the background).
+			recorder.flush()
 		# Make sure we don't count down a lap already, on the pitstop where the speeding occurred, when you cross the line
 		# in pits (controlled by isInPitLaneLap).
 		#  or (speedingPenalty and lap > speedingOnLap and isInPitLaneLap > speedingOnLap):
 		if (PENALTY_MODE_CUTTING == PENALTY_MODE_DRIVETHRU or PENALTY_MODE_SPEEDING == PENALTY_MODE_DRIVETHRU) and (
-					not speedingPenalty or speedingPenalty and not sim_info.graphics.isInPitLane):
+					not penalty.speedingPenalty or penalty.speedingPenalty and not frame.isInPitLane):
 			# Reduce the number of laps left to take a penalty.
-			if pitLanePenalty and not takingPenalty:
-				penaltyLapsLeft = penaltyLapsLeft - 1
-				if penaltyLapsLeft == 0:
-					# Start blinking the "this lap" text.
-					startBlinkingStatus()
-				elif penaltyLapsLeft < 0:
-					penaltyLapsLeft = 0
-					sendChatMessage("ignored penalty")
+			if penalty.pitLanePenalty and not penalty.takingPenalty:
+				if not penalty.countDownPenaltyLap():
+					sendChatMessage("ignored penalty", 'IG')
 					# Reset warning counts so that further cuts attract further penalties.
 					resetWarnings()
+				elif penalty.penaltyLapsLeft == 0:
+					# Start blinking the "this lap" text.
+					startBlinkingStatus()
 				setStatusText()
 		lastLap = lap
-		if invalidQualLapWarning:
+		if penalty.invalidQualLapWarning:
 			# Reset any invalid qualifying lap message at the start of a new lap.
-			invalidQualLapWarning = False
+			penalty.clearInvalidQualLap()
 			# Stop the blinking warning (see below).
 			warningBlinkStopTime = 1
 
+
+def checkInvalidQualLap():
+	global warningBlinkStopTime
+
 	# If driver slows down to QUAL_SLOW_DOWN_SPEED or enter the pits, stop the "Invalid Lap" warning.
-	if invalidQualLapWarning and (speed <= QUAL_SLOW_DOWN_SPEED or sim_info.graphics.isInPitLane):
-		invalidQualLapWarning = False
+	if penalty.invalidQualLapWarning and (speed <= QUAL_SLOW_DOWN_SPEED or frame.isInPitLane):
+		penalty.clearInvalidQualLap()
 		# Stop the blinking warning (see below).
 		warningBlinkStopTime = 1
 
-	# Blink the status text.
-	# Blink "This lap" when a penalty is due.
-	# Blink the warning count when on the last warning.
-	if blinkStatus and gameTime > nextStatusBlinkTime:
-		if statusBlinkShowing:
-			clearStatusText()
-		else:
-			setStatusText()
-		statusBlinkShowing = not statusBlinkShowing
-		nextStatusBlinkTime = gameTime + BLINK_INTERVAL  # seconds
-		if 0 < statusBlinkStopTime < gameTime:
-			setStatusText()
-			# Stop blinking
-			stopBlinkingStatus()
 
-	# Blink the warning text.
-	# Blink "DRIVE THROUGH PENALTY"
-	if blinkWarning and gameTime > nextWarningBlinkTime:
-		if warningBlinkShowing:
-			warningText = ac.getText(warningLabel)
-			ac.setText(warningLabel, "")
-		else:
-			ac.setText(warningLabel, warningText)
-		warningBlinkShowing = not warningBlinkShowing
-		nextWarningBlinkTime = gameTime + BLINK_INTERVAL  # seconds
-		if 0 < warningBlinkStopTime < gameTime:
-			ac.setText(warningLabel, "")
-			# Stop blinking
-			stopBlinkingWarning()
+def changeSession():
+	global sessionEnabled, raceSessionDuration, lastSession, journalKey, journalResumed
 
-	if session != lastSession:
-		# Session has changed - reset warnings
-		resetWarnings()
-		sessionEnabled = resetSession(session)
-		if session == SESSION_RACE:
-			raceStart()
+	# Session has changed - reset warnings
+	resetWarnings()
+	sessionEnabled = resetSession(session)
+	if session == SESSION_RACE:
+		raceStart()
 
-			raceSessionDuration = 0
+		raceSessionDuration = 0
 	lastSession = session
 
-	# Clear any warning text after a certain number of seconds.
-	if 0 < eraseWarningTime < gameTime:
-		# If we are just clearing a cut track warning while a pit lane penalty is active,
-		# reset the warning to the DRIVE THROUGH PENALTY warning.
-		if pitLanePenalty:
-			ac.setFontColor(warningLabel, 1, 0, 0, 1)
-			ac.setText(warningLabel, "DRIVE THROUGH PENALTY")
-		else:
-			ac.setText(warningLabel, "")
-			hideBlackWhiteFlag()
-		eraseWarningTime = 0
+	if journal is not None:
+		journalKey = PLPlib.plp_journal.journalKey(ac.getServerName(), ac.getTrackName(0), ac.getTrackConfiguration(0),
+												   ac.getCarName(0), session)
+		if not journalResumed:
+			# 1.28 - The app has just been loaded, e.g. after reconnecting in the middle of a race.
+			journalResumed = True
+			resumePenaltyState()
 
-	# Clear any chat message after a certain number of seconds.
-	if 0 < eraseChatTime < gameTime:
-		sendChatMessage("")
-		eraseChatTime = 0
 
-	# Process pit lane penalties
+# Process pit lane penalties
+def processPenalty():
+	global eraseWarningTime
+
 	if PENALTY_MODE_CUTTING == PENALTY_MODE_DRIVETHRU or PENALTY_MODE_SPEEDING == PENALTY_MODE_DRIVETHRU:
-		if sim_info.graphics.isInPitLane:
+		if frame.isInPitLane:
 			# Check that if a driver has a speeding in pit lane penalty, they take it the *next* lap,
 			# not the lap that they were speeding on.
-			if pitLanePenalty and not penaltyVoid and (
-						not speedingPenalty or speedingPenalty and isInPitLaneLap > speedingOnLap):
+			if penalty.pitLanePenalty and not penalty.penaltyVoid and (
+						not penalty.speedingPenalty or penalty.speedingPenalty and penalty.isInPitLaneLap > penalty.speedingOnLap):
 				# Driver is taking a pit lane penalty.
 				if speed > 0.3:
 					# Car has not stopped
-					ac.setFontColor(warningLabel, 1, 1, 0, 1)
-					ac.setText(warningLabel, "Penalty being taken")
+					ui.setFontColor(warningLabel, 1, 1, 0, 1)
+					ui.setText(warningLabel, "Penalty being taken")
 					eraseWarningTime = 0
-					if not penaltyMessageSent:
+					if penalty.startTakingPenalty():
 						# Only send the chat message once at the start of the penalty
-						sendChatMessage("taking penalty")
-						penaltyMessageSent = True
-					takingPenalty = True
+						sendChatMessage("taking penalty", 'TK')
 				else:
 					# Car has stopped in pit lane, probably because it is taking a normal pit stop.
 					# This voids any pit lane penalty.
-					ac.setFontColor(warningLabel, 1, 0, 0, 1)
-					ac.setText(warningLabel, "DRIVE THROUGH PENALTY")
+					ui.setFontColor(warningLabel, 1, 0, 0, 1)
+					ui.setText(warningLabel, "DRIVE THROUGH PENALTY")
 					eraseWarningTime = 0
-					if not penaltyVoid:
-						sendChatMessage("re-take penalty")
-					takingPenalty = False
-					penaltyVoid = True
-		elif takingPenalty:
+					if penalty.voidPenalty():
+						sendChatMessage("re-take penalty", 'RT')
+		elif penalty.takingPenalty:
 			# Not in pit lane any more.
 			# Pit lane penalty has been taken.
 			resetWarnings()
-			sendChatMessage("taken penalty" + CHAT_DELIM + "on lap {0}".format(lap))
+			sendChatMessage("taken penalty" + CHAT_DELIM + "on lap {0}".format(lap), 'TN')
 			stopBlinkingWarning()
 		else:
 			# Make sure the next pit lane drive through is processed after a voided one.
-			penaltyVoid = False
-			penaltyMessageSent = False
+			penalty.clearVoidPenalty()
+
+
+# The track re-entry speed above which a cut is a fast cut: MAX_SPEED_RATIO_FOR_CUT of the car's max speed, or with
+# SPEED_ENVELOPE, SPEED_ENVELOPE_RATIO_FOR_CUT of the highest speed seen at this point of the lap, once there is one.
+def fastCutSpeed():
+	if speedEnvelope is not None:
+		envelopeSpeed = speedEnvelope.expected(frame.normalizedCarPosition, 0)
+		if envelopeSpeed > 0:
+			return envelopeSpeed * SPEED_ENVELOPE_RATIO_FOR_CUT
+	return maxSpeed * MAX_SPEED_RATIO_FOR_CUT
+
+
+# Where the current cut was, for the chat log.
+def cutZoneText():
+	if cutZone is None:
+		return ""
+	return " at " + cutZone.name
+
+
+# Read the cut zones for this track (run by ioWorker).
+def loadCutZones(path):
+	global cutZones
+
+	cutZones = PLPlib.plp_cut_zones.PLPCutZones.load(path)
+
+
+# The file the cut zones for the current track are kept in.
+def cutZonesPath():
+	return PLPlib.plp_cut_zones.cutZonesPath(CUT_ZONES_FOLDER, ac.getTrackName(0), ac.getTrackConfiguration(0))
+
+
+def checkCuts():
+	global lastCutTime, startCutSpeed, slowestOffTrackSpeed, cutDetected, currentlyCutting, lastIssuedCutTime
+	global warningBlinkStopTime, eraseWarningTime, statusBlinkStopTime
+	global cutZone, cutStartPosition, cutMaxTime, cutMinSlowDownRatio
 
 	# Stop detecting cuts after the race.
 	# 1.9
@@ -983,7 +1226,7 @@ def acUpdate(deltaT):
 	# if session == SESSION_RACE and lap > sim_info.graphics.numberOfLaps:
 	#	ac.setText(warningLabel,"Race over")
 	#	return;
-	if not pitLanePenalty and car_tyres_out > WHEELS_OUT:
+	if not penalty.pitLanePenalty and carTyresOut > WHEELS_OUT:
 		if not cutDetected:
 			if speed > MIN_SPEED and gameTime > lastIssuedCutTime + SECONDS_BETWEEN_CUTS:
 				# This is the start of a potentially cut track that is:
@@ -993,6 +1236,16 @@ def acUpdate(deltaT):
 				startCutSpeed = speed
 				slowestOffTrackSpeed = speed
 				cutDetected = True
+				# 1.28 - Use the thresholds of the cut zone (if any) the cut started in.
+				cutStartPosition = frame.normalizedCarPosition
+				cutZone = cutZones.zoneAt(cutStartPosition) if cutZones is not None else None
+				cutMaxTime = MAX_CUT_TIME
+				cutMinSlowDownRatio = MIN_SLOW_DOWN_RATIO
+				if cutZone is not None:
+					if cutZone.maxCutTime is not None:
+						cutMaxTime = cutZone.maxCutTime
+					if cutZone.minSlowDownRatio is not None:
+						cutMinSlowDownRatio = cutZone.minSlowDownRatio
 				currentlyCutting = CURRENTLY_CUTTING_YES
 		else:
 			# Car is off track during a cut.
@@ -1001,9 +1254,9 @@ def acUpdate(deltaT):
 				slowestOffTrackSpeed = speed
 
 			# The conditions are that no penalty will be given (see cutting check below).
-			if not ((gameTime - lastCutTime <= MAX_CUT_TIME or speed > maxSpeed * MAX_SPEED_RATIO_FOR_CUT) and speed / startCutSpeed > MIN_SLOW_DOWN_RATIO and slowestOffTrackSpeed / startCutSpeed > MIN_SLOW_DOWN_RATIO):
+			if not ((gameTime - lastCutTime <= cutMaxTime or speed > fastCutSpeed()) and speed / startCutSpeed > cutMinSlowDownRatio and slowestOffTrackSpeed / startCutSpeed > cutMinSlowDownRatio):
 				currentlyCutting = CURRENTLY_CUTTING_SAFE
-	elif car_tyres_out == 0:
+	elif carTyresOut == 0:
 		# No cut
 		if cutDetected:
 			# A cut is over
@@ -1011,48 +1264,167 @@ def acUpdate(deltaT):
 			# ac.setText(chatLabel,"{:.0f} {:.0f} {:.0f} {:.2f}".format(startCutSpeed,slowestOffTrackSpeed,speed,slowestOffTrackSpeed/startCutSpeed))
 			if sessionEnabled \
 					and (session != SESSION_RACE or lap > AMNESTY_LAPS) \
-					and (gameTime - lastCutTime <= MAX_CUT_TIME or speed > maxSpeed * MAX_SPEED_RATIO_FOR_CUT) \
-					and speed / startCutSpeed > MIN_SLOW_DOWN_RATIO \
-					and slowestOffTrackSpeed / startCutSpeed > MIN_SLOW_DOWN_RATIO:
+					and (gameTime - lastCutTime <= cutMaxTime or speed > fastCutSpeed()) \
+					and speed / startCutSpeed > cutMinSlowDownRatio \
+					and slowestOffTrackSpeed / startCutSpeed > cutMinSlowDownRatio:
 				# The cut took less than MAX_CUT_TIME seconds, or it was a fast cut, and the end speed was still more than 90% of the start speed.
 				# Only count cut warnings if not race or beyond the number of amnesty laps in a race session.
 				# In addition, if the car slowed to less than 90% of the start speed while off track, don't report a cut.
-				numWarnings += 1
+				penalty.addWarning()
 				lastIssuedCutTime = gameTime
+				if cutZones is not None:
+					cutZones.addCut(cutStartPosition)
 				stopBlinkingStatus()
 				setStatusText()
-				if ENABLE_PENALTIES and session == SESSION_RACE and numWarnings > TOTAL_WARNINGS:
+				if ENABLE_PENALTIES and session == SESSION_RACE and penalty.numWarnings > TOTAL_WARNINGS:
 					if appEnabled:
 						# Too many warnings in a race session - driver receives a penalty.
 						issuePenalty("CUTTING", lap, SECONDS_PER_CUTTING_PENALTY)
 				elif session == SESSION_QUAL:
 					if appEnabled:
 						# A cut during QUALIFYING - warn that the lap should be invalidated.
-						invalidQualLapWarning = True
-						ac.setFontColor(warningLabel, 1, 1, 0, 1)
-						ac.setText(warningLabel, "INVALID LAP, SLOW DOWN")
-						sendChatLog("Cut the track on qual lap")
+						penalty.invalidateQualLap()
+						ui.setFontColor(warningLabel, 1, 1, 0, 1)
+						ui.setText(warningLabel, "INVALID LAP, SLOW DOWN")
+						sendChatLog("Cut the track on qual lap" + cutZoneText(), 'QC')
 						# Blink "forever". Slowing down to QUAL_SLOW_DOWN_SPEED will stop this, or starting the next lap.
 						warningBlinkStopTime = gameTime + 10000  # seconds
 						startBlinkingWarning()
 				else:
 					# Display track cut warning
-					ac.setFontColor(warningLabel, 1, 1, 0, 1)
-					ac.setText(warningLabel, "CUT TRACK WARNING")
+					ui.setFontColor(warningLabel, 1, 1, 0, 1)
+					ui.setText(warningLabel, "CUT TRACK WARNING")
 					eraseWarningTime = gameTime + WARNING_DURATION
 					showBlackWhiteFlag()
-					sendChatLog("Cut the track on lap {0}".format(lap))
-					if numWarnings == TOTAL_WARNINGS:
+					sendChatLog("Cut the track on lap {0}".format(lap) + cutZoneText(), 'CT')
+					if penalty.numWarnings == TOTAL_WARNINGS:
 						# On the final warning. Blink the warning count for 30 seconds.
 						statusBlinkStopTime = gameTime + 30  # seconds
 						startBlinkingStatus()
 		cutDetected = False
 		currentlyCutting = CURRENTLY_CUTTING_NOT
 
+
+# Blink the status and warning text. Runs every frame, whether or not there is a new shared memory packet.
+def updateBlinking():
+	global statusBlinkShowing, nextStatusBlinkTime, warningText, warningBlinkShowing, nextWarningBlinkTime
+
+	# Blink the status text.
+	# Blink "This lap" when a penalty is due.
+	# Blink the warning count when on the last warning.
+	if blinkStatus and gameTime > nextStatusBlinkTime:
+		if statusBlinkShowing:
+			clearStatusText()
+		else:
+			setStatusText()
+		statusBlinkShowing = not statusBlinkShowing
+		nextStatusBlinkTime = gameTime + BLINK_INTERVAL  # seconds
+		if 0 < statusBlinkStopTime < gameTime:
+			setStatusText()
+			# Stop blinking
+			stopBlinkingStatus()
+
+	# Blink the warning text.
+	# Blink "DRIVE THROUGH PENALTY"
+	if blinkWarning and gameTime > nextWarningBlinkTime:
+		if warningBlinkShowing:
+			warningText = ui.getText(warningLabel)
+			ui.setText(warningLabel, "")
+		else:
+			ui.setText(warningLabel, warningText)
+		warningBlinkShowing = not warningBlinkShowing
+		nextWarningBlinkTime = gameTime + BLINK_INTERVAL  # seconds
+		if 0 < warningBlinkStopTime < gameTime:
+			ui.setText(warningLabel, "")
+			# Stop blinking
+			stopBlinkingWarning()
+
+
+# Clear warning and chat messages once they have expired. Runs every frame, whether or not there is a new shared memory packet.
+def updateEraseTimers():
+	global eraseWarningTime, eraseChatTime
+
+	# Clear any warning text after a certain number of seconds.
+	if 0 < eraseWarningTime < gameTime:
+		# If we are just clearing a cut track warning while a pit lane penalty is active,
+		# reset the warning to the DRIVE THROUGH PENALTY warning.
+		if penalty.pitLanePenalty:
+			ui.setFontColor(warningLabel, 1, 0, 0, 1)
+			ui.setText(warningLabel, "DRIVE THROUGH PENALTY")
+		else:
+			ui.setText(warningLabel, "")
+			hideBlackWhiteFlag()
+		eraseWarningTime = 0
+
+	# Clear any chat message after a certain number of seconds.
+	if 0 < eraseChatTime < gameTime:
+		sendChatMessage("", 'CL')
+		eraseChatTime = 0
+
+
+def resetWindowOpacity():
+	global nextOpacityResetTime
+
 	# Reset opacity in case app was moved (but not when we're temporarily showing the title).
 	if INVISIBLE_MODE == 1 and not showWindowTitle:
-		ac.setBackgroundOpacity(appWindow, 0)
-		ac.drawBorder(appWindow, 0)
+		if gameTime >= nextOpacityResetTime:
+			# AC doesn't tell us when it changes the opacity, so re-apply it every so often.
+			ui.invalidate(appWindow)
+			nextOpacityResetTime = gameTime + OPACITY_RESET_INTERVAL
+		ui.setBackgroundOpacity(appWindow, 0)
+		ui.drawBorder(appWindow, 0)
+
+
+# Carry on with the warnings and penalties journaled for this session, if there are any.
+def resumePenaltyState():
+	global lastIsInPitLaneLap
+
+	state = journal.resume(journalKey, lap, JOURNAL_RESUME_SECONDS,
+						   PLPlib.plp_journal.sessionEndTime(frame.sessionTimeLeft))
+	if state is None:
+		return
+	penalty.restore(state.snapshot())
+	# Don't report the pit stop already reported before the app was reloaded.
+	lastIsInPitLaneLap = penalty.isInPitLaneLap
+	ac.log("PLP: resumed {0}".format(penalty))
+	if penalty.pitLanePenalty and penalty.penaltyLapsLeft == 0:
+		startBlinkingStatus()
+	setStatusText()
+
+
+# Journal the penalty state if it has changed.
+def journalPenaltyState():
+	global journaledChanges
+
+	if journal is not None and journalKey is not None and penalty.changes != journaledChanges:
+		journaledChanges = penalty.changes
+		journal.append(journalKey, lap, penalty, PLPlib.plp_journal.sessionEndTime(frame.sessionTimeLeft))
+
+
+# Send the queued chat messages that AC's chat throttling allows.
+def sendQueuedChat():
+	if chatQueue is not None:
+		chatQueue.pump(gameTime)
+
+
+# acUpdate's rules, in the order they run, and the events each one runs on. A rule has to run on every frame where
+# it could do something, so rules that count time or keep state up to date run on every frame.
+rules.register("pit lane entry", EVENT_IN_PIT_LANE | EVENT_PIT_LANE_CHANGED, checkPitLaneEntry)
+rules.register("start lights", EVENT_IN_RACE, updateStartLights)
+rules.register("jump start", EVENT_IN_RACE, checkJumpStart)
+rules.register("race timer", EVENT_IN_RACE | EVENT_SESSION_CHANGED, updateRaceTimer)
+rules.register("speeding", EVENT_IN_PIT_LANE | EVENT_PIT_LANE_CHANGED, checkSpeeding)
+rules.register("session restart", EVENT_SESSION_RESTARTED, restartRace)
+rules.register("session mode", EVENT_EVERY_FRAME, checkSessionMode)
+rules.register("pit stop", EVENT_IN_PIT_LANE | EVENT_PIT_LANE_CHANGED | EVENT_IN_PIT, checkPitStop)
+rules.register("new lap", EVENT_LAP_CHANGED | EVENT_SESSION_RESTARTED, checkNewLap)
+rules.register("invalid qual lap", EVENT_SLOW | EVENT_IN_PIT_LANE, checkInvalidQualLap)
+rules.register("blinking", EVENT_EVERY_FRAME, updateBlinking)
+rules.register("session change", EVENT_SESSION_CHANGED, changeSession)
+rules.register("erase timers", EVENT_EVERY_FRAME, updateEraseTimers)
+rules.register("penalty processing", EVENT_IN_PIT_LANE | EVENT_PIT_LANE_CHANGED, processPenalty)
+rules.register("cut detection", EVENT_TYRES_OUT | EVENT_TYRES_OUT_CHANGED, checkCuts)
+rules.register("window opacity", EVENT_EVERY_FRAME, resetWindowOpacity)
 
 
 def showBlackWhiteFlag():
@@ -1061,7 +1433,7 @@ def showBlackWhiteFlag():
 
 def hideBlackWhiteFlag():
 	if flagImageBW != 0:
-		ac.setVisible(flagImageBW, 0)
+		ui.setVisible(flagImageBW, 0)
 
 
 def showBlackFlag():
@@ -1078,36 +1450,37 @@ def showFlag(flagID):
 		if startLightsShown and FLAG_POS == "right":
 			# If the flags are on the right, put them under the PLP start lights if shown.
 			offset = LIGHT_HEIGHT + LIGHT_MARGIN
-		ac.setPosition(flagID, flagX - windowX, flagY - windowY + offset)
-		ac.setVisible(flagID, 1)
+		ui.setPosition(flagID, flagX - windowX, flagY - windowY + offset)
+		ui.setVisible(flagID, 1)
 
 
 def hideBlackFlag():
 	if flagImageB != 0:
-		ac.setVisible(flagImageB, 0)
+		ui.setVisible(flagImageB, 0)
 
 
 def issuePenalty(reason, lap, seconds):
-	global warningBlinkStopTime, pitLanePenalty, penaltyLapsLeft, numWarnings, eraseWarningTime, gameTime
+	global warningBlinkStopTime, eraseWarningTime, gameTime
 
-	ac.setFontColor(warningLabel, 1, 0, 0, 1)
+	ui.setFontColor(warningLabel, 1, 0, 0, 1)
 	if reason == "CUTTING" and PENALTY_MODE_CUTTING == PENALTY_MODE_DRIVETHRU \
 		or reason == "SPEEDING" and PENALTY_MODE_SPEEDING == PENALTY_MODE_DRIVETHRU:
 		# Blink "forever", or until penalty is taken.
 		warningBlinkStopTime = gameTime + 10000  # seconds
-		ac.setText(warningLabel, "DRIVE THROUGH PENALTY")
+		ui.setText(warningLabel, "DRIVE THROUGH PENALTY")
 		showBlackFlag()
-		sendChatLog(("DRIVE THROUGH PENALTY FOR {0}" + CHAT_DELIM + "on lap {1}").format(reason, lap))
-		pitLanePenalty = True
-		penaltyLapsLeft = LAPS_TO_TAKE_PENALTY
+		sendChatLog(("DRIVE THROUGH PENALTY FOR {0}" + CHAT_DELIM + "on lap {1}").format(reason, lap),
+					PLPlib.plp_protocol.penaltyEvent(True, reason), eventLap=lap)
+		penalty.givePitLanePenalty(LAPS_TO_TAKE_PENALTY)
 	else:
-		ac.setText(warningLabel, "{0} SECOND PENALTY".format(seconds))
+		ui.setText(warningLabel, "{0} SECOND PENALTY".format(seconds))
 		warningBlinkStopTime = gameTime + 30  # seconds
 		sendChatLog(
-			("GIVEN A {0} SECOND TIME PENALTY FOR {1}" + CHAT_DELIM + "on lap {2}").format(seconds, reason, lap))
+			("GIVEN A {0} SECOND TIME PENALTY FOR {1}" + CHAT_DELIM + "on lap {2}").format(seconds, reason, lap),
+			PLPlib.plp_protocol.penaltyEvent(False, reason), eventLap=lap, value=seconds)
 		if reason == "CUTTING":
 			# Reset the warning count
-			numWarnings = 0
+			penalty.clearWarnings()
 	eraseWarningTime = 0
 	stopBlinkingStatus()
 	setStatusText()
@@ -1152,69 +1525,95 @@ def stopBlinkingWarning():
 	nextWarningBlinkTime = 0
 
 
+# Add the record of event (see PLPlib/plp_protocol.py) to a chat message, if STRUCTURED_CHAT is set. The event is on
+# this lap unless eventLap is given.
+def chatRecord(message, event, eventLap, value):
+	if not STRUCTURED_CHAT:
+		return message
+	sessionTimeLeft = sim_info.graphics.sessionTimeLeft
+	seconds = -1 if math.isinf(sessionTimeLeft) or sessionTimeLeft < 0 else sessionTimeLeft / 1000
+	return PLPlib.plp_protocol.encode(message, event, lap if eventLap is None else eventLap, seconds,
+									  sim_info.graphics.session, value)
+
+
+# Send a chat message for event, through chatQueue if there is one. A queued version dump replaces one that hasn't
+# been sent yet.
+def postChat(message, event, key=None):
+	if chatQueue is None:
+		ac.sendChatMessage(message)
+		return
+	if key is None and event == 'VR':
+		key = event
+	chatQueue.post(message, PLPlib.plp_chat_queue.EVENT_PRIORITIES.get(event, PLPlib.plp_chat_queue.PRIORITY_INFO),
+				   gameTime, key)
+
+
 # Prefix chat messages sent through the app so that we only display PLP chat messages and no others.
-def sendChatMessage(message):
+def sendChatMessage(message, event, eventLap=None, value=0):
 	global eraseChatTime
 	if not appEnabled:
 		return
-	ac.sendChatMessage(PLP_CHAT + message + CHAT_DELIM + playerName)
+	key = None
+	if not message:
+		key = CLEAR_CHAT_KEY
+	elif chatQueue is not None:
+		# This message replaces the chat line anyway.
+		chatQueue.cancel(CLEAR_CHAT_KEY)
+	postChat(chatRecord(PLP_CHAT + message + CHAT_DELIM + playerName, event, eventLap, value), event, key)
 	eraseChatTime = gameTime + CHAT_DURATION
 
 
 # Send a chat message visible only to your team
-def sendTeamChatMessage(message):
+def sendTeamChatMessage(message, event, eventLap=None, value=0):
 	global eraseChatTime
 	if not appEnabled:
 		return
-	ac.sendChatMessage(PLP_TEAM_CHAT + str(TEAM) + ": " + message)
+	postChat(chatRecord(PLP_TEAM_CHAT + str(TEAM) + ": " + message, event, eventLap, value), event)
 	eraseChatTime = gameTime + CHAT_DURATION
 
 
 # Write a chat message to the log only, not to the app.
-def sendChatLog(message):
+def sendChatLog(message, event, eventLap=None, value=0):
 	if not appEnabled:
 		return
-	ac.sendChatMessage(PLP_LOG + message + CHAT_DELIM + playerName)
+	postChat(chatRecord(PLP_LOG + message + CHAT_DELIM + playerName, event, eventLap, value), event)
+
+
+# Write the acUpdate stage timings to py_log.txt.
+def logStageProbes():
+	if stageProbes is None:
+		return
+	ac.log("PLP: acUpdate stage timings")
+	for line in stageProbes.report():
+		ac.log("PLP:   " + line)
 
 
 # Chat message handler
 def onChatMessage(message, author):
-	teamMessage = False
-
-	if message.find(PLP_CHAT) == 0 or message.find(PLP_TEAM_CHAT) == 0:
-		# Only display PLP chat or team chat prefixed messages
-		# Remove the PLP marker
-		strippedMessage = message.replace(PLP_CHAT, "", 1)
-		strippedMessage = strippedMessage.replace(PLP_TEAM_CHAT, "", 1)
-
-		# See if this is a team message for this team
-		matchObj = re.match('(\d+): (.+)', strippedMessage, re.M | re.I)
-		if matchObj:
-			# This is a team message
-			msgTeam = matchObj.group(1)
-			if int(msgTeam) != TEAM:
-				# Not for this team.
-				return
-			teamMessage = True
-			strippedMessage = matchObj.group(2)
-			# Check which team car this message came from
-			matchObj = re.match('Car (\d+) .*', strippedMessage, re.M | re.I)
-			fromCar = 0
-			if matchObj:
-				fromCar = int(matchObj.group(1))
-			if fromCar == TEAM_CAR:
-				# This message came from this car itself, so don't show it.
-				return
-
-		# Only display up to the delimiter.
-		# This allows extra information to go into the log but not be displayed in the app.
-		delimPos = strippedMessage.find(CHAT_DELIM)
-		if delimPos >= 0:
-			strippedMessage = strippedMessage[:delimPos]
+	if message == PROFILE_CHAT_COMMAND and author == playerName:
+		logStageProbes()
+		return
+
+	# Only display PLP chat or team chat prefixed messages, without the PLP marker, and only up to the delimiter.
+	# This allows extra information to go into the log but not be displayed in the app.
+	parsed = chatParser.parse(message)
+	if parsed is None:
+		return
+	msgTeam, fromCar, strippedMessage = parsed
+
+	if msgTeam is not None:
+		# This is a team message
+		if int(msgTeam) != TEAM:
+			# Not for this team.
+			return
+		# Check which team car this message came from
+		if (int(fromCar) if fromCar else 0) == TEAM_CAR:
+			# This message came from this car itself, so don't show it.
+			return
+	elif len(strippedMessage) > 0:
 		# Add the sender if there is some message text
-		if len(strippedMessage) > 0 and not teamMessage:
-			strippedMessage = author + " " + strippedMessage
-		ac.setText(chatLabel, strippedMessage)
+		strippedMessage = author + " " + strippedMessage
+	ui.setText(chatLabel, strippedMessage)
 
 
 def onAppActivated(deltaT):
@@ -1230,45 +1629,38 @@ def onAppActivated(deltaT):
 
 
 def onAppDismissed(deltaT):
-	sendChatLog("app dismissed")
+	sendChatLog("app dismissed", 'AD')
 
 
 # Display the warning status in a race session.
 def setStatusText():
 	if session == SESSION_RACE:
 		if ENABLE_PENALTIES:
-			if pitLanePenalty:
+			if penalty.pitLanePenalty:
 				# Show how many laps left to take the penalty.
-				if penaltyLapsLeft > 1:
-					ac.setText(statusLabel, "{0} laps left".format(penaltyLapsLeft))
-				elif penaltyLapsLeft == 1:
-					ac.setText(statusLabel, "{0} lap left".format(penaltyLapsLeft))
+				if penalty.penaltyLapsLeft > 1:
+					ui.setText(statusLabel, "{0} laps left".format(penalty.penaltyLapsLeft))
+				elif penalty.penaltyLapsLeft == 1:
+					ui.setText(statusLabel, "{0} lap left".format(penalty.penaltyLapsLeft))
 				else:
-					ac.setText(statusLabel, "THIS LAP")
+					ui.setText(statusLabel, "THIS LAP")
 			else:
-				ac.setText(statusLabel, "Warnings: {0}/{1}".format(numWarnings, TOTAL_WARNINGS))
+				ui.setText(statusLabel, "Warnings: {0}/{1}".format(penalty.numWarnings, TOTAL_WARNINGS))
 		else:
-			ac.setText(statusLabel, "Warnings: {0}".format(numWarnings))
+			ui.setText(statusLabel, "Warnings: {0}".format(penalty.numWarnings))
 
 
 def clearStatusText():
-	ac.setText(statusLabel, "")
+	ui.setText(statusLabel, "")
 
 
 # Reset everything after a penalty is taken or on session change.
 def resetWarnings():
-	global takingPenalty, pitLanePenalty, penaltyVoid, numWarnings, penaltyMessageSent, penaltyLapsLeft, blinkStatus, statusBlinkShowing, nextStatusBlinkTime, invalidQualLapWarning, speedingPenalty
+	global blinkStatus, statusBlinkShowing, nextStatusBlinkTime
 	global warningLabel
 
-	takingPenalty = False
-	invalidQualLapWarning = False
-	pitLanePenalty = False
-	speedingPenalty = False
-	penaltyVoid = False
-	penaltyMessageSent = False
-	numWarnings = 0
-	penaltyLapsLeft = 0
-	ac.setText(warningLabel, "")
+	penalty.resetWarnings()
+	ui.setText(warningLabel, "")
 	blinkStatus = False
 	statusBlinkShowing = True
 	nextStatusBlinkTime = 0
@@ -1280,17 +1672,16 @@ def resetWarnings():
 # Reset things when the session changes (or is restarted)
 # Returns True or False if cuts are enabled in the current session or not.
 def resetSession(l_session):
-	global lastLap, lastIsInPitLane, lastIsInPitLaneLap, wasInPit, isInPitLaneLap, speedingOnLap, startLightsTempShown, raceTimerVisible, raceTimerRemoved
+	global lastLap, lastIsInPitLane, lastIsInPitLaneLap, wasInPit, startLightsTempShown, raceTimerVisible, raceTimerRemoved
 
 	lastLap = 0
 	lastIsInPitLane = False
 	lastIsInPitLaneLap = 0
 	wasInPit = False
-	isInPitLaneLap = 0
-	speedingOnLap = 0
+	penalty.resetSession()
 	raceTimerVisible = False
 	raceTimerRemoved = False
-	ac.setText(timerLabel, "")
+	ui.setText(timerLabel, "")
 
 	# Don't hide the lights when they are temporarily displayed when the app is activated.
 	if USE_START_LIGHTS and not startLightsTempShown:
@@ -1300,7 +1691,7 @@ def resetSession(l_session):
 
 
 def raceStart():
-	global raceSessionDuration, startLightsOff, startLightColour, jumpStartDetected, startLightStartTime, startLightsInited, startLightStep
+	global raceSessionDuration, startLightsOff, startLightColour, jumpStartDetected, startLightStartTime, startLightsInited
 
 	raceSessionDuration = 0
 	startLightsOff = False
@@ -1308,7 +1699,7 @@ def raceStart():
 	jumpStartDetected = False
 	startLightStartTime = DEFAULT_START_LIGHTS_START_TIME
 	startLightsInited = False
-	startLightStep = StartLightStep.off
+	startLightSequencer.reset()
 
 
 # Returns true if the app should be enabled today, based on the comma separated list of valid days in enabledDays.
@@ -1373,130 +1764,172 @@ def isEnabledSession(l_session):
 	return False
 
 
+# Work out the paths of the images in IMG_FOLDER, so they aren't rebuilt every time they're shown.
+def resolveTextures():
+	global lightTextures, blackWhiteFlagTexture, blackFlagTexture
+
+	imageFolder = "apps/python/PitLanePenalty" + IMG_FOLDER + "/"
+	lightTextures = dict((colour, imageFolder + "Light" + colour + ".png") for colour in LIGHT_COLOURS)
+	blackWhiteFlagTexture = imageFolder + "BlackWhiteFlag.png"
+	blackFlagTexture = imageFolder + "BlackFlag.png"
+
+
 # Read settings from PLP.ini.
 def readConfig():
 	global CFG_NAME, IMG_FOLDER, WHEELS_OUT, MIN_SPEED, WARNING_DURATION, CHAT_DURATION, TOTAL_WARNINGS, ENABLE_PENALTIES, LAPS_TO_TAKE_PENALTY, MAX_CUT_TIME, MIN_SLOW_DOWN_RATIO, MAX_SPEED_RATIO_FOR_CUT, INVISIBLE_MODE
 	global QUAL_SLOW_DOWN_SPEED, PENALTY_MODE_CUTTING, PENALTY_MODE_SPEEDING, SECONDS_PER_CUTTING_PENALTY, SECONDS_PER_SPEEDING_PENALTY, ENABLE_SPEEDING_PENALTIES, PIT_LANE_SPEED, SECONDS_BETWEEN_CUTS
-	global maxSpeed
+	global maxSpeed, speedStore, speedEnvelope
 	global TEAM, TEAM_CAR
-	global USE_START_LIGHTS, JUMP_START_PENALTY_SECONDS, USE_FLAG_IMAGES, FLAG_POS, ENABLED_DAYS, AMNESTY_LAPS, raceCountupTimerEnabled, SHOW_CUTS_IN_SESSIONS, ENABLED_SERVER_FILTER
-	global CUT_INDICATOR_SIZE
-
-	# If the server name ends with P6, set TOTAL_WARNINGS to 6.
-	# Otherwise, use the value in the PLP.ini file.
-	totalWarningsServer = False
-	serverName = ac.getServerName().upper()
-	m = re.search(".*P([0-9]+)$", serverName)
-	if m:
-		TOTAL_WARNINGS = int(m.group(1))
-		totalWarningsServer = True
+	global USE_START_LIGHTS, JUMP_START_PENALTY_SECONDS, USE_FLAG_IMAGES, FLAG_POS, ENABLED_DAYS, ENABLE_RACE_COUNTUP_TIMER_DAYS, AMNESTY_LAPS, raceCountupTimerEnabled, SHOW_CUTS_IN_SESSIONS, ENABLED_SERVER_FILTER
+	global CUT_INDICATOR_SIZE, PACKET_GATED_UPDATE, RECORD_TELEMETRY, PROFILE_STAGES, JOURNAL_PENALTIES, SPEED_ENVELOPE
+	global SPEED_ENVELOPE_RATIO_FOR_CUT
+	global STRUCTURED_CHAT, CHAT_MESSAGES_PER_SECOND, CHAT_BURST
+	global configSettings
 
 	try:
-		# See if we have a config file for today. If it exists, use that file.
+		# The config for today: PLP.ini, overridden by today's PLP-<Day>.ini if a league folder has one, overridden by
+		# the server name (if it ends with P6, TOTAL_WARNINGS is 6). Cached until one of the files changes.
 		today = datetime.datetime.today().weekday()
 		daySuffix = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'][today]
-		configFolder = "apps/python/PitLanePenalty/config/"
-		configPath = ''
-
-		for folder in os.listdir(configFolder):
-			path = configFolder + folder + "/PLP-" + daySuffix + ".ini"
+		config = PLPlib.plp_config.loadConfig(CONFIG_FOLDER, daySuffix, ac.getServerName(), CONFIG_CACHE_PATH,
+											  worker=ioWorker)
+		if config.ignored:
+			ac.log("PLP: using {0}, not {1}".format(config.sources[-1], ", ".join(config.ignored)))
 
-			if os.path.isfile(path):
-				configPath = path
+		settings = configSettings = config.settings
 
-		if not configPath:
-			configPath = configFolder + "PLP.ini"
+		# General settings.
+		CFG_NAME = settings.CFG_NAME
+		IMG_FOLDER = settings.IMG_FOLDER
+		WHEELS_OUT = settings.WHEELS_OUT
+		MIN_SPEED = settings.MIN_SPEED
+		WARNING_DURATION = settings.WARNING_DURATION
+		CHAT_DURATION = settings.CHAT_DURATION
+		TOTAL_WARNINGS = settings.TOTAL_WARNINGS
+		ENABLE_PENALTIES = settings.ENABLE_PENALTIES
+		LAPS_TO_TAKE_PENALTY = settings.LAPS_TO_TAKE_PENALTY
+		CUT_INDICATOR_SIZE = settings.CUT_INDICATOR_SIZE
+		INVISIBLE_MODE = settings.INVISIBLE_MODE
+		PENALTY_MODE_CUTTING = settings.PENALTY_MODE_CUTTING
+		PENALTY_MODE_SPEEDING = settings.PENALTY_MODE_SPEEDING
+		ENABLE_SPEEDING_PENALTIES = settings.ENABLE_SPEEDING_PENALTIES
+		PIT_LANE_SPEED = settings.PIT_LANE_SPEED
+		SECONDS_BETWEEN_CUTS = settings.SECONDS_BETWEEN_CUTS
+		USE_START_LIGHTS = settings.USE_START_LIGHTS
+		USE_FLAG_IMAGES = settings.USE_FLAG_IMAGES
+		FLAG_POS = settings.FLAG_POS
+		JUMP_START_PENALTY_SECONDS = settings.JUMP_START_PENALTY_SECONDS
+		ENABLED_DAYS = settings.ENABLED_DAYS
+		ENABLE_RACE_COUNTUP_TIMER_DAYS = settings.ENABLE_RACE_COUNTUP_TIMER_DAYS
+		AMNESTY_LAPS = settings.AMNESTY_LAPS
+		SHOW_CUTS_IN_SESSIONS = settings.SHOW_CUTS_IN_SESSIONS
+		ENABLED_SERVER_FILTER = settings.ENABLED_SERVER_FILTER
 
-		Config = configparser.ConfigParser()
-		Config.read(configPath)
+		# Team settings.
+		TEAM = settings.TEAM
+		TEAM_CAR = settings.TEAM_CAR
 
-		# General settings.
-		CFG_NAME = Config.get('General', 'CFG_NAME')
-		IMG_FOLDER = Config.get('General', 'IMG_FOLDER')
-		WHEELS_OUT = Config.getint('General', 'WHEELS_OUT')
-		MIN_SPEED = Config.getint('General', 'MIN_SPEED')
-		WARNING_DURATION = Config.getint('General', 'WARNING_DURATION')
-		CHAT_DURATION = Config.getint('General', 'CHAT_DURATION')
-		if not totalWarningsServer: TOTAL_WARNINGS = Config.getint('General', 'TOTAL_WARNINGS')
-		ENABLE_PENALTIES = Config.getboolean('General', 'ENABLE_PENALTIES')
-		LAPS_TO_TAKE_PENALTY = Config.getint('General', 'LAPS_TO_TAKE_PENALTY')
-		CUT_INDICATOR_SIZE = Config.getint('General', 'CUT_INDICATOR_SIZE')
-		INVISIBLE_MODE = Config.getint('General', 'INVISIBLE_MODE')
-		PENALTY_MODE_CUTTING = Config.getint('General', 'PENALTY_MODE_CUTTING')
-		PENALTY_MODE_SPEEDING = Config.getint('General', 'PENALTY_MODE_SPEEDING')
-		ENABLE_SPEEDING_PENALTIES = Config.getboolean('General', 'ENABLE_SPEEDING_PENALTIES')
-		PIT_LANE_SPEED = Config.getint('General', 'PIT_LANE_SPEED')
-		SECONDS_BETWEEN_CUTS = Config.getint('General', 'SECONDS_BETWEEN_CUTS')
-		USE_START_LIGHTS = Config.getboolean('General', 'USE_START_LIGHTS')
-		USE_FLAG_IMAGES = Config.getboolean('General', 'USE_FLAG_IMAGES')
-		FLAG_POS = Config.get('General', 'FLAG_POS')
-		JUMP_START_PENALTY_SECONDS = Config.getint('General', 'JUMP_START_PENALTY_SECONDS')
-		ENABLED_DAYS = Config.get('General', 'ENABLED_DAYS')
-		AMNESTY_LAPS = Config.getint('General', 'AMNESTY_LAPS')
-		SHOW_CUTS_IN_SESSIONS = Config.get('General', 'SHOW_CUTS_IN_SESSIONS')
-		ENABLED_SERVER_FILTER = Config.get('General', 'ENABLED_SERVER_FILTER')
-
-		ENABLE_RACE_COUNTUP_TIMER_DAYS = Config.get('General', 'ENABLE_RACE_COUNTUP_TIMER_DAYS')
-		# If setting is not present, disable it on all days.
-		if not ENABLE_RACE_COUNTUP_TIMER_DAYS:
-			ENABLE_RACE_COUNTUP_TIMER_DAYS = "Disabled"
-		raceCountupTimerEnabled = isEnabledDay(ENABLE_RACE_COUNTUP_TIMER_DAYS)
+		# FineTuning settings.
+		MAX_CUT_TIME = settings.MAX_CUT_TIME
+		MIN_SLOW_DOWN_RATIO = settings.MIN_SLOW_DOWN_RATIO
+		MAX_SPEED_RATIO_FOR_CUT = settings.MAX_SPEED_RATIO_FOR_CUT
+		QUAL_SLOW_DOWN_SPEED = settings.QUAL_SLOW_DOWN_SPEED
+		SECONDS_PER_CUTTING_PENALTY = settings.SECONDS_PER_CUTTING_PENALTY
+		SECONDS_PER_SPEEDING_PENALTY = settings.SECONDS_PER_SPEEDING_PENALTY
+		PACKET_GATED_UPDATE = settings.PACKET_GATED_UPDATE
+		RECORD_TELEMETRY = settings.RECORD_TELEMETRY
+		PROFILE_STAGES = settings.PROFILE_STAGES
+		JOURNAL_PENALTIES = settings.JOURNAL_PENALTIES
+		SPEED_ENVELOPE = settings.SPEED_ENVELOPE
+		SPEED_ENVELOPE_RATIO_FOR_CUT = settings.SPEED_ENVELOPE_RATIO_FOR_CUT
+		STRUCTURED_CHAT = settings.STRUCTURED_CHAT
+		CHAT_MESSAGES_PER_SECOND = settings.CHAT_MESSAGES_PER_SECOND
+		CHAT_BURST = settings.CHAT_BURST
+
+		# If setting is blank, disable it on all days.
+		raceCountupTimerEnabled = isEnabledDay(ENABLE_RACE_COUNTUP_TIMER_DAYS or "Disabled")
 
 		# Disable some settings on days and servers when the app is disabled
 		if not isEnabled(ENABLED_DAYS, ENABLED_SERVER_FILTER):
 			USE_START_LIGHTS = False
 			ENABLE_SPEEDING_PENALTIES = False
 
-		# Team settings.
-		TEAM = Config.getint('Teams', 'TEAM')
-		TEAM_CAR = Config.getint('Teams', 'TEAM_CAR')
-
-		# FineTuning settings.
-		MAX_CUT_TIME = Config.getfloat('FineTuning', 'MAX_CUT_TIME')
-		MIN_SLOW_DOWN_RATIO = Config.getfloat('FineTuning', 'MIN_SLOW_DOWN_RATIO')
-		MAX_SPEED_RATIO_FOR_CUT = Config.getfloat('FineTuning', 'MAX_SPEED_RATIO_FOR_CUT')
-		QUAL_SLOW_DOWN_SPEED = Config.getfloat('FineTuning', 'QUAL_SLOW_DOWN_SPEED')
-		SECONDS_PER_CUTTING_PENALTY = Config.getint('FineTuning', 'SECONDS_PER_CUTTING_PENALTY')
-		SECONDS_PER_SPEEDING_PENALTY = Config.getint('FineTuning', 'SECONDS_PER_SPEEDING_PENALTY')
-
+	except PLPlib.plp_config.PLPConfigError as error:
+		ac.log("PLP: {0}".format(error))
+		return False
 	except:
 		ac.log(traceback.format_exc())
 		return False
 
 	# Read the recorded max speed for this car/track combo.
 	try:
-		Config.read("apps/python/PitLanePenalty/speed.ini")
-		maxSpeed = Config.getfloat('MaxSpeed', ac.getCarName(0) + ac.getTrackName(0) + ac.getTrackConfiguration(0))
+		speedStore = PLPlib.plp_speed_store.PLPSpeedStore(SPEED_STORE_PATH, SPEED_CONFIG_PATH, worker=ioWorker)
+		if speedStore.migrated:
+			ac.log("PLP: migrated {0} max speeds from {1}".format(speedStore.migrated, SPEED_CONFIG_PATH))
+		maxSpeed = speedStore.get(ac.getCarName(0), ac.getTrackName(0), ac.getTrackConfiguration(0))
 	except:
-		# File or speed doesn't exist yet.
+		ac.log(traceback.format_exc())
 		maxSpeed = 0
 
+	# Read the speeds at each point of the lap for this car/track combo.
+	speedEnvelope = None
+	if SPEED_ENVELOPE:
+		try:
+			speedEnvelope = PLPlib.plp_speed_envelope.PLPSpeedEnvelope.load(envelopePath(), ac.getCarName(0),
+																			 ac.getTrackName(0), ac.getTrackConfiguration(0))
+		except:
+			ac.log(traceback.format_exc())
+			speedEnvelope = PLPlib.plp_speed_envelope.PLPSpeedEnvelope()
+
 	return True
 
 
 def acShutdown(*args):
-	writeSpeedConfig()
-
-
-# Write a new max speed to speed.ini for the current car/track.
-def writeSpeedConfig():
-	global maxSpeed
-
-	Config = configparser.ConfigParser()
-	try:
-		Config.read("apps/python/PitLanePenalty/speed.ini")
-	except:
-		# Do nothing - file will be created.
-		ac.log("Pit Lane Penalty: creating speed.ini")
-
-	section = 'MaxSpeed'
-	# Add the section if it doesn't exist yet.
-	if section not in Config.sections():
-		Config.add_section(section)
-
-	Config.set(section, ac.getCarName(0) + ac.getTrackName(0) + ac.getTrackConfiguration(0), "{:.1f}".format(maxSpeed))
-	with open('apps/python/PitLanePenalty/speed.ini', 'w+') as configfile:
-		Config.write(configfile)
+	if chatQueue is not None:
+		chatQueue.flush(gameTime)
+	saveMaxSpeed()
+	if cutZones is not None and cutZones.changed:
+		ioWorker.submit(PLPlib.plp_cut_zones.saveCounts, cutZonesPath(), cutZones.countsSnapshot())
+	if recorder is not None:
+		recorder.close()
+	if journal is not None:
+		journal.close()
+	if not ioWorker.close(IO_SHUTDOWN_TIMEOUT):
+		ac.log("PLP: gave up waiting for {0} file writes".format(ioWorker.pending()))
+	if ioWorker.failed:
+		ac.log("PLP: {0} file writes failed, the last with:\n{1}".format(ioWorker.failed, ioWorker.lastError))
+	ac.log("PLP: {0} frames processed, {1} frames skipped with no new shared memory packet".format(processedFrames, skippedFrames))
+	ac.log("PLP: {0} shared memory page reads, {1} retried, {2} torn".format(sim_info.page_reads, sim_info.read_retries, sim_info.torn_reads))
+	PLPlib.plp_sim_info.release()
+	if recorder is not None:
+		ac.log("PLP: recorded {0} frames to {1} ({2} bytes)".format(recorder.records, recorder.path, recorder.bytesWritten))
+	if journal is not None:
+		ac.log("PLP: journaled {0} penalty state changes in {1} syncs".format(journal.appended, journal.syncs))
+	ac.log("PLP: {0} UI calls made, {1} skipped because nothing changed".format(ui.applied, ui.suppressed))
+	ac.log("PLP: {0} rule calls made, {1} skipped".format(rules.calls, rules.skipped()))
+	ac.log("PLP: {0} file writes queued, {1} merged into a later write, {2} dropped".format(
+		ioWorker.submitted, ioWorker.coalesced, ioWorker.dropped))
+	if chatQueue is not None:
+		ac.log("PLP: {0} chat messages sent, {1} merged into a later message, {2} cancelled, {3} dropped; waited {4:.2f}s on "
+			   "average, {5:.2f}s at most".format(chatQueue.sent, chatQueue.coalesced, chatQueue.cancelled,
+												 chatQueue.dropped, chatQueue.averageLatency(), chatQueue.maxLatency))
+	logStageProbes()
+
+
+# Save the max speed for the current car/track (written in the background).
+def saveMaxSpeed():
+	if speedStore is not None:
+		speedStore.put(ac.getCarName(0), ac.getTrackName(0), ac.getTrackConfiguration(0), maxSpeed)
+	if speedEnvelope is not None and speedEnvelope.changed:
+		path = envelopePath()
+		ioWorker.submit(PLPlib.plp_io.writeFileAtomic, path,
+						speedEnvelope.toBytes(ac.getCarName(0), ac.getTrackName(0), ac.getTrackConfiguration(0)), key=path)
+
+
+# The file the speed envelope for the current car/track is saved in.
+def envelopePath():
+	return PLPlib.plp_speed_envelope.envelopePath(ENVELOPE_FOLDER, ac.getCarName(0), ac.getTrackName(0),
+												  ac.getTrackConfiguration(0))
 
 
 # Return a random number between [0 and range) which is the same for each player.